@@ -0,0 +1,158 @@
+'''
+标刻线段的曝光分析：把所有标刻线段栅格化到一个正方形网格上，
+每格的曝光量是激光在格内停留的时间除以格子的面积，用于发现重复标刻造成的过烧。
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tools import DEFAULT_HEADER, MARK, UNIT_SCALE, Toolpath
+
+
+# 每块最多的采样点数，限制临时数组的大小
+CHUNK_SAMPLES = 1 << 22
+# 采样点数超过这一数量时才值得分到多个进程中计算
+PARALLEL_SAMPLES = 1 << 24
+# 曝光量超过有曝光的格子的中位数的这一倍数时视为热点
+HOTSPOT_RATIO = 2.0
+
+
+def sample_counts(length: np.ndarray, cell_size: float) -> np.ndarray:
+    '''
+    每条线段的采样点数，使相邻采样点的间距不超过半格。
+    '''
+    return np.maximum(np.ceil(length / (cell_size / 2)), 1).astype(np.int64)
+
+
+def rasterize(x0, y0, x1, y1, bounds: tuple, cells: int) -> np.ndarray:
+    '''
+    返回形状为(cells, cells)的数组，第i行第j列是线段落在该格内的长度之和。
+    bounds是(xmin, ymin, 边长)。每条线段按不超过半格的步长等分，每一小段的长度计入其中点所在的格子。
+    '''
+    x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+    xmin, ymin, extent = bounds
+    cell_size = extent / cells
+    grid = np.zeros(cells * cells)
+    length = np.hypot(x1 - x0, y1 - y0)
+    counts = sample_counts(length, cell_size)
+    # 以格子为单位的起点和每一步的增量，第k个采样点在起点加(k + 0.5)步处
+    step_x = (x1 - x0) / counts / cell_size
+    step_y = (y1 - y0) / counts / cell_size
+    start_x = (x0 - xmin) / cell_size + step_x / 2
+    start_y = (y0 - ymin) / cell_size + step_y / 2
+    weight = length / counts
+    ends = np.cumsum(counts)
+
+    start = 0
+    while start < len(counts):
+        # 每块的采样点数不超过CHUNK_SAMPLES，但至少包含一条线段
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + CHUNK_SAMPLES, side='right')), start + 1)
+        part = slice(start, stop)
+        chunk = counts[part]
+        k = np.arange(chunk.sum(), dtype=np.float64) - np.repeat((np.cumsum(chunk) - chunk).astype(np.float64), chunk)
+        ix = np.floor(np.repeat(start_x[part], chunk) + np.repeat(step_x[part], chunk) * k).astype(np.int64)
+        iy = np.floor(np.repeat(start_y[part], chunk) + np.repeat(step_y[part], chunk) * k).astype(np.int64)
+        inside = (ix >= 0) & (ix < cells) & (iy >= 0) & (iy < cells)
+        grid += np.bincount(
+            (iy * cells + ix)[inside], weights=np.repeat(weight[part], chunk)[inside], minlength=cells * cells
+        )
+        start = stop
+    return grid.reshape(cells, cells)
+
+
+class ExposureMap:
+    '''
+    曝光分析的结果。dwell[i, j]是激光在第i行第j列格子内停留的秒数，
+    第0行第0列格子的左下角是(xmin, ymin)。density是单位面积的停留时间（秒/长度单位²）。
+    '''
+    def __init__(self, dwell: np.ndarray, bounds: tuple, unit='mm'):
+        self.dwell = dwell
+        self.bounds = bounds
+        self.unit = unit
+        self.cell_size = bounds[2] / dwell.shape[0]
+        self.density = dwell / self.cell_size ** 2
+
+    @property
+    def extent(self) -> tuple:
+        '''
+        供imshow使用的(左, 右, 下, 上)。
+        '''
+        xmin, ymin, size = self.bounds
+        return xmin, xmin + size, ymin, ymin + size
+
+    def converted(self, unit: str):
+        '''
+        返回长度换算为unit的结果，停留时间不变。
+        '''
+        factor = UNIT_SCALE[self.unit] / UNIT_SCALE[unit]
+        return ExposureMap(self.dwell, tuple(v * factor for v in self.bounds), unit)
+
+    def hotspots(self) -> np.ndarray:
+        '''
+        返回热点格子的布尔数组：曝光量超过有曝光的格子的中位数HOTSPOT_RATIO倍。
+        '''
+        exposed = self.density[self.density > 0]
+        if not len(exposed):
+            return np.zeros(self.density.shape, dtype=bool)
+        return self.density > HOTSPOT_RATIO * np.median(exposed)
+
+    def summary(self) -> str:
+        exposed = self.density[self.density > 0]
+        if not len(exposed):
+            return '没有标刻线段。'
+        i, j = np.unravel_index(np.argmax(self.density), self.density.shape)
+        xmin, ymin, _ = self.bounds
+        x = xmin + (j + 0.5) * self.cell_size
+        y = ymin + (i + 0.5) * self.cell_size
+        hotspots = int(self.hotspots().sum())
+        return (
+            f'曝光的格子{len(exposed)}个，中位数{np.median(exposed):.4g}s/{self.unit}²，'
+            f'最大{exposed.max():.4g}s/{self.unit}²（({x:.3f}, {y:.3f})附近），'
+            f'热点{hotspots}个（超过中位数{HOTSPOT_RATIO:g}倍）'
+        )
+
+
+def exposure_map(toolpath: Toolpath, bounds: tuple = None, cells=256, header: dict = None, workers=None) -> ExposureMap:
+    '''
+    计算标刻线段的曝光分布。bounds默认为包含所有标刻线段的正方形，
+    停留时间按header（默认为toolpath.header）中的MarkSpeed计算。
+    workers是进程数，默认在线段很多时使用全部CPU，为1时不使用进程池。
+    '''
+    header = {**DEFAULT_HEADER, **(toolpath.header if header is None else header)}
+    speed = float(header['MarkSpeed'])
+    if speed <= 0:
+        raise ValueError('速度必须大于0')
+    x0, y0, x1, y1, action = toolpath.segments()
+    mark = action == MARK
+    x0, y0, x1, y1 = x0[mark], y0[mark], x1[mark], y1[mark]
+
+    if bounds is None:
+        if len(x0):
+            xmin = min(x0.min(), x1.min())
+            ymin = min(y0.min(), y1.min())
+            extent = max(max(x0.max(), x1.max()) - xmin, max(y0.max(), y1.max()) - ymin)
+        else:
+            xmin, ymin, extent = 0.0, 0.0, 0.0
+        # 稍微放大范围，使最大的坐标也落在网格之内
+        bounds = (xmin, ymin, (extent or 1.0) * (1 + 1e-9))
+
+    if workers is None:
+        samples = sample_counts(np.hypot(x1 - x0, y1 - y0), bounds[2] / cells).sum()
+        workers = os.cpu_count() if samples > PARALLEL_SAMPLES else 1
+    if workers > 1 and len(x0) > workers:
+        # 按采样点数把线段均分给各个进程
+        samples = np.cumsum(sample_counts(np.hypot(x1 - x0, y1 - y0), bounds[2] / cells))
+        cuts = np.searchsorted(samples, samples[-1] * np.arange(1, workers) / workers)
+        parts = np.split(np.arange(len(x0)), cuts)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            grids = executor.map(
+                rasterize,
+                *zip(*((x0[p], y0[p], x1[p], y1[p]) for p in parts)),
+                [bounds] * workers, [cells] * workers
+            )
+            length = sum(grids)
+    else:
+        length = rasterize(x0, y0, x1, y1, bounds, cells)
+    return ExposureMap(length / speed, bounds, header.get('Unit', 'mm'))
@@ -0,0 +1,223 @@
+'''
+性能基准测试。生成随机游走、光栅填充和螺旋线三种合成的坐标序列，
+测量读写.dbd和.csv、生成折线以及重绘预览的耗时和内存峰值，结果保存为JSON，
+并可以与保存的基准结果比较，超过阈值时返回非0。
+
+用法示例：
+    python bench.py -o baseline.json
+    python bench.py --baseline baseline.json --threshold 1.5
+    python bench.py --sizes 1e3 1e5 1e7 --generators spiral --gui
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from tools import JUMP, MARK, DEFAULT_HEADER, Toolpath, read_csv, read_dbd, write_csv, write_dbd
+
+
+DEFAULT_SIZES = (1e3, 1e4, 1e5, 1e6)
+# 耗时低于这一秒数时计时误差较大，比较时额外放宽
+NOISE_SECONDS = 0.005
+# 合成的图形落在工作区域（圆心(30, 0)，半径40）之内
+CENTER = (30.0, 0.0)
+RADIUS = 35.0
+
+
+def random_walk(n: int, seed=0) -> Toolpath:
+    '''
+    随机游走，约五分之一的行是跳转。
+    '''
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(scale=0.2, size=(n, 2))
+    points = np.cumsum(steps, axis=0)
+    # 在边长为2 * RADIUS的正方形内来回折返，再缩小到圆内
+    points = (np.abs((points + RADIUS) % (4 * RADIUS) - 2 * RADIUS) - RADIUS) / np.sqrt(2)
+    action = np.where(rng.random(n) < 0.2, JUMP, MARK)
+    return Toolpath(points[:, 0] + CENTER[0], points[:, 1] + CENTER[1], action, DEFAULT_HEADER)
+
+
+def raster_hatch(n: int) -> Toolpath:
+    '''
+    往返的光栅填充：每条扫描线是一行跳转到线的一端，一行标刻到另一端。
+    '''
+    lines = max(n // 2, 1)
+    half = RADIUS / np.sqrt(2)
+    y = np.linspace(-half, half, lines)
+    left = np.where(np.arange(lines) % 2 == 0, -half, half)
+    x = np.stack((left, -left), axis=1).ravel()[:n]
+    y = np.repeat(y, 2)[:n]
+    action = np.tile([JUMP, MARK], lines)[:n]
+    return Toolpath(x + CENTER[0], y + CENTER[1], action, DEFAULT_HEADER)
+
+
+def spiral(n: int, turns=50, strokes=100) -> Toolpath:
+    '''
+    阿基米德螺旋线，分成strokes段标刻，每段之前跳转到该段的起点。
+    '''
+    t = np.linspace(0, 1, n)
+    angle = 2 * np.pi * turns * t
+    r = RADIUS * t
+    action = np.full(n, MARK, dtype=np.uint8)
+    action[::max(n // strokes, 1)] = JUMP
+    return Toolpath(r * np.cos(angle) + CENTER[0], r * np.sin(angle) + CENTER[1], action, DEFAULT_HEADER)
+
+
+GENERATORS = {'walk': random_walk, 'hatch': raster_hatch, 'spiral': spiral}
+
+
+def measure(function, repeat=3, memory=True) -> dict:
+    '''
+    返回function的最短耗时（秒）和内存峰值（字节，由tracemalloc统计，包括numpy数组）。
+    内存单独运行一次统计，避免跟踪内存拖慢计时。
+    '''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    result = {'seconds': min(seconds)}
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+class CanvasBench:
+    '''
+    在无界面的Qt平台上创建主窗口，测量载入坐标序列后重绘预览的耗时。
+    需要PySide2，导入失败时抛出ImportError。
+    '''
+    def __init__(self):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        import main
+        self.app = main.QApplication.instance() or main.QApplication([])
+        self.window = main.MainWindow(lazy_preview=True)
+        self.window.resize(1200, 800)
+        self.window.load_preview()
+
+    def update_canvas(self, toolpath: Toolpath):
+        self.window.set_movements(toolpath)
+        preview = self.window.preview
+        preview.update_canvas()
+        # draw_idle只是登记重绘，这里强制立即绘制
+        preview.dynamic_canvas.draw()
+
+
+def run_case(toolpath: Toolpath, directory: str, repeat: int, memory: bool, canvas=None) -> dict:
+    '''
+    对一个坐标序列运行各项测试，返回{测试名: 结果}。
+    '''
+    dbd = os.path.join(directory, 'bench.dbd')
+    csv = os.path.join(directory, 'bench.csv')
+    tasks = [
+        ('write_dbd', lambda: write_dbd(dbd, toolpath)),
+        ('write_csv', lambda: write_csv(csv, toolpath)),
+        ('read_dbd', lambda: read_dbd(dbd)),
+        ('read_csv', lambda: read_csv(csv)),
+        ('polyline', lambda: (toolpath.polyline(JUMP), toolpath.polyline(MARK))),
+    ]
+    if canvas is not None:
+        tasks.append(('update_canvas', lambda: canvas.update_canvas(toolpath)))
+    results = {}
+    for task, function in tasks:
+        results[task] = measure(function, repeat, memory)
+    for path in (dbd, csv):
+        if os.path.exists(path):
+            os.remove(path)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    '''
+    与基准结果比较，返回超过阈值的项目的说明。基准中没有的项目不比较。
+    '''
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['seconds'] > base['seconds'] * threshold + NOISE_SECONDS:
+            regressions.append(f'{key}：耗时{result["seconds"]:.4f}秒，基准{base["seconds"]:.4f}秒')
+        if 'peak_bytes' in result and 'peak_bytes' in base and result['peak_bytes'] > base['peak_bytes'] * threshold:
+            regressions.append(
+                f'{key}：内存峰值{result["peak_bytes"] / 2**20:.1f}MiB，基准{base["peak_bytes"] / 2**20:.1f}MiB'
+            )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='测量读写文件和绘制预览的性能，并与基准结果比较。')
+    parser.add_argument(
+        '--sizes', type=float, nargs='+', default=DEFAULT_SIZES,
+        help='坐标序列的行数，可以写成1e6的形式，默认为%(default)s'
+    )
+    parser.add_argument('--generators', nargs='+', choices=tuple(GENERATORS), default=tuple(GENERATORS), help='合成的图形')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复的次数，取最短的耗时')
+    parser.add_argument('--no-memory', action='store_true', help='不统计内存峰值')
+    parser.add_argument('--gui', action='store_true', help='同时测量重绘预览，需要PySide2')
+    parser.add_argument('-o', '--output', help='结果保存到的JSON文件')
+    parser.add_argument('--baseline', help='与之比较的基准结果JSON文件')
+    parser.add_argument('--threshold', type=float, default=1.5, help='超过基准的这一倍数视为退步，默认为%(default)s')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    canvas = None
+    if args.gui:
+        try:
+            canvas = CanvasBench()
+        except ImportError as e:
+            print(f'无法测量重绘预览：{e}', file=sys.stderr)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for generator in args.generators:
+            for size in args.sizes:
+                n = int(size)
+                toolpath = GENERATORS[generator](n)
+                case = run_case(toolpath, directory, args.repeat, not args.no_memory, canvas)
+                for task, result in case.items():
+                    key = f'{generator}/{n}/{task}'
+                    results[key] = result
+                    memory = f'，内存峰值{result["peak_bytes"] / 2**20:.1f}MiB' if 'peak_bytes' in result else ''
+                    print(f'{key}：{result["seconds"]:.4f}秒{memory}', flush=True)
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for message in regressions:
+            print(f'退步：{message}', file=sys.stderr)
+        if regressions:
+            return 1
+        print(f'与基准相比没有超过{args.threshold:g}倍的退步。')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+'''
+.dbd文件的二进制缓存。
+解析过的大文件把坐标和动作保存为.npy文件，再次打开同一个文件时直接内存映射，不必重新解析。
+缓存以文件的绝对路径为键，记录文件的大小、修改时间和内容的哈希值：
+大小和修改时间都没有变化时直接使用缓存；只有修改时间变化时（如复制、touch）重新计算哈希值核对；
+大小变化或哈希值不同时缓存失效。缓存的总大小超过上限时，删除最久没有使用的条目。
+
+为了让重新打开只需几毫秒，大小和修改时间（纳秒）都相同时认为内容没有变化，不再计算哈希值。
+改写文件后大小不变、修改时间也被还原（如某些同步工具或手动设置修改时间）时会用到过期的缓存，
+这时需要清空缓存。
+'''
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from tools import ParseReport, Toolpath, iter_dbd, read_dbd
+
+
+# 缓存条目中保存的数组
+ARRAYS = ('x', 'y', 'action')
+
+
+def default_directory() -> str:
+    '''
+    缓存目录，可以用环境变量DBD_MAKER_CACHE指定。
+    '''
+    if os.environ.get('DBD_MAKER_CACHE'):
+        return os.environ['DBD_MAKER_CACHE']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'dbd-maker')
+
+
+def file_digest(filepath: str, chunk_size=1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DbdCache:
+    '''
+    .dbd文件的缓存目录。小于MIN_SIZE字节的文件解析很快，不做缓存。
+    缓存只是加速手段，读写缓存时的错误都会被忽略，退回到直接解析文件。
+    '''
+    MIN_SIZE = 1 << 20
+    MAX_BYTES = 1 << 30
+
+    def __init__(self, directory: str = None, max_bytes: int = MAX_BYTES):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+
+    def _key(self, filepath: str) -> str:
+        path = os.path.normcase(os.path.abspath(filepath))
+        return hashlib.sha1(path.encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str) -> dict:
+        paths = {name: os.path.join(self.directory, f'{key}.{name}.npy') for name in ARRAYS}
+        paths['meta'] = os.path.join(self.directory, f'{key}.json')
+        return paths
+
+    def load(self, filepath: str, report: ParseReport = None):
+        '''
+        返回缓存中的Toolpath，缓存不存在或已失效时返回None。
+        数组以写时复制的方式映射，修改它们不会影响缓存文件。
+        '''
+        paths = self._paths(self._key(filepath))
+        try:
+            with open(paths['meta'], encoding='utf-8') as f:
+                meta = json.load(f)
+            stat = os.stat(filepath)
+            if meta['size'] != stat.st_size:
+                return None
+            if meta['mtime'] != stat.st_mtime_ns:
+                if meta['digest'] != file_digest(filepath):
+                    return None
+                meta['mtime'] = stat.st_mtime_ns
+                self._write_meta(paths['meta'], meta)
+            arrays = [np.load(paths[name], mmap_mode='c') for name in ARRAYS]
+            # 记录最近一次使用的时间，淘汰时据此排序
+            os.utime(paths['meta'])
+        except (OSError, ValueError, KeyError):
+            return None
+        if report is not None:
+            for lineno, reason, text in meta['rejected']:
+                report.reject(lineno, reason, text)
+            report.count += meta['rejected_count'] - len(meta['rejected'])
+        return Toolpath(*arrays, header=meta['header'])
+
+    def store(self, filepath: str, toolpath: Toolpath, stat: os.stat_result, report: ParseReport = None):
+        '''
+        保存解析的结果，stat是解析前文件的状态。解析期间文件被修改时不保存。
+        '''
+        try:
+            if os.stat(filepath).st_mtime_ns != stat.st_mtime_ns:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            paths = self._paths(self._key(filepath))
+            # 先删除旧的元数据，使写入途中的条目不会被当作有效
+            if os.path.exists(paths['meta']):
+                os.remove(paths['meta'])
+            for name in ARRAYS:
+                self._atomic_save(paths[name], getattr(toolpath, name))
+            self._write_meta(paths['meta'], {
+                'path': os.path.abspath(filepath),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'digest': file_digest(filepath),
+                'header': toolpath.header,
+                'rejected_count': report.count if report is not None else 0,
+                'rejected': report.rejected if report is not None else [],
+            })
+        except OSError:
+            return
+        self.evict()
+
+    def _atomic_save(self, path: str, array: np.ndarray):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write_meta(self, path: str, meta: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def entries(self) -> list:
+        '''
+        返回所有条目的(最近使用时间, 总字节数, 文件路径列表)，按最近使用时间从早到晚排列。
+        '''
+        sizes = {}
+        used = {}
+        files = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            key, _, rest = name.partition('.')
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            files.setdefault(key, []).append(path)
+            if rest == 'json':
+                used[key] = stat.st_mtime
+        # 没有元数据的条目和临时文件是写入失败留下的，最先淘汰
+        return sorted((used.get(key, 0.0), size, files[key]) for key, size in sizes.items())
+
+    @staticmethod
+    def _remove_files(paths):
+        # 正在被映射的文件在Windows上无法删除，留到以后再淘汰
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        '''
+        删除最久没有使用的条目，直到缓存的总大小不超过max_bytes。
+        '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove_files(paths)
+            total -= size
+
+    def clear(self):
+        for _, _, paths in self.entries():
+            self._remove_files(paths)
+
+    def read_dbd(self, filepath: str, report: ParseReport = None) -> Toolpath:
+        '''
+        与tools.read_dbd相同，但优先使用缓存，解析较大的文件后保存到缓存中。
+        '''
+        stat = os.stat(filepath)
+        if stat.st_size < self.MIN_SIZE:
+            return read_dbd(filepath, report)
+        toolpath = self.load(filepath, report)
+        if toolpath is not None:
+            return toolpath
+        if report is None:
+            report = ParseReport()
+        toolpath = read_dbd(filepath, report)
+        self.store(filepath, toolpath, stat, report)
+        return toolpath
+
+    def iter_dbd(self, filepath: str, report: ParseReport = None):
+        '''
+        与tools.iter_dbd相同，但优先使用缓存，命中时整个文件作为一块产生。
+        较大的文件完整解析后保存到缓存中，中途停止迭代时不保存。
+        '''
+        stat = os.stat(filepath)
+        if stat.st_size < self.MIN_SIZE:
+            yield from iter_dbd(filepath, report)
+            return
+        toolpath = self.load(filepath, report)
+        if toolpath is not None:
+            yield toolpath, stat.st_size
+            return
+        if report is None:
+            report = ParseReport()
+        chunks = []
+        header = {}
+        for chunk, bytes_read in iter_dbd(filepath, report):
+            chunks.append(chunk)
+            header = chunk.header
+            yield chunk, bytes_read
+        self.store(filepath, Toolpath.concatenate(chunks, header), stat, report)
@@ -0,0 +1,291 @@
+'''
+命令行批量转换工具，在.csv和.dbd之间转换坐标序列，也可以把G代码、SVG和DXF文件转换为.dbd。
+只依赖tools.py和importers.py，不加载PySide2和matplotlib。
+
+用法示例：
+    python cli.py layers/ -o out/ --mark-speed 800 -j 8
+    python cli.py part.dbd --to csv
+    python cli.py layers/ --estimate
+    python cli.py logo.svg --tolerance 0.005 --mark-speed 500
+'''
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from importers import IMPORTERS, TOLERANCE, find_importer
+from optimize import optimize, simplify
+from tools import (
+    DEFAULT_HEADER, HEADER_KEYS, PRECISION, UNIT_SCALE, ParseReport, estimate_time, format_duration,
+    read_csv, read_dbd, scaling, str_is_float, write_csv, write_dbd
+)
+
+
+# 各格式转换后的格式，可以导入的格式都转换为.dbd
+TARGETS = {'.csv': '.dbd', '.dbd': '.csv'}
+TARGETS.update((ext, '.dbd') for importer in IMPORTERS for ext in importer.extensions)
+
+
+def option_name(key: str) -> str:
+    '''
+    将文件头参数名转换为命令行选项名，如LaserOnDelay转换为--laser-on-delay。
+    '''
+    return '--' + re.sub(r'(?<!^)([A-Z])', r'-\1', key).lower()
+
+
+def number(value: str) -> str:
+    '''
+    检查参数是否是数字，保留原样的字符串以便写入文件头。
+    '''
+    if not str_is_float(value):
+        raise argparse.ArgumentTypeError(f'{value}不是数字')
+    return value
+
+
+def positive(value: str) -> float:
+    '''
+    检查参数是否是大于0的数字。
+    '''
+    try:
+        result = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value}不是数字') from None
+    if not result > 0:
+        raise argparse.ArgumentTypeError(f'{value}不大于0')
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='在.csv和.dbd之间批量转换坐标序列，或把G代码、SVG和DXF文件转换为.dbd。'
+    )
+    parser.add_argument('inputs', nargs='+', help='输入文件或目录，目录中所有可以识别的文件都会被转换')
+    parser.add_argument('-o', '--output', help='输出目录，只有一个输入文件时也可以是输出文件名；默认与输入文件放在一起')
+    parser.add_argument('--to', choices=('dbd', 'csv'), help='输出格式，默认.dbd转为.csv，其它格式转为.dbd')
+    parser.add_argument('-r', '--recursive', action='store_true', help='递归处理子目录')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='并行转换的进程数')
+    parser.add_argument('--precision', type=int, default=PRECISION, help='坐标保留的小数位数，默认为%(default)s')
+    parser.add_argument(
+        '--simplify', type=float, metavar='TOLERANCE',
+        help='去掉多余的命令，并合并偏差不超过TOLERANCE的标刻点（为0时只合并共线的点）'
+    )
+    parser.add_argument(
+        '--tolerance', type=positive, default=TOLERANCE,
+        help='导入G代码、SVG和DXF时曲线展开为折线的最大偏差（按--unit的单位），默认为%(default)s'
+    )
+    parser.add_argument('--optimize', action='store_true', help='重新安排标刻线段的顺序以缩短跳转距离')
+    parser.add_argument('--keep-direction', action='store_true', help='优化时不反向标刻线段')
+    parser.add_argument(
+        '--estimate', action='store_true',
+        help='只估算加工时间，不转换文件'
+    )
+    parser.add_argument('--overwrite', action='store_true', help='允许输出文件与输入文件相同，覆盖输入文件')
+    # 文件头参数不设默认值，以区分是否在命令行中给出：.dbd文件只替换给出的参数，其它文件缺少的参数取默认值
+    parser.add_argument(
+        '--unit', choices=('mm', 'inch'),
+        help=f'长度单位，默认为{DEFAULT_HEADER["Unit"]}；改变.dbd文件的单位时坐标和速度按新单位换算'
+    )
+    for key in HEADER_KEYS:
+        parser.add_argument(
+            option_name(key), dest=key, type=number, metavar='VALUE',
+            help=f'{key}，默认为{DEFAULT_HEADER[key]}（.dbd文件默认保留其中的值）'
+        )
+    return parser.parse_args(argv)
+
+
+def collect_inputs(inputs, recursive=False) -> list:
+    '''
+    展开输入中的目录，返回所有待转换的文件路径。
+    '''
+    files = []
+    for path in inputs:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            files.extend(
+                os.path.join(root, name) for name in sorted(names)
+                if os.path.splitext(name)[1].lower() in TARGETS
+            )
+            if not recursive:
+                break
+    return files
+
+
+def output_path(src: str, ext: str, output=None, single=False) -> str:
+    name = os.path.splitext(os.path.basename(src))[0] + ext
+    if output is None:
+        return os.path.join(os.path.dirname(src), name)
+    if single and not os.path.isdir(output) and os.path.splitext(output)[1]:
+        return output
+    return os.path.join(output, name)
+
+
+def dbd_header(toolpath, overrides: dict) -> dict:
+    '''
+    从.dbd读出的文件头，只替换命令行中给出的参数。Unit改变时坐标按新单位换算，
+    命令行中没有给出的速度（Unit/s）也一起换算，使文件的含义不变。
+    '''
+    header = {**DEFAULT_HEADER, **toolpath.header}
+    unit = overrides.get('Unit', header['Unit'])
+    if unit != header['Unit']:
+        if header['Unit'] not in UNIT_SCALE:
+            raise ValueError(f'无法识别文件中的单位{header["Unit"]}，不能换算为{unit}')
+        factor = UNIT_SCALE[header['Unit']] / UNIT_SCALE[unit]
+        toolpath.transform(scaling(factor))
+        for key in ('JumpSpeed', 'MarkSpeed'):
+            if key not in overrides:
+                header[key] = repr(float(header[key]) * factor)
+    header.update(overrides)
+    return header
+
+
+def read_input(src: str, overrides: dict, report: ParseReport, tolerance=None):
+    '''
+    读取一个输入文件，返回的Toolpath的header是转换后使用的文件头。
+    .dbd文件保留其中的参数，只替换overrides（命令行中给出的参数）；其它文件使用默认参数和overrides。
+    G代码、SVG和DXF的导入结果（毫米）换算为Unit，tolerance是曲线展开的最大偏差（同样按Unit），
+    默认为importers.TOLERANCE毫米。
+    '''
+    header = {**DEFAULT_HEADER, **overrides}
+    ext = os.path.splitext(src)[1].lower()
+    importer = find_importer(src)
+    if ext == '.csv':
+        toolpath = read_csv(src, report)
+    elif importer is None:
+        toolpath = read_dbd(src, report)
+        header = dbd_header(toolpath, overrides)
+    else:
+        scale = UNIT_SCALE[header['Unit']]
+        toolpath = importer.read(src, report, TOLERANCE if tolerance is None else tolerance * scale)
+        if scale != 1.0:
+            toolpath.transform(scaling(1 / scale))
+    toolpath.header = header
+    return toolpath
+
+
+def convert_file(src: str, dst: str, overrides: dict, precision=PRECISION, options=None) -> tuple:
+    '''
+    转换一个文件，返回(输入路径, 输出路径, 行数, 未能解析的行数, 简化时去掉的行数, 优化报告)。
+    overrides是命令行中给出的文件头参数（见read_input）。
+    options是命令行参数中与导入、简化和优化有关的部分，没有简化或优化时对应的结果为None。
+    '''
+    options = options or {}
+    report = ParseReport()
+    toolpath = read_input(src, overrides, report, options.get('tolerance'))
+    removed = None
+    if options.get('simplify') is not None:
+        toolpath, simplified = simplify(toolpath, options['simplify'])
+        removed = simplified.removed
+    optimized = None
+    if options.get('optimize'):
+        toolpath, optimized = optimize(toolpath, reverse=not options.get('keep_direction'))
+    if os.path.splitext(dst)[1].lower() == '.dbd':
+        write_dbd(dst, toolpath, precision)
+    else:
+        write_csv(dst, toolpath, precision)
+    return src, dst, len(toolpath), len(report), removed, optimized
+
+
+def estimate_file(src: str, overrides: dict, tolerance=None) -> tuple:
+    '''
+    估算一个文件的加工时间，返回(输入路径, 行数, 未能解析的行数, TimeEstimate)。
+    '''
+    report = ParseReport()
+    toolpath = read_input(src, overrides, report, tolerance)
+    return src, len(toolpath), len(report), estimate_time(toolpath)
+
+
+def error_message(e: Exception) -> str:
+    '''
+    OSError和ValueError的信息本身足以说明问题，其它异常多半是程序的问题，附上异常的类型。
+    '''
+    if isinstance(e, (OSError, ValueError)):
+        return str(e)
+    return f'{type(e).__name__}: {e}'
+
+
+def estimate_files(files: list, overrides: dict, jobs: int, tolerance=None) -> int:
+    failed = 0
+    total = 0.0
+    with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(files)))) as executor:
+        futures = [executor.submit(estimate_file, src, overrides, tolerance) for src in files]
+        for src, future in zip(files, futures):
+            try:
+                src, rows, rejected, estimate = future.result()
+            # 一个文件出错时报告后继续处理其它文件
+            except Exception as e:
+                failed += 1
+                print(f'{src}：估算失败，{error_message(e)}', file=sys.stderr)
+                continue
+            total += estimate.total
+            message = (
+                f'{src}：{rows}行，预计耗时{format_duration(estimate.total)}'
+                f'（标刻{estimate.mark_time:.3f}秒，跳转{estimate.jump_time:.3f}秒，延迟{estimate.delay_time:.3f}秒）'
+            )
+            if rejected:
+                message += f'，{rejected}行未能解析'
+            print(message)
+    print(f'合计：{len(files) - failed}个文件，预计耗时{format_duration(total)}')
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    overrides = {key: getattr(args, key) for key in HEADER_KEYS if getattr(args, key) is not None}
+    if args.unit is not None:
+        overrides['Unit'] = args.unit
+    options = {
+        'tolerance': args.tolerance, 'simplify': args.simplify,
+        'optimize': args.optimize, 'keep_direction': args.keep_direction,
+    }
+
+    files = collect_inputs(args.inputs, args.recursive)
+    if not files:
+        print('没有找到需要转换的文件。', file=sys.stderr)
+        return 1
+    if args.estimate:
+        return estimate_files(files, overrides, args.jobs, args.tolerance)
+    if args.output and (len(files) > 1 or not os.path.splitext(args.output)[1]):
+        os.makedirs(args.output, exist_ok=True)
+
+    jobs = []
+    failed = 0
+    for src in files:
+        ext = f'.{args.to}' if args.to else TARGETS.get(os.path.splitext(src)[1].lower())
+        if ext is None:
+            print(f'{src}：无法识别的文件格式，已跳过。', file=sys.stderr)
+            continue
+        dst = output_path(src, ext, args.output, len(files) == 1)
+        if os.path.abspath(dst) == os.path.abspath(src) and not args.overwrite:
+            failed += 1
+            print(f'{src}：输出文件与输入文件相同，已跳过；用-o指定输出位置，或加上--overwrite覆盖。', file=sys.stderr)
+            continue
+        jobs.append((src, dst, overrides, args.precision, options))
+    if not jobs:
+        return 1 if failed else 0
+
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(jobs)))) as executor:
+        futures = [executor.submit(convert_file, *job) for job in jobs]
+        for (src, *_), future in zip(jobs, futures):
+            try:
+                src, dst, rows, rejected, removed, optimized = future.result()
+            except Exception as e:
+                failed += 1
+                print(f'{src}：转换失败，{error_message(e)}', file=sys.stderr)
+                continue
+            message = f'{src} -> {dst}：{rows}行'
+            if rejected:
+                message += f'，{rejected}行未能解析'
+            if removed is not None:
+                message += f'，简化去掉{removed}行'
+            if optimized is not None:
+                before, after = optimized.before.total, optimized.after.total
+                message += f'，预计耗时{format_duration(before)} -> {format_duration(after)}'
+            print(message)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
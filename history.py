@@ -0,0 +1,273 @@
+'''
+撤销和重做。每次编辑是一个命令，只保存撤销所需的最少信息：修改的单元格保存新旧两个值，
+增删的行保存这些行，变换保存原来的坐标，阵列复制只保存参数。只有超过内存上限一半的变换才只保存参数，
+撤销时做逆变换。
+History按命令占用的内存之和限制历史的长度，超出上限时先丢弃最早的命令。
+
+命令通过表格模型修改坐标序列，模型需要提供toolpath属性以及set_value、insert_rows、remove_rows、
+move_row、set_toolpath和reset方法（见main.MovementTableModel），这些方法负责发出相应的信号。
+'''
+from collections import deque
+
+import numpy as np
+
+from tools import Toolpath
+
+
+# 默认的内存上限（字节）
+MEMORY_LIMIT = 256 << 20
+# 每个命令本身的大约开销，使大量很小的命令也受内存上限的约束
+COMMAND_BYTES = 256
+# 变换的行数不超过这一数量时保存原来的坐标（每行16字节，共占内存上限的一半），撤销时精确恢复
+EXACT_ROWS = MEMORY_LIMIT // 32
+# 逆变换的结果舍入到的小数位数（毫米），去掉浮点误差，如0变成1e-16或-0.0
+INVERSE_DECIMALS = 12
+
+
+class Command:
+    '''
+    一次可以撤销的编辑。redo执行（或重新执行）编辑，undo撤销。
+    nbytes是命令在当前状态下额外占用的内存，不包括与表格共用的数组。
+    '''
+    label = ''
+
+    def redo(self, model):
+        raise NotImplementedError
+
+    def undo(self, model):
+        raise NotImplementedError
+
+    @property
+    def nbytes(self) -> int:
+        return 0
+
+
+class SetValue(Command):
+    '''
+    修改一个单元格，column为0、1、2分别对应x、y和动作。
+    '''
+    def __init__(self, row: int, column: int, old, new):
+        self.row = row
+        self.column = column
+        self.old = old
+        self.new = new
+        self.label = f'修改第{row + 1}行的{("X", "Y", "动作")[column]}'
+
+    def redo(self, model):
+        model.set_value(self.row, self.column, self.new)
+
+    def undo(self, model):
+        model.set_value(self.row, self.column, self.old)
+
+
+class _RowsCommand(Command):
+    '''
+    插入或删除从第row行开始的连续若干行。行被删除时才需要保存它们，仍在表格中时不保存。
+    '''
+    def __init__(self, row: int, rows: Toolpath = None, count: int = None):
+        self.row = row
+        self.rows = rows
+        self.count = len(rows) if rows is not None else count
+
+    def insert(self, model):
+        model.insert_rows(self.row, self.rows)
+        self.rows = None
+
+    def remove(self, model):
+        self.rows = model.toolpath.rows(self.row, self.row + self.count)
+        model.remove_rows(self.row, self.count)
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes if self.rows is not None else 0
+
+
+class InsertRows(_RowsCommand):
+    def __init__(self, row: int, rows: Toolpath):
+        super().__init__(row, rows)
+        self.label = f'插入第{row + 1}行' if self.count == 1 else f'插入{self.count}行'
+
+    redo = _RowsCommand.insert
+    undo = _RowsCommand.remove
+
+
+class DeleteRows(_RowsCommand):
+    def __init__(self, row: int, count=1):
+        super().__init__(row, count=count)
+        self.label = f'删除第{row + 1}行' if count == 1 else f'删除{count}行'
+
+    redo = _RowsCommand.remove
+    undo = _RowsCommand.insert
+
+
+class MoveRow(Command):
+    def __init__(self, row: int, new_row: int):
+        self.row = row
+        self.new_row = new_row
+        self.label = f'{"上移" if new_row < row else "下移"}第{row + 1}行'
+
+    def redo(self, model):
+        model.move_row(self.row, self.new_row)
+
+    def undo(self, model):
+        model.move_row(self.new_row, self.row)
+
+
+class Transform(Command):
+    '''
+    对第start行到第stop-1行做仿射变换。
+    执行前保存这些行原来的坐标，撤销时精确恢复，占用的内存由History限制。
+    只有行数超过EXACT_ROWS（保存的坐标会占去内存上限的一半以上）且矩阵可逆时才不保存，
+    撤销时做逆变换并舍入到INVERSE_DECIMALS位小数，与原来的坐标只在约1e-12毫米以内相同，
+    远小于保存文件时的精度。
+    '''
+    def __init__(self, matrix, start=0, stop=None, label='变换'):
+        self.matrix = np.asarray(matrix, dtype=np.float64)
+        self.start = start
+        self.stop = stop
+        self.label = label
+        self.inverse = None
+        self.previous = None
+        if abs(np.linalg.det(self.matrix)) > 1e-12:
+            self.inverse = np.linalg.inv(self.matrix)
+
+    def redo(self, model):
+        part = slice(self.start, self.stop)
+        if self.inverse is None or len(model.toolpath.x[part]) <= EXACT_ROWS:
+            self.previous = (model.toolpath.x[part].copy(), model.toolpath.y[part].copy())
+        model.toolpath.transform(self.matrix, self.start, self.stop)
+        model.reset()
+
+    def undo(self, model):
+        part = slice(self.start, self.stop)
+        if self.previous is not None:
+            model.toolpath.x[part], model.toolpath.y[part] = self.previous
+            self.previous = None
+        else:
+            model.toolpath.transform(self.inverse, self.start, self.stop)
+            for values in (model.toolpath.x, model.toolpath.y):
+                # 加0.0把-0.0变成0.0
+                values[part] = np.round(values[part], INVERSE_DECIMALS) + 0.0
+        model.reset()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes for v in self.previous) if self.previous is not None else 0
+
+
+class Repeat(Command):
+    '''
+    阵列复制（见Toolpath.repeat），撤销时删除复制出的行。stop为None时表示到最后一行，
+    第一次执行时换成当时的行数，复制出的行从这里开始。
+    '''
+    def __init__(self, columns: int, rows: int, dx: float, dy: float, start: int, stop: int = None):
+        self.args = (columns, rows, dx, dy)
+        self.start = start
+        self.stop = stop
+        self.added = 0
+        self.label = '阵列复制'
+
+    def redo(self, model):
+        before = len(model.toolpath)
+        if self.stop is None:
+            self.stop = before
+        model.toolpath.repeat(*self.args, self.start, self.stop)
+        self.added = len(model.toolpath) - before
+        model.reset()
+
+    def undo(self, model):
+        model.toolpath.delete(self.stop, self.added)
+        model.reset()
+
+
+class Replace(Command):
+    '''
+    整体替换坐标序列，如导入、优化和简化。不在表格中的那一个Toolpath需要保留。
+    '''
+    def __init__(self, old: Toolpath, new: Toolpath, label='替换'):
+        self.old = old
+        self.new = new
+        self.label = label
+        self.done = False
+
+    def redo(self, model):
+        model.set_toolpath(self.new)
+        self.done = True
+
+    def undo(self, model):
+        model.set_toolpath(self.old)
+        self.done = False
+
+    @property
+    def nbytes(self) -> int:
+        return (self.old if self.done else self.new).nbytes
+
+
+class History:
+    '''
+    撤销和重做的命令栈。push记录已经执行过的命令，undo、redo在model上撤销和重做。
+    所有命令（包括可以重做的）占用的内存之和超过limit时，从最早的命令开始丢弃；
+    单个命令就超过上限时，历史被清空，该命令也不能撤销。
+    '''
+    def __init__(self, limit=MEMORY_LIMIT):
+        self.limit = limit
+        self.done = deque()
+        self.undone = []
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.done)
+
+    def clear(self):
+        self.done.clear()
+        self.undone.clear()
+        self.nbytes = 0
+
+    def can_undo(self) -> bool:
+        return bool(self.done)
+
+    def can_redo(self) -> bool:
+        return bool(self.undone)
+
+    def undo_label(self) -> str:
+        return self.done[-1].label if self.done else ''
+
+    def redo_label(self) -> str:
+        return self.undone[-1].label if self.undone else ''
+
+    def push(self, command: Command):
+        for undone in self.undone:
+            self.nbytes -= undone.nbytes + COMMAND_BYTES
+        self.undone.clear()
+        self.done.append(command)
+        self.nbytes += command.nbytes + COMMAND_BYTES
+        self.evict()
+
+    def undo(self, model):
+        if not self.done:
+            return
+        command = self.done.pop()
+        # 撤销和重做会改变命令保存的内容
+        self.nbytes -= command.nbytes
+        command.undo(model)
+        self.nbytes += command.nbytes
+        self.undone.append(command)
+        self.evict()
+
+    def redo(self, model):
+        if not self.undone:
+            return
+        command = self.undone.pop()
+        self.nbytes -= command.nbytes
+        command.redo(model)
+        self.nbytes += command.nbytes
+        self.done.append(command)
+        self.evict()
+
+    def evict(self):
+        '''
+        超过上限时丢弃最早的命令，撤销栈为空时再丢弃离当前状态最远的可以重做的命令。
+        '''
+        while self.nbytes > self.limit and (self.done or self.undone):
+            command = self.done.popleft() if self.done else self.undone.pop(0)
+            self.nbytes -= command.nbytes + COMMAND_BYTES
@@ -0,0 +1,799 @@
+'''
+从G代码、SVG和DXF文件导入坐标序列。
+各格式的导入函数都与tools.iter_csv一样分块解析，逐块产生(Toolpath, 已读取字节数)，
+坐标统一换算为毫米，曲线按弦高误差tolerance（毫米）展开为折线。
+用register()登记新的格式后，主窗口和命令行工具即可导入该格式的文件。
+'''
+import math
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from tools import JUMP, MARK, ParseReport, Toolpath, iter_blocks, scaling, translation
+
+
+# 曲线展开为折线时默认允许的弦高误差（毫米）
+TOLERANCE = 0.01
+# SVG和DXF每攒够这么多行产生一块
+CHUNK_ROWS = 1 << 16
+
+
+class Importer:
+    '''
+    一种可以导入的格式。iterate(filepath, report, tolerance)逐块产生(Toolpath, 已读取字节数)。
+    '''
+    def __init__(self, name: str, extensions: tuple, iterate):
+        self.name = name
+        self.extensions = extensions
+        self.iterate = iterate
+
+    def read(self, filepath: str, report: ParseReport = None, tolerance=TOLERANCE) -> Toolpath:
+        return Toolpath.concatenate([chunk for chunk, _ in self.iterate(filepath, report, tolerance)])
+
+
+IMPORTERS = []
+
+
+def register(name: str, *extensions):
+    '''
+    装饰器，把导入函数登记为扩展名为extensions（如'.svg'）的文件的导入方式。
+    '''
+    def decorator(iterate):
+        IMPORTERS.append(Importer(name, tuple(ext.lower() for ext in extensions), iterate))
+        return iterate
+    return decorator
+
+
+def read_file(filepath: str, report: ParseReport = None, tolerance=TOLERANCE) -> Toolpath:
+    '''
+    按扩展名选择导入方式读取文件，返回一个Toolpath（坐标单位为毫米）。没有对应的导入方式时抛出ValueError。
+    '''
+    importer = find_importer(filepath)
+    if importer is None:
+        raise ValueError(f'不支持导入{os.path.splitext(filepath)[1] or "没有扩展名的"}文件')
+    return importer.read(filepath, report, tolerance)
+
+
+def find_importer(filepath: str):
+    '''
+    按扩展名返回对应的Importer，没有时返回None。
+    '''
+    ext = os.path.splitext(filepath)[1].lower()
+    return next((importer for importer in IMPORTERS if ext in importer.extensions), None)
+
+
+def file_filter() -> str:
+    '''
+    供QFileDialog使用的文件类型过滤器，每种格式一项。
+    '''
+    return ';;'.join(
+        f'{importer.name} ({" ".join("*" + ext for ext in importer.extensions)})' for importer in IMPORTERS
+    )
+
+
+class _Builder:
+    '''
+    收集导入的运动，记录当前位置。跳转到当前位置和长度为0的标刻都会被省略。
+    '''
+    # 与当前位置相距不超过这一距离（毫米）视为同一点，避免浮点误差产生多余的跳转
+    EPSILON = 1e-9
+
+    def __init__(self):
+        self.x = []
+        self.y = []
+        self.action = []
+        self.position = (0.0, 0.0)
+
+    def __len__(self):
+        return len(self.x)
+
+    def move(self, x: float, y: float, action: int):
+        if abs(x - self.position[0]) <= self.EPSILON and abs(y - self.position[1]) <= self.EPSILON:
+            return
+        self.x.append(x)
+        self.y.append(y)
+        self.action.append(action)
+        self.position = (x, y)
+
+    def extend(self, xs, ys, action: int):
+        '''
+        依次移动到多个点，用于展开的曲线。只检查第一个点是否与当前位置重合。
+        '''
+        xs = np.asarray(xs, dtype=np.float64).tolist()
+        ys = np.asarray(ys, dtype=np.float64).tolist()
+        if not xs:
+            return
+        self.move(xs[0], ys[0], action)
+        self.x.extend(xs[1:])
+        self.y.extend(ys[1:])
+        self.action.extend([action] * (len(xs) - 1))
+        self.position = (xs[-1], ys[-1])
+
+    def take(self) -> Toolpath:
+        '''
+        取出已收集的运动，之后从空的列表重新开始（当前位置不变）。
+        '''
+        chunk = Toolpath(self.x, self.y, self.action)
+        self.x, self.y, self.action = [], [], []
+        return chunk
+
+
+def _check_tolerance(tolerance: float):
+    if not tolerance > 0:
+        raise ValueError(f'曲线展开的最大偏差必须大于0，实际为{tolerance}')
+
+
+def _arc_steps(radius: float, sweep: float, tolerance: float) -> int:
+    '''
+    半径为radius、圆心角为sweep（弧度）的圆弧展开为折线时需要的段数，使弦高不超过tolerance。
+    '''
+    if radius <= tolerance:
+        step = math.pi
+    else:
+        step = 2 * math.acos(1 - tolerance / radius)
+    # 至少分成三段的整圆
+    step = min(step, 2 * math.pi / 3)
+    return max(1, math.ceil(abs(sweep) / step))
+
+
+def _arc(cx: float, cy: float, rx: float, ry: float, phi: float, start: float, sweep: float, tolerance: float):
+    '''
+    椭圆弧上的点（不含起点）。椭圆的圆心为(cx, cy)，半轴为rx、ry，长轴转过phi（弧度），
+    参数角从start转过sweep（弧度，正值为逆时针）。
+    G代码中大多是只有几段的小圆弧，用列表计算比numpy数组快。
+    '''
+    n = _arc_steps(max(rx, ry), sweep, tolerance)
+    c, s = math.cos(phi), math.sin(phi)
+    xs, ys = [], []
+    for i in range(1, n + 1):
+        t = start + sweep * i / n
+        x, y = rx * math.cos(t), ry * math.sin(t)
+        xs.append(cx + c * x - s * y)
+        ys.append(cy + s * x + c * y)
+    return xs, ys
+
+
+def _bezier(points: np.ndarray, tolerance: float):
+    '''
+    二次或三次贝塞尔曲线上的点（不含起点），points是形状为(3, 2)或(4, 2)的控制点。
+    均匀取点，段数按二阶差分的上界估计，使偏差不超过tolerance。
+    '''
+    degree = len(points) - 1
+    second = np.hypot(*np.diff(points, n=2, axis=0).T).max()
+    n = max(1, math.ceil(math.sqrt(degree * (degree - 1) * second / (8 * tolerance))))
+    t = np.arange(1, n + 1)[:, np.newaxis] / n
+    if degree == 2:
+        curve = (1 - t) ** 2 * points[0] + 2 * (1 - t) * t * points[1] + t ** 2 * points[2]
+    else:
+        curve = ((1 - t) ** 3 * points[0] + 3 * (1 - t) ** 2 * t * points[1]
+                 + 3 * (1 - t) * t ** 2 * points[2] + t ** 3 * points[3])
+    return curve[:, 0], curve[:, 1]
+
+
+def _center_arc(x0: float, y0: float, x1: float, y1: float, cx: float, cy: float, clockwise: bool, tolerance: float):
+    '''
+    从(x0, y0)绕圆心(cx, cy)到(x1, y1)的圆弧上的点（不含起点），终点与起点相同时为整圆。
+    '''
+    radius = math.hypot(x0 - cx, y0 - cy)
+    start = math.atan2(y0 - cy, x0 - cx)
+    sweep = math.atan2(y1 - cy, x1 - cx) - start
+    if clockwise:
+        sweep = sweep % (-2 * math.pi) or -2 * math.pi
+    else:
+        sweep = sweep % (2 * math.pi) or 2 * math.pi
+    xs, ys = _arc(cx, cy, radius, radius, 0.0, start, sweep, tolerance)
+    # 以给定的终点结束，避免累积误差
+    xs[-1], ys[-1] = x1, y1
+    return xs, ys
+
+
+def _bulge_arc(x0: float, y0: float, x1: float, y1: float, bulge: float, tolerance: float):
+    '''
+    DXF多段线中凸度为bulge（圆心角四分之一的正切，正值为逆时针）的圆弧段上的点（不含起点）。
+    '''
+    chord = math.hypot(x1 - x0, y1 - y0)
+    if chord == 0:
+        return np.array([x1]), np.array([y1])
+    angle = 4 * math.atan(bulge)
+    radius = chord / (2 * math.sin(angle / 2))
+    # 圆心在弦的中垂线上，到弦中点的（有向）距离
+    distance = radius * math.cos(angle / 2)
+    cx = (x0 + x1) / 2 - (y1 - y0) / chord * distance
+    cy = (y0 + y1) / 2 + (x1 - x0) / chord * distance
+    return _center_arc(x0, y0, x1, y1, cx, cy, bulge < 0, tolerance)
+
+
+# G代码 ---------------------------------------------------------------------------------------------
+
+_GCODE_WORD = re.compile(r'([A-Za-z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+_GCODE_COMMENT = re.compile(r'\([^)]*\)')
+# 会移动到未知位置、无法导入的G代码
+_GCODE_UNSUPPORTED = {28, 30, 53}
+
+
+class _GcodeState:
+    '''
+    G代码的模态状态：运动方式、绝对或相对坐标、长度单位和G92设置的坐标偏移。
+    '''
+    def __init__(self):
+        self.motion = None
+        self.absolute = True
+        self.scale = 1.0
+        self.offset = (0.0, 0.0)
+
+
+@register('G 代码', '.gcode', '.nc', '.ngc', '.gc', '.tap')
+def iter_gcode(filepath: str, report: ParseReport = None, tolerance=TOLERANCE):
+    '''
+    分块解析G代码。G0为跳转，G1为标刻，G2、G3（顺时针、逆时针圆弧，I、J或R指定圆心）按tolerance展开为标刻线段。
+    支持G20、G21（英寸、毫米）、G90、G91（绝对、相对坐标）和G92（设置当前位置的坐标）。
+    Z、E、F等其它字段和M代码被忽略。
+    '''
+    _check_tolerance(tolerance)
+    if report is None:
+        report = ParseReport()
+    state = _GcodeState()
+    builder = _Builder()
+    for lineno, text, bytes_read in iter_blocks(filepath):
+        for lineno, line in enumerate(text.split('\n'), lineno):
+            _parse_gcode_line(lineno, line, state, builder, report, tolerance)
+        yield builder.take(), bytes_read
+
+
+def _parse_gcode_line(lineno: int, line: str, state: _GcodeState, builder: _Builder, report: ParseReport,
+    tolerance: float
+):
+    text = line.split(';', 1)[0]
+    if '(' in text:
+        text = _GCODE_COMMENT.sub(' ', text)
+    words = {}
+    set_position = False
+    for letter, value in _GCODE_WORD.findall(text):
+        letter = letter.upper()
+        if letter != 'G':
+            words[letter] = value
+            continue
+        code = float(value)
+        if code in (0, 1, 2, 3):
+            state.motion = int(code)
+        elif code == 20:
+            state.scale = 25.4
+        elif code == 21:
+            state.scale = 1.0
+        elif code == 90:
+            state.absolute = True
+        elif code == 91:
+            state.absolute = False
+        elif code == 92:
+            set_position = True
+        elif code in _GCODE_UNSUPPORTED:
+            report.reject(lineno, f'不支持的G代码G{value}', line)
+            return
+    # 只给出I、J的圆弧以当前位置为终点，即整圆
+    is_arc = state.motion in (2, 3) and ('I' in words or 'J' in words)
+    if 'X' not in words and 'Y' not in words and not is_arc:
+        return
+    try:
+        values = {letter: float(words[letter]) * state.scale for letter in 'XYIJR' if letter in words}
+    except ValueError:
+        report.reject(lineno, '坐标不是数字', line)
+        return
+    x, y = builder.position
+    if set_position:
+        # 当前位置的坐标设为给定的值，之后的绝对坐标都要加上偏移
+        ox, oy = state.offset
+        state.offset = (x - values['X'] if 'X' in values else ox, y - values['Y'] if 'Y' in values else oy)
+        return
+    if state.absolute:
+        x1 = values['X'] + state.offset[0] if 'X' in values else x
+        y1 = values['Y'] + state.offset[1] if 'Y' in values else y
+    else:
+        x1 = x + values.get('X', 0.0)
+        y1 = y + values.get('Y', 0.0)
+    if state.motion is None:
+        report.reject(lineno, '没有指定运动方式（G0、G1、G2或G3）', line)
+    elif state.motion == 0:
+        builder.move(x1, y1, JUMP)
+    elif state.motion == 1:
+        builder.move(x1, y1, MARK)
+    elif 'I' in values or 'J' in values:
+        cx, cy = x + values.get('I', 0.0), y + values.get('J', 0.0)
+        builder.extend(*_center_arc(x, y, x1, y1, cx, cy, state.motion == 2, tolerance), MARK)
+    elif 'R' in values:
+        center = _radius_center(x, y, x1, y1, values['R'], state.motion == 2)
+        if center is None:
+            report.reject(lineno, '圆弧的半径小于弦长的一半', line)
+        else:
+            builder.extend(*_center_arc(x, y, x1, y1, *center, state.motion == 2, tolerance), MARK)
+    else:
+        report.reject(lineno, '圆弧缺少I、J或R', line)
+
+
+def _radius_center(x0: float, y0: float, x1: float, y1: float, r: float, clockwise: bool):
+    '''
+    G2、G3以R指定半径时的圆心，R为负时取大于半圆的圆弧。无解时返回None。
+    '''
+    chord = math.hypot(x1 - x0, y1 - y0)
+    if chord == 0 or chord > 2 * abs(r) * (1 + 1e-9):
+        return None
+    distance = math.sqrt(max(r * r - chord * chord / 4, 0.0))
+    # 顺时针的小圆弧，圆心在从起点看向终点的右侧
+    if clockwise == (r > 0):
+        distance = -distance
+    cx = (x0 + x1) / 2 - (y1 - y0) / chord * distance
+    cy = (y0 + y1) / 2 + (x1 - x0) / chord * distance
+    return cx, cy
+
+
+# SVG -----------------------------------------------------------------------------------------------
+
+_SVG_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_SVG_SEPARATOR = re.compile(r'[\s,]*')
+_SVG_TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+# 各长度单位相当于多少毫米，没有单位时为px
+_SVG_UNITS = {'mm': 1.0, 'cm': 10.0, 'in': 25.4, 'pt': 25.4 / 72, 'pc': 25.4 / 6, 'px': 25.4 / 96, '': 25.4 / 96}
+# 其中的图形不直接显示的元素
+_SVG_HIDDEN = {'defs', 'clipPath', 'mask', 'symbol', 'marker', 'pattern', 'metadata', 'title', 'desc', 'style'}
+_SVG_UNSUPPORTED = {'use', 'text', 'image'}
+
+
+def _svg_length(value: str):
+    '''
+    带单位的长度，返回毫米数；没有给出或使用百分比时返回None。
+    '''
+    match = re.fullmatch(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-z]*)\s*', value or '')
+    if match is None or match.group(2) not in _SVG_UNITS:
+        return None
+    return float(match.group(1)) * _SVG_UNITS[match.group(2)]
+
+
+def _svg_numbers(text: str) -> list:
+    return [float(value) for value in _SVG_NUMBER.findall(text or '')]
+
+
+def _svg_transform(text: str) -> np.ndarray:
+    '''
+    transform属性对应的齐次变换矩阵，多个变换从左到右依次作用于外层。
+    '''
+    matrix = np.eye(3)
+    for name, args in _SVG_TRANSFORM.findall(text or ''):
+        v = _svg_numbers(args)
+        if name == 'matrix' and len(v) == 6:
+            m = np.array([[v[0], v[2], v[4]], [v[1], v[3], v[5]], [0.0, 0.0, 1.0]])
+        elif name == 'translate' and v:
+            m = translation(v[0], v[1] if len(v) > 1 else 0.0)
+        elif name == 'scale' and v:
+            m = scaling(v[0], v[1] if len(v) > 1 else v[0])
+        elif name == 'rotate' and v:
+            # SVG的y轴向下，正的角度在屏幕上是顺时针，矩阵的形式与逆时针旋转相同
+            c, s = math.cos(math.radians(v[0])), math.sin(math.radians(v[0]))
+            m = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+            if len(v) == 3:
+                m = translation(v[1], v[2]) @ m @ translation(-v[1], -v[2])
+        elif name in ('skewX', 'skewY') and v:
+            t = math.tan(math.radians(v[0]))
+            m = np.array([[1.0, t if name == 'skewX' else 0.0, 0.0], [t if name == 'skewY' else 0.0, 1.0, 0.0],
+                          [0.0, 0.0, 1.0]])
+        else:
+            continue
+        matrix = matrix @ m
+    return matrix
+
+
+class _PathLexer:
+    '''
+    逐个读取SVG路径数据中的命令、数字和圆弧的标志位（标志位可以不加分隔符连写，如"a1 1 0 00 1 1"）。
+    '''
+    def __init__(self, d: str):
+        self.d = d
+        self.pos = 0
+
+    def skip(self):
+        self.pos = _SVG_SEPARATOR.match(self.d, self.pos).end()
+
+    def at_end(self) -> bool:
+        self.skip()
+        return self.pos >= len(self.d)
+
+    def command(self):
+        '''
+        下一个字符是命令时返回它，否则（是数字，表示重复上一个命令）返回None。
+        '''
+        self.skip()
+        if self.pos < len(self.d) and self.d[self.pos].isalpha():
+            self.pos += 1
+            return self.d[self.pos - 1]
+        return None
+
+    def number(self) -> float:
+        self.skip()
+        match = _SVG_NUMBER.match(self.d, self.pos)
+        if match is None:
+            raise ValueError(f'路径数据的第{self.pos}个字符处应为数字')
+        self.pos = match.end()
+        return float(match.group())
+
+    def flag(self) -> bool:
+        self.skip()
+        if self.pos >= len(self.d) or self.d[self.pos] not in '01':
+            raise ValueError(f'路径数据的第{self.pos}个字符处应为0或1')
+        self.pos += 1
+        return self.d[self.pos - 1] == '1'
+
+
+def _svg_arc(x0, y0, rx, ry, angle, large, sweep, x1, y1, tolerance):
+    '''
+    SVG的A命令：按SVG规范附录中的方法把端点形式换算为圆心形式，返回圆弧上的点（不含起点）。
+    '''
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or (x0, y0) == (x1, y1):
+        return np.array([x1]), np.array([y1])
+    phi = math.radians(angle)
+    c, s = math.cos(phi), math.sin(phi)
+    dx, dy = (x0 - x1) / 2, (y0 - y1) / 2
+    x, y = c * dx + s * dy, -s * dx + c * dy
+    # 半径不够大时按比例放大
+    ratio = x * x / (rx * rx) + y * y / (ry * ry)
+    if ratio > 1:
+        rx, ry = rx * math.sqrt(ratio), ry * math.sqrt(ratio)
+    numerator = rx * rx * ry * ry - rx * rx * y * y - ry * ry * x * x
+    factor = math.sqrt(max(numerator, 0.0) / (rx * rx * y * y + ry * ry * x * x))
+    if large == sweep:
+        factor = -factor
+    cxp, cyp = factor * rx * y / ry, -factor * ry * x / rx
+    cx = c * cxp - s * cyp + (x0 + x1) / 2
+    cy = s * cxp + c * cyp + (y0 + y1) / 2
+    start = math.atan2((y - cyp) / ry, (x - cxp) / rx)
+    delta = math.atan2((-y - cyp) / ry, (-x - cxp) / rx) - start
+    if sweep:
+        delta = delta % (2 * math.pi)
+    else:
+        delta = delta % (-2 * math.pi)
+    xs, ys = _arc(cx, cy, rx, ry, phi, start, delta, tolerance)
+    xs[-1], ys[-1] = x1, y1
+    return xs, ys
+
+
+def _svg_path(d: str, tolerance: float):
+    '''
+    把路径数据展开为(x, y, action)列表（元素自身的坐标系），每个子路径以跳转到起点开始。
+    '''
+    lexer = _PathLexer(d)
+    xs, ys, actions = [], [], []
+    x = y = start_x = start_y = 0.0
+    # 上一个三次或二次曲线的第二个控制点，用于S、T命令
+    control = None
+    command = None
+
+    def add(px, py, action=MARK):
+        xs.extend(np.atleast_1d(px))
+        ys.extend(np.atleast_1d(py))
+        actions.extend([action] * len(np.atleast_1d(px)))
+
+    while not lexer.at_end():
+        command = lexer.command() or command
+        if command is None:
+            raise ValueError('路径数据应以M命令开始')
+        relative = command.islower()
+        ox, oy = (x, y) if relative else (0.0, 0.0)
+        upper = command.upper()
+        previous_control, control = control, None
+        if upper == 'M':
+            x, y = lexer.number() + ox, lexer.number() + oy
+            start_x, start_y = x, y
+            add(x, y, JUMP)
+            # M之后重复的坐标是L
+            command = 'l' if relative else 'L'
+        elif upper == 'L':
+            x, y = lexer.number() + ox, lexer.number() + oy
+            add(x, y)
+        elif upper == 'H':
+            x = lexer.number() + ox
+            add(x, y)
+        elif upper == 'V':
+            y = lexer.number() + oy
+            add(x, y)
+        elif upper in 'CS':
+            if upper == 'C':
+                p1 = (lexer.number() + ox, lexer.number() + oy)
+            elif previous_control is not None and previous_control[0] == 'C':
+                p1 = (2 * x - previous_control[1], 2 * y - previous_control[2])
+            else:
+                p1 = (x, y)
+            p2 = (lexer.number() + ox, lexer.number() + oy)
+            p3 = (lexer.number() + ox, lexer.number() + oy)
+            add(*_bezier(np.array([(x, y), p1, p2, p3]), tolerance))
+            control = ('C', *p2)
+            x, y = p3
+        elif upper in 'QT':
+            if upper == 'Q':
+                p1 = (lexer.number() + ox, lexer.number() + oy)
+            elif previous_control is not None and previous_control[0] == 'Q':
+                p1 = (2 * x - previous_control[1], 2 * y - previous_control[2])
+            else:
+                p1 = (x, y)
+            p2 = (lexer.number() + ox, lexer.number() + oy)
+            add(*_bezier(np.array([(x, y), p1, p2]), tolerance))
+            control = ('Q', *p1)
+            x, y = p2
+        elif upper == 'A':
+            rx, ry, angle = lexer.number(), lexer.number(), lexer.number()
+            large, sweep = lexer.flag(), lexer.flag()
+            x1, y1 = lexer.number() + ox, lexer.number() + oy
+            add(*_svg_arc(x, y, rx, ry, angle, large, sweep, x1, y1, tolerance))
+            x, y = x1, y1
+        elif upper == 'Z':
+            x, y = start_x, start_y
+            add(x, y)
+            command = None
+        else:
+            raise ValueError(f'无法识别的路径命令{command}')
+    return xs, ys, actions
+
+
+def _svg_shape_path(tag: str, attrib: dict):
+    '''
+    把基本图形换算为等价的路径数据，不是图形时返回None。
+    '''
+    def value(name):
+        numbers = _svg_numbers(attrib.get(name))
+        return numbers[0] if numbers else 0.0
+
+    if tag == 'path':
+        return attrib.get('d', '')
+    if tag == 'line':
+        return f"M{value('x1')},{value('y1')}L{value('x2')},{value('y2')}"
+    if tag in ('polyline', 'polygon'):
+        points = _svg_numbers(attrib.get('points'))
+        if len(points) < 4:
+            return ''
+        d = 'M' + ' '.join(f'{v}' for v in points[:len(points) // 2 * 2])
+        return d + 'Z' if tag == 'polygon' else d
+    if tag in ('circle', 'ellipse'):
+        cx, cy = value('cx'), value('cy')
+        rx = value('r') if tag == 'circle' else value('rx')
+        ry = value('r') if tag == 'circle' else value('ry')
+        if rx <= 0 or ry <= 0:
+            return ''
+        return f'M{cx + rx},{cy}A{rx},{ry} 0 1 1 {cx - rx},{cy}A{rx},{ry} 0 1 1 {cx + rx},{cy}Z'
+    if tag == 'rect':
+        x, y, w, h = value('x'), value('y'), value('width'), value('height')
+        if w <= 0 or h <= 0:
+            return ''
+        rx = value('rx') if 'rx' in attrib else value('ry')
+        ry = value('ry') if 'ry' in attrib else rx
+        rx, ry = min(rx, w / 2), min(ry, h / 2)
+        if rx <= 0 or ry <= 0:
+            return f'M{x},{y}H{x + w}V{y + h}H{x}Z'
+        return (
+            f'M{x + rx},{y}H{x + w - rx}A{rx},{ry} 0 0 1 {x + w},{y + ry}V{y + h - ry}'
+            f'A{rx},{ry} 0 0 1 {x + w - rx},{y + h}H{x + rx}A{rx},{ry} 0 0 1 {x},{y + h - ry}'
+            f'V{y + ry}A{rx},{ry} 0 0 1 {x + rx},{y}Z'
+        )
+    return None
+
+
+def _svg_root_matrix(attrib: dict) -> np.ndarray:
+    '''
+    从根元素的用户坐标换算为毫米的矩阵：按viewBox和width、height缩放，并把y轴翻转为向上，
+    使图形的左下角落在原点附近。
+    '''
+    view_box = _svg_numbers(attrib.get('viewBox'))
+    width, height = _svg_length(attrib.get('width')), _svg_length(attrib.get('height'))
+    if len(view_box) == 4 and view_box[2] > 0 and view_box[3] > 0:
+        vx, vy, vw, vh = view_box
+        sx = width / vw if width else _SVG_UNITS['px']
+        sy = height / vh if height else sx
+    else:
+        sx = sy = _SVG_UNITS['px']
+        vx = vy = 0.0
+        vh = height / sy if height else 0.0
+    return scaling(sx, -sy) @ translation(-vx, -(vy + vh))
+
+
+@register('SVG 文件', '.svg')
+def iter_svg(filepath: str, report: ParseReport = None, tolerance=TOLERANCE):
+    '''
+    流式解析SVG文件中的path、line、polyline、polygon、rect、circle和ellipse，
+    按各层的transform换算坐标，曲线按tolerance展开。不支持的元素（如文字、use）记录在report中。
+    已处理的元素立即从树中移除，内存占用与文件大小无关。
+    '''
+    _check_tolerance(tolerance)
+    if report is None:
+        report = ParseReport()
+    builder = _Builder()
+    # 各层元素及其变换矩阵，hidden是处于不显示的元素（如defs）之内的层数
+    stack = []
+    hidden = 0
+    with open(filepath, 'rb') as f:
+        try:
+            for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+                tag = element.tag.rpartition('}')[2]
+                if event == 'start':
+                    parent = stack[-1][1] if stack else None
+                    matrix = _svg_root_matrix(element.attrib) if parent is None else parent
+                    stack.append((element, matrix @ _svg_transform(element.get('transform'))))
+                    if tag in _SVG_HIDDEN or element.get('display') == 'none':
+                        hidden += 1
+                    continue
+                _, matrix = stack.pop()
+                if tag in _SVG_HIDDEN or element.get('display') == 'none':
+                    hidden -= 1
+                elif not hidden:
+                    _svg_element(tag, element, matrix, builder, report, tolerance)
+                element.clear()
+                if stack:
+                    stack[-1][0].remove(element)
+                if len(builder) >= CHUNK_ROWS:
+                    yield builder.take(), f.tell()
+        except ElementTree.ParseError as e:
+            report.reject(e.position[0], f'XML格式有误：{e}')
+        yield builder.take(), f.tell()
+
+
+def _svg_element(tag: str, element, matrix: np.ndarray, builder: _Builder, report: ParseReport, tolerance: float):
+    if tag in _SVG_UNSUPPORTED:
+        report.reject(0, f'不支持的元素<{tag}>', element.get('id', ''))
+        return
+    d = _svg_shape_path(tag, element.attrib)
+    if not d:
+        return
+    # 在元素自身的坐标系中展开曲线，误差按变换的平均缩放比例换算
+    scale = math.sqrt(abs(np.linalg.det(matrix[:2, :2]))) or 1.0
+    try:
+        xs, ys, actions = _svg_path(d, tolerance / scale)
+    except ValueError as e:
+        report.reject(0, f'<{tag}>的路径数据有误：{e}', element.get('id', ''))
+        return
+    if not xs:
+        return
+    x = np.asarray(xs)
+    y = np.asarray(ys)
+    tx = matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2]
+    ty = matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2]
+    for px, py, action in zip(tx.tolist(), ty.tolist(), actions):
+        builder.move(px, py, action)
+
+
+# DXF -----------------------------------------------------------------------------------------------
+
+# $INSUNITS的值对应的单位相当于多少毫米，0（未指定）按毫米处理
+_DXF_UNITS = {0: 1.0, 1: 25.4, 2: 304.8, 4: 1.0, 5: 10.0, 6: 1000.0, 8: 25.4e-6, 9: 25.4e-3, 10: 914.4}
+_DXF_ENTITIES = {'LINE', 'LWPOLYLINE', 'ARC', 'CIRCLE'}
+# 坐标在图元坐标系（OCS）中给出的图元，LINE的端点是世界坐标
+_DXF_OCS_ENTITIES = {'LWPOLYLINE', 'ARC', 'CIRCLE'}
+
+
+def _dxf_pairs(filepath: str):
+    '''
+    逐个产生DXF文件中的(组码, 值, 行号, 已读取字节数)，组码和值各占一行。
+    '''
+    code = None
+    for lineno, text, bytes_read in iter_blocks(filepath):
+        for lineno, line in enumerate(text.split('\n'), lineno):
+            if code is None:
+                code = line
+                continue
+            try:
+                yield int(code), line.strip(), lineno, bytes_read
+            except ValueError:
+                raise ValueError(f'第{lineno - 1}行的组码不是整数，可能不是文本格式的DXF文件') from None
+            code = None
+
+
+class _DxfEntity:
+    '''
+    正在读取的图元。codes保存各组码最后一次的值，LWPOLYLINE的顶点按顺序保存在vertices中。
+    '''
+    def __init__(self, kind: str, lineno: int):
+        self.kind = kind
+        self.lineno = lineno
+        self.codes = {}
+        self.vertices = []
+
+    def add(self, code: int, value: str):
+        if self.kind == 'LWPOLYLINE' and code in (10, 20, 42):
+            if code == 10:
+                self.vertices.append([float(value), 0.0, 0.0])
+            elif self.vertices:
+                self.vertices[-1][1 if code == 20 else 2] = float(value)
+            return
+        self.codes[code] = value
+
+    def number(self, code: int, default=None) -> float:
+        if code not in self.codes:
+            if default is None:
+                raise ValueError(f'缺少组码{code}')
+            return default
+        return float(self.codes[code])
+
+
+@register('DXF 文件', '.dxf')
+def iter_dxf(filepath: str, report: ParseReport = None, tolerance=TOLERANCE):
+    '''
+    流式解析文本格式的DXF文件中ENTITIES段的LINE、LWPOLYLINE（包括凸度表示的圆弧段）、ARC和CIRCLE，
+    按$INSUNITS换算为毫米。前后相连的图元之间不插入跳转。其它图元记录在report中。
+    '''
+    _check_tolerance(tolerance)
+    if report is None:
+        report = ParseReport()
+    builder = _Builder()
+    scale = 1.0
+    section = None
+    variable = None
+    entity = None
+    expect_name = False
+    bytes_read = 0
+    try:
+        for code, value, lineno, bytes_read in _dxf_pairs(filepath):
+            if code == 0:
+                if entity is not None:
+                    _dxf_entity(entity, scale, builder, report, tolerance)
+                    entity = None
+                    if len(builder) >= CHUNK_ROWS:
+                        yield builder.take(), bytes_read
+                if value == 'SECTION':
+                    expect_name = True
+                elif value == 'ENDSEC':
+                    section = None
+                elif section == 'ENTITIES':
+                    entity = _DxfEntity(value, lineno)
+                continue
+            if expect_name and code == 2:
+                section = value
+                expect_name = False
+            elif section == 'HEADER':
+                if code == 9:
+                    variable = value
+                elif variable == '$INSUNITS' and code == 70:
+                    scale = _DXF_UNITS.get(int(value), 1.0)
+            elif entity is not None:
+                entity.add(code, value)
+    except ValueError as e:
+        report.reject(0, str(e))
+    if entity is not None:
+        _dxf_entity(entity, scale, builder, report, tolerance)
+    yield builder.take(), bytes_read
+
+
+def _dxf_entity(entity: _DxfEntity, scale: float, builder: _Builder, report: ParseReport, tolerance: float):
+    if entity.kind not in _DXF_ENTITIES:
+        report.reject(entity.lineno, f'不支持的图元{entity.kind}')
+        return
+    # 拉伸方向为(0, 0, -1)时图元坐标系左右翻转，世界坐标不受影响
+    mirror = -1.0 if entity.kind in _DXF_OCS_ENTITIES and entity.number(230, 1.0) < 0 else 1.0
+    local = tolerance / scale
+    try:
+        if entity.kind == 'LINE':
+            points = [(entity.number(10), entity.number(20)), (entity.number(11), entity.number(21))]
+            xs, ys = np.array([points[1][0]]), np.array([points[1][1]])
+            start = points[0]
+        elif entity.kind in ('ARC', 'CIRCLE'):
+            cx, cy, r = entity.number(10), entity.number(20), entity.number(40)
+            a0 = math.radians(entity.number(50, 0.0))
+            a1 = math.radians(entity.number(51, 360.0))
+            sweep = (a1 - a0) % (2 * math.pi) or 2 * math.pi
+            start = (cx + r * math.cos(a0), cy + r * math.sin(a0))
+            xs, ys = _arc(cx, cy, r, r, 0.0, a0, sweep, local)
+        else:
+            vertices = entity.vertices
+            if not vertices:
+                return
+            if int(entity.number(70, 0.0)) & 1:
+                vertices = vertices + [vertices[0]]
+            start = tuple(vertices[0][:2])
+            xs, ys = [], []
+            for (x0, y0, bulge), (x1, y1, _) in zip(vertices, vertices[1:]):
+                if bulge:
+                    px, py = _bulge_arc(x0, y0, x1, y1, bulge, local)
+                else:
+                    px, py = [x1], [y1]
+                xs.extend(px)
+                ys.extend(py)
+    except (ValueError, ZeroDivisionError) as e:
+        report.reject(entity.lineno, f'{entity.kind}的参数有误：{e}')
+        return
+    builder.move(mirror * start[0] * scale, start[1] * scale, JUMP)
+    builder.extend(mirror * np.asarray(xs, dtype=np.float64) * scale, np.asarray(ys, dtype=np.float64) * scale, MARK)
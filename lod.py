@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class _TiledSegments:
+    '''
+    按分块排序保存的一组线段，用于快速取出与可见区域相交的线段。
+    包围盒不超过一个分块的线段按中点所在的分块排序，其余的线段单独保存。
+    '''
+    def __init__(self, x0, y0, x1, y1, bounds, tiles):
+        self.bounds = bounds
+        self.tiles = tiles
+        xmin, ymin, extent = bounds
+        self.tile_size = extent / tiles
+
+        long = (np.abs(x1 - x0) > self.tile_size) | (np.abs(y1 - y0) > self.tile_size)
+        self.long = tuple(v[long].astype(np.float32) for v in (x0, y0, x1, y1))
+
+        short = ~long
+        x0, y0, x1, y1 = (v[short] for v in (x0, y0, x1, y1))
+        tx = self._tile((x0 + x1) / 2, xmin)
+        ty = self._tile((y0 + y1) / 2, ymin)
+        key = ty * tiles + tx
+        order = np.argsort(key, kind='stable')
+        self.short = tuple(v[order].astype(np.float32) for v in (x0, y0, x1, y1))
+        # offsets[k]是第k个分块中第一条线段的位置
+        self.offsets = np.searchsorted(key[order], np.arange(tiles * tiles + 1))
+
+    def __len__(self):
+        return len(self.short[0]) + len(self.long[0])
+
+    def _tile(self, values, origin):
+        return np.clip(((values - origin) / self.tile_size).astype(np.int64), 0, self.tiles - 1)
+
+    def query(self, xlim, ylim) -> tuple:
+        '''
+        返回包围盒与矩形区域相交的线段的起点x、起点y、终点x、终点y。
+        '''
+        xmin, ymin, _ = self.bounds
+        # 中点在区域外一个分块以内的短线段都可能与区域相交
+        tx0, tx1 = self._tile(np.array(xlim), xmin) + (-1, 1)
+        ty0, ty1 = self._tile(np.array(ylim), ymin) + (-1, 1)
+        tx0, ty0 = max(tx0, 0), max(ty0, 0)
+        tx1, ty1 = min(tx1, self.tiles - 1), min(ty1, self.tiles - 1)
+        ranges = [
+            (self.offsets[row * self.tiles + tx0], self.offsets[row * self.tiles + tx1 + 1])
+            for row in range(ty0, ty1 + 1)
+        ]
+        index = np.concatenate([np.arange(start, end) for start, end in ranges] or [np.empty(0, np.int64)])
+        short = tuple(v[index] for v in self.short)
+
+        x0, y0, x1, y1 = (np.concatenate((s, l)) for s, l in zip(short, self.long))
+        visible = (
+            (np.maximum(x0, x1) >= xlim[0]) & (np.minimum(x0, x1) <= xlim[1]) &
+            (np.maximum(y0, y1) >= ylim[0]) & (np.minimum(y0, y1) <= ylim[1])
+        )
+        return x0[visible], y0[visible], x1[visible], y1[visible]
+
+
+class LodIndex:
+    '''
+    线段的多分辨率索引，用于大量线段的预览。
+    每一层把线段端点吸附到一个正方形网格的格点上，去掉缩成一点的线段和重复的线段，
+    网格从每边MIN_CELLS格开始逐层加密一倍，直到MAX_CELLS格，另有一层保存原始线段。
+    查询时选取网格不大于一个像素的最粗的一层，再只取出可见区域内的线段，
+    因此缩放和平移时只需重新查询，放大后显示的细节也随之增加。
+    '''
+    MIN_CELLS = 1 << 8
+    MAX_CELLS = 1 << 15
+    TILES = 64
+    # 抽稀后剩余的线段超过这一比例时，这一层直接使用原始线段
+    MIN_REDUCTION = 0.9
+
+    def __init__(self, x0, y0, x1, y1):
+        x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+        self.levels = []
+        self.raw = None
+        if len(x0) == 0:
+            return
+        xs = np.concatenate((x0, x1))
+        ys = np.concatenate((y0, y1))
+        xmin, ymin = xs.min(), ys.min()
+        extent = max(xs.max() - xmin, ys.max() - ymin) or 1.0
+        # 稍微放大范围，使最大的坐标也落在网格之内
+        extent *= 1 + 1e-9
+        bounds = (xmin, ymin, extent)
+        self.raw = _TiledSegments(x0, y0, x1, y1, bounds, self.TILES)
+
+        cells = self.MAX_CELLS
+        cell_size = extent / cells
+        ends = [
+            np.minimum(((v - origin) / cell_size).astype(np.int64), cells - 1)
+            for v, origin in ((x0, xmin), (y0, ymin), (x1, xmin), (y1, ymin))
+        ]
+        while cells >= self.MIN_CELLS:
+            ends = self._decimate(ends, cells)
+            cell_size = extent / cells
+            if len(ends[0]) < self.MIN_REDUCTION * len(self.raw):
+                x0, y0, x1, y1 = (
+                    (v + 0.5) * cell_size + origin
+                    for v, origin in zip(ends, (xmin, ymin, xmin, ymin))
+                )
+                self.levels.append((cell_size, _TiledSegments(x0, y0, x1, y1, bounds, self.TILES)))
+            ends = [v >> 1 for v in ends]
+            cells >>= 1
+        # 按网格从粗到细排列
+        self.levels.reverse()
+
+    @staticmethod
+    def _decimate(ends, cells) -> list:
+        '''
+        去掉两端落在同一格内的线段，以及端点所在格子相同的重复线段（不区分方向）。
+        '''
+        ix0, iy0, ix1, iy1 = ends
+        a = ix0 * cells + iy0
+        b = ix1 * cells + iy1
+        keep = a != b
+        a, b = a[keep], b[keep]
+        key = np.sort(np.minimum(a, b) * (cells * cells) + np.maximum(a, b))
+        key = key[np.concatenate((key[:1] == key[:1], key[1:] != key[:-1]))]
+        a, b = np.divmod(key, cells * cells)
+        return [a // cells, a % cells, b // cells, b % cells]
+
+    def __len__(self):
+        return 0 if self.raw is None else len(self.raw)
+
+    def query(self, xlim, ylim, pixel_size) -> tuple:
+        '''
+        返回在区域内按pixel_size的精度显示所需的线段，
+        结果是以NaN分隔的x、y数组，可以直接作为一条曲线绘制。
+        '''
+        if self.raw is None:
+            return np.empty(0), np.empty(0)
+        tiled = self.raw
+        for cell_size, level in self.levels:
+            if cell_size <= pixel_size:
+                tiled = level
+                break
+        x0, y0, x1, y1 = tiled.query(xlim, ylim)
+        nan = np.full(len(x0), np.nan, dtype=np.float32)
+        return np.stack((x0, x1, nan), axis=1).ravel(), np.stack((y0, y1, nan), axis=1).ravel()
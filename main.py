@@ -1,12 +1,24 @@
 import sys
 import os
-from PySide2.QtCore import Signal, QRegExp
+import time
+# 启动计时的起点，--startup-report时报告导入和创建窗口的耗时
+STARTED = time.perf_counter_ns()
+import argparse
+import importlib
+from PySide2.QtCore import (
+    Signal, QRegExp, Qt, QAbstractTableModel, QModelIndex, QTimer, QThread, QItemSelection, QItemSelectionModel,
+    QSettings
+)
 from PySide2.QtWidgets import *
-from PySide2.QtGui import QFont, QIntValidator, QRegExpValidator
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-import matplotlib.patches as patches
+from PySide2.QtGui import QFont, QIntValidator, QKeySequence, QRegExpValidator
 from tools import *
+from cache import DbdCache
+from history import DeleteRows, History, InsertRows, MoveRow, Replace, Repeat, SetValue, Transform
+from importers import file_filter, find_importer
+from profiling import profiler
+from optimize import optimize, simplify
+# 预览用到的matplotlib在窗口显示以后才导入，见MainWindow.start_preview_loader
+IMPORTED = time.perf_counter_ns()
 
 
 def mm2inch(value, round_count=3):
@@ -17,34 +29,6 @@ def inch2mm(value, round_count=3):
     return round(value * 25.4, round_count)   
 
 
-class Point:
-    def __init__(self, x=0, y=0, action='jump'):
-        self.x = float(x)
-        self.y = float(y)
-        self.action = action
-
-    def __str__(self):
-        return f'({self.x}, {self.y})'
-
-
-class Line:
-    def __init__(self, point1=Point(), point2=Point()):
-        self.point1 = point1
-        self.point2 = point2
-
-    def x1x2(self):
-        return self.point1.x, self.point2.x
-
-    def y1y2(self):
-        return self.point1.y, self.point2.y
-
-    def color(self):
-        return 'blue' if self.point2.action == 'jump' else 'red'
-
-    def __str__(self):
-        return f'{self.point1} -> {self.point2}'
-    
-
 class CanvasParams:
     def __init__(self):
         self.X = 30
@@ -67,6 +51,11 @@ class CanvasParams:
         return self.y(unit) - 1.125*self.r(unit), self.y(unit) + 1.125*self.r(unit)
 
 
+def toolpath_rows(window, *args, **kwargs) -> dict:
+    # 耗时记录中附加的行数
+    return {'rows': len(window.toolpath)}
+
+
 class NumberLineEdit(QLineEdit):
     '''
     重写QLineEdit，使其只能输入数字和小数点
@@ -87,11 +76,362 @@ class NumberLineEdit(QLineEdit):
             self.setText('0')
 
 
+class MovementTableModel(QAbstractTableModel):
+    '''
+    以Toolpath为数据源的表格模型。
+    表格只在显示或编辑某个单元格时才读写Toolpath中对应的元素，不为每一行创建控件。
+    Toolpath中的坐标以毫米为单位，显示和编辑时按unit换算。
+    可以撤销的编辑通过execute()执行并记录在history中；set_value、insert_rows等方法只修改数据并发出信号，不记录。
+    '''
+    history_changed = Signal()
+
+    def __init__(self, toolpath=None, parent=None):
+        super().__init__(parent)
+        self.toolpath = toolpath if toolpath is not None else Toolpath()
+        self.unit = 'mm'
+        self.scale = UNIT_SCALE[self.unit]
+        self.history = History()
+        # 为False时单元格不能编辑，如后台读写文件期间
+        self.editable = True
+
+    def set_toolpath(self, toolpath: Toolpath):
+        self.beginResetModel()
+        self.toolpath = toolpath
+        self.endResetModel()
+
+    def set_unit(self, unit: str):
+        '''
+        坐标始终以毫米保存，改变单位只改变显示，不修改数据，也不发出dataChanged。
+        '''
+        self.unit = unit
+        self.scale = UNIT_SCALE[unit]
+        self.headerDataChanged.emit(Qt.Horizontal, 0, 1)
+        # 让表格重新读取可见的单元格
+        self.layoutAboutToBeChanged.emit()
+        self.layoutChanged.emit()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.toolpath)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 3
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        row, col = index.row(), index.column()
+        if col == 0:
+            return f'{self.toolpath.x[row] / self.scale:.6f}'
+        if col == 1:
+            return f'{self.toolpath.y[row] / self.scale:.6f}'
+        return ACTIONS[self.toolpath.action[row]]
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        row, col = index.row(), index.column()
+        try:
+            if col == 0:
+                old, new = float(self.toolpath.x[row]), float(value) * self.scale
+            elif col == 1:
+                old, new = float(self.toolpath.y[row]), float(value) * self.scale
+            else:
+                old, new = int(self.toolpath.action[row]), action_code(value)
+        except ValueError:
+            return False
+        if new != old:
+            self.execute(SetValue(row, col, old, new))
+        return True
+
+    def set_value(self, row: int, column: int, value):
+        '''
+        修改一个单元格，value是以毫米为单位的坐标或动作编码。
+        '''
+        self.toolpath.set_row(row, **{('x', 'y', 'action')[column]: value})
+        index = self.index(row, column)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+
+    def flags(self, index):
+        flags = super().flags(index)
+        return flags | Qt.ItemIsEditable if self.editable else flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return str(section + 1)
+        return (f'X/{self.unit}', f'Y/{self.unit}', '动作')[section]
+
+    def insert_rows(self, row: int, rows: Toolpath):
+        self.beginInsertRows(QModelIndex(), row, row + len(rows) - 1)
+        self.toolpath.insert_rows(row, rows)
+        self.endInsertRows()
+
+    def remove_rows(self, row: int, count: int):
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        self.toolpath.delete(row, count)
+        self.endRemoveRows()
+
+    def move_row(self, row: int, new_row: int):
+        # beginMoveRows的目标位置是移动前的行号，下移时要再加1
+        destination = new_row + 1 if new_row > row else new_row
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+        self.toolpath.move(row, new_row)
+        self.endMoveRows()
+
+    def reset(self):
+        '''
+        就地整体修改了坐标序列（如变换）之后调用，只重置一次模型。
+        '''
+        self.beginResetModel()
+        self.endResetModel()
+
+    def execute(self, command):
+        '''
+        执行一次可以撤销的编辑（history中的命令）并记录下来。
+        '''
+        with profiler.span(f'execute {type(command).__name__}', rows=len(self.toolpath)):
+            command.redo(self)
+        self.history.push(command)
+        self.history_changed.emit()
+
+    def undo(self):
+        with profiler.span('undo', rows=len(self.toolpath)):
+            self.history.undo(self)
+        self.history_changed.emit()
+
+    def redo(self):
+        with profiler.span('redo', rows=len(self.toolpath)):
+            self.history.redo(self)
+        self.history_changed.emit()
+
+    def clear_history(self):
+        self.history.clear()
+        self.history_changed.emit()
+
+
+class CoordinateDelegate(QStyledItemDelegate):
+    '''
+    坐标列的编辑器，只能输入数字、负号和小数点。
+    '''
+    def createEditor(self, parent, option, index):
+        editor = QLineEdit(parent)
+        editor.setValidator(QRegExpValidator(QRegExp(r'^-?\d*(\.\d*)?$'), editor))
+        return editor
+
+
+class ActionDelegate(QStyledItemDelegate):
+    '''
+    动作列的编辑器，只在编辑时创建一个下拉框，选择后立即写回模型。
+    '''
+    def createEditor(self, parent, option, index):
+        combo = QComboBox(parent)
+        combo.addItems(ACTIONS)
+        combo.activated.connect(lambda: self.commitData.emit(combo))
+        return combo
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+
+class TransformDialog(QDialog):
+    '''
+    输入变换参数的对话框。fields是(名称, 标签, 默认值)的列表，默认值为浮点数、整数或选项的元组。
+    selection是选中的(起始行, 结束行)，有选中的行时可以只变换这些行。
+    '''
+    def __init__(self, title: str, fields, selection=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        form = QFormLayout(self)
+        self.widgets = {}
+        for name, label, value in fields:
+            if isinstance(value, tuple):
+                widget = QComboBox()
+                widget.addItems(value)
+            elif isinstance(value, int):
+                widget = QSpinBox()
+                widget.setRange(1, 10000)
+                widget.setValue(value)
+            else:
+                widget = QDoubleSpinBox()
+                widget.setRange(-1e9, 1e9)
+                widget.setDecimals(6)
+                widget.setValue(value)
+            form.addRow(label, widget)
+            self.widgets[name] = widget
+        self.check_selection = QCheckBox('只变换选中的行')
+        if selection is not None:
+            start, stop = selection
+            self.check_selection.setText(f'只变换选中的行（第{start + 1}-{stop}行）')
+            self.check_selection.setChecked(stop - start > 1)
+        else:
+            self.check_selection.setEnabled(False)
+        form.addRow(self.check_selection)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        form.addRow(buttons)
+
+    def values(self) -> dict:
+        values = {}
+        for name, widget in self.widgets.items():
+            values[name] = widget.currentText() if isinstance(widget, QComboBox) else widget.value()
+        return values
+
+
+class WriteWorker(QThread):
+    '''
+    在后台线程中调用write_dbd等写文件函数，通过progress信号报告进度（百分比）。
+    调用requestInterruption()可以取消写入，此时原有的文件保持不变。
+    结束后cancelled表示是否被取消，error是失败的原因。
+    '''
+    progress = Signal(int)
+
+    def __init__(self, write, filepath: str, toolpath: Toolpath, parent=None):
+        super().__init__(parent)
+        self.write = write
+        self.filepath = filepath
+        self.toolpath = toolpath
+        self.cancelled = False
+        self.error = ''
+
+    def run(self):
+        try:
+            with profiler.span('save.write', rows=len(self.toolpath)):
+                self.write(self.filepath, self.toolpath, progress=self.report_progress)
+        except Cancelled:
+            self.cancelled = True
+        except OSError as e:
+            self.error = str(e)
+
+    def report_progress(self, done: int, total: int):
+        if self.isInterruptionRequested():
+            raise Cancelled()
+        self.progress.emit(done * 100 // total)
+
+
+class ReadWorker(QThread):
+    '''
+    在后台线程中分块解析文件，iterate(filepath, report)逐块产生(Toolpath, 已读取字节数)，如iter_dbd。
+    坐标乘以scale换算为毫米，scale为None时按文件头中的Unit换算。
+    progress信号报告进度（百分比）；header_parsed在文件头完整后发出一次；
+    partial发出已解析的部分，用于逐步显示，行数至少增加一倍才再次发出，拼接的总开销与已显示的行数成正比。
+    调用requestInterruption()可以取消。结束后toolpath是解析的结果，report记录不能解析的行，
+    cancelled表示是否被取消，error是失败的原因。
+    '''
+    progress = Signal(int)
+    header_parsed = Signal(dict)
+    partial = Signal(object)
+    # 两次发出partial至少间隔的秒数
+    PARTIAL_INTERVAL = 0.5
+    # 超过这一行数后不再发出partial。与Preview.LOD_THRESHOLD相同：行数更多时预览要在主线程中
+    # 重建多分辨率索引，需要数秒，期间界面无法响应取消
+    PARTIAL_ROWS = 200000
+
+    def __init__(self, iterate, filepath: str, scale: float = None, name='read', parent=None):
+        super().__init__(parent)
+        self.iterate = iterate
+        self.filepath = filepath
+        self.scale = scale
+        self.name = name
+        self.toolpath = None
+        self.report = ParseReport()
+        self.cancelled = False
+        self.error = ''
+
+    def run(self):
+        try:
+            with profiler.span(self.name, file=os.path.basename(self.filepath)) as span:
+                self.toolpath = self.read()
+                span.set(rows=len(self.toolpath))
+        except Cancelled:
+            self.cancelled = True
+        except OSError as e:
+            self.error = str(e)
+        except Exception as e:
+            # 如内存不足或导入函数中的错误，异常不能传出线程，作为失败的原因报告
+            self.toolpath = None
+            self.error = f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+
+    def read(self) -> Toolpath:
+        size = os.path.getsize(self.filepath)
+        chunks = []
+        header_complete = False
+        rows = shown = 0
+        shown_time = time.perf_counter()
+        for chunk, bytes_read in self.iterate(self.filepath, self.report):
+            if self.isInterruptionRequested():
+                raise Cancelled()
+            chunks.append(chunk)
+            rows += len(chunk)
+            if not header_complete and DEFAULT_HEADER.keys() <= chunk.header.keys():
+                header_complete = True
+                self.header_parsed.emit(dict(chunk.header))
+            self.progress.emit(bytes_read * 100 // size if size else 100)
+            # 第一块立即显示
+            if (rows > 2 * shown and rows <= self.PARTIAL_ROWS
+                    and (not shown or time.perf_counter() - shown_time > self.PARTIAL_INTERVAL)):
+                self.partial.emit(self.combine(chunks))
+                shown = rows
+                shown_time = time.perf_counter()
+        return self.combine(chunks)
+
+    def combine(self, chunks: list) -> Toolpath:
+        '''
+        拼接各块并换算为毫米。拼接得到的是新的数组，不会修改各块（它们可能还要保存到缓存中）。
+        '''
+        header = dict(chunks[-1].header) if chunks else {}
+        toolpath = Toolpath.concatenate(chunks, header)
+        scale = self.scale if self.scale is not None else UNIT_SCALE.get(header.get('Unit'), 1.0)
+        if scale != 1.0:
+            toolpath.transform(scaling(scale))
+        return toolpath
+
+
+class PreviewLoader(QThread):
+    '''
+    在后台线程中导入预览模块及其依赖的matplotlib，分别记录每个模块的导入耗时。
+    只导入模块，控件仍由主线程创建。结束后error是失败的原因。
+    '''
+    MODULES = ('matplotlib', 'matplotlib.figure', 'matplotlib.backends.backend_qt5agg', 'preview')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.error = ''
+
+    def run(self):
+        try:
+            for name in self.MODULES:
+                with profiler.span(f'import {name}'):
+                    importlib.import_module(name)
+        except ImportError as e:
+            self.error = str(e)
+
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # 预览创建完成
+    preview_ready = Signal()
+
+    # 修改后等待多久再重新估算加工时间（毫秒）
+    ESTIMATE_DELAY = 200
+    # 窗口显示后等待多久再开始在后台加载预览（毫秒），使表单先完成绘制
+    PREVIEW_DELAY = 100
+    # 耗时面板中列出的最近操作数和刷新间隔（毫秒）
+    PROFILE_ROWS = 200
+    PROFILE_INTERVAL = 500
+
+    def __init__(self, lazy_preview=False):
+        '''
+        预览在窗口显示后于后台加载；lazy_preview为True时只在点击“显示预览”后才加载。
+        '''
         super().__init__()
 
-        self.canvas_update_needed = True
+        # 预览加载完成前为None
+        self.preview = None
+        self.preview_loader = None
 
         # 基本设置
         self.setGeometry(100, 100, 1200, 800)
@@ -105,7 +445,7 @@ class MainWindow(QMainWindow):
         self.action_open = QAction('打开', self)
         self.action_save = QAction('保存', self)
         self.action_csv_example = QAction('创建示例csv文件', self)
-        self.action_import = QAction('从csv文件导入坐标序列', self)
+        self.action_import = QAction('导入坐标序列（csv、G代码、SVG、DXF）', self)
         self.action_exit = QAction('关闭', self)
 
         self.action_new.setShortcut('Ctrl+N')
@@ -129,6 +469,63 @@ class MainWindow(QMainWindow):
         self.action_import.triggered.connect(self.action_import_slot)
         self.action_exit.triggered.connect(self.close)
 
+        # 菜单栏 -> 编辑
+        self.menu_edit = self.menu_bar.addMenu('编辑')
+
+        self.action_undo = QAction('撤销', self)
+        self.action_redo = QAction('重做', self)
+
+        self.action_undo.setShortcut(QKeySequence.Undo)
+        self.action_redo.setShortcut(QKeySequence.Redo)
+        self.action_undo.setEnabled(False)
+        self.action_redo.setEnabled(False)
+
+        self.menu_edit.addAction(self.action_undo)
+        self.menu_edit.addAction(self.action_redo)
+
+        self.action_undo.triggered.connect(self.action_undo_slot)
+        self.action_redo.triggered.connect(self.action_redo_slot)
+
+        # 菜单栏 -> 工具
+        self.menu_tools = self.menu_bar.addMenu('工具')
+
+        self.action_optimize = QAction('优化标刻顺序', self)
+        self.action_simplify = QAction('简化路径', self)
+        self.action_cache = QAction('缓存打开过的大文件', self)
+        self.action_clear_cache = QAction('清空缓存', self)
+        self.action_check_bounds = QAction('检查工作区域', self)
+
+        # 缓存会在用户的缓存目录中写入最多DbdCache.MAX_BYTES字节，默认不开启，选择保存在设置中
+        self.settings = QSettings('dbd-maker', 'dbd-maker')
+        self.action_cache.setCheckable(True)
+        self.action_cache.setChecked(self.settings.value('cache/enabled', False, type=bool))
+
+        self.menu_tools.addAction(self.action_optimize)
+        self.menu_tools.addAction(self.action_simplify)
+        self.menu_tools.addAction(self.action_check_bounds)
+        self.menu_transform = self.menu_tools.addMenu('变换')
+        for name, slot in (
+            ('平移', self.action_translate_slot), ('缩放', self.action_scale_slot),
+            ('旋转', self.action_rotate_slot), ('镜像', self.action_mirror_slot),
+            ('阵列复制', self.action_repeat_slot)
+        ):
+            self.menu_transform.addAction(name).triggered.connect(slot)
+        self.menu_tools.addSeparator()
+        self.menu_tools.addAction(self.action_cache)
+        self.menu_tools.addAction(self.action_clear_cache)
+        self.menu_tools.addSeparator()
+        self.action_profile = self.menu_tools.addAction('记录耗时')
+        self.action_profile.setCheckable(True)
+        self.action_profile.setChecked(profiler.enabled)
+        self.action_profile.toggled.connect(self.action_profile_slot)
+        self.menu_tools.addAction('导出耗时记录').triggered.connect(self.action_export_profile_slot)
+
+        self.action_optimize.triggered.connect(self.action_optimize_slot)
+        self.action_simplify.triggered.connect(self.action_simplify_slot)
+        self.action_cache.toggled.connect(self.action_cache_slot)
+        self.action_clear_cache.triggered.connect(self.action_clear_cache_slot)
+        self.action_check_bounds.triggered.connect(self.action_check_bounds_slot)
+
         # 菜单栏 -> 帮助
         self.help_menu = self.menu_bar.addMenu('帮助')
 
@@ -190,6 +587,12 @@ class MainWindow(QMainWindow):
         self.grid0.addWidget(self.line_markSpeed, 5, 1)
         self.grid0.addWidget(QLabel('mm/s'), 5, 2)
 
+        # 速度以mm/s保存完整的精度，表单中只显示按当前单位换算并取整后的值
+        self.speeds = {}
+        self.converting_units = False
+        for key, line in (('JumpSpeed', self.line_jumpSpeed), ('MarkSpeed', self.line_markSpeed)):
+            line.textChanged.connect(lambda text, key=key: self.speed_changed(key, text))
+
         self.grid0.addWidget(QLabel('跳转延迟'), 6, 0)
         self.line_jumpDelay = NumberLineEdit()
         self.grid0.addWidget(self.line_jumpDelay, 6, 1)
@@ -205,6 +608,22 @@ class MainWindow(QMainWindow):
         self.grid0.addWidget(self.line_stepPeriod, 8, 1)
         self.grid0.addWidget(QLabel('ms'), 8, 2)
 
+        self.grid0.addWidget(QLabel('预计耗时'), 9, 0, Qt.AlignTop)
+        self.label_estimate = QLabel()
+        self.grid0.addWidget(self.label_estimate, 9, 1, 1, 2)
+        # 参数或坐标序列修改后重新估算，连续的修改只估算一次
+        self.estimate_timer = QTimer(self)
+        self.estimate_timer.setSingleShot(True)
+        self.estimate_timer.setInterval(self.ESTIMATE_DELAY)
+        self.estimate_timer.timeout.connect(self.update_estimate)
+        for line in (
+            self.line_laserOnDelay, self.line_laserOffDelay, self.line_jumpSpeed, self.line_markSpeed,
+            self.line_jumpDelay, self.line_markDelay, self.line_stepPeriod
+        ):
+            line.textChanged.connect(self.estimate_timer.start)
+            line.textChanged.connect(self.timing_changed)
+        self.line_markSpeed.textChanged.connect(self.update_heatmap_later)
+
         # 水平布局0 -> 垂直布局0 -> 横线
         hline0 = QFrame()
         hline0.setFrameShape(QFrame.HLine)
@@ -212,11 +631,24 @@ class MainWindow(QMainWindow):
         vbox0.addWidget(hline0)
         
         # 水平布局0 -> 垂直布局0 -> 可编辑表格
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(['X/mm', 'Y/mm', '动作'])
+        self.table_model = MovementTableModel(parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.setItemDelegateForColumn(0, CoordinateDelegate(self.table))
+        self.table.setItemDelegateForColumn(1, CoordinateDelegate(self.table))
+        self.table.setItemDelegateForColumn(2, ActionDelegate(self.table))
+        # 可以选中连续的多行，供变换使用
+        self.table.setSelectionMode(QAbstractItemView.ContiguousSelection)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # 固定行高，避免行数很多时逐行计算行高
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         vbox0.addWidget(self.table)
-        self.table.itemChanged.connect(self.table_changed_slot)
+        self.table_model.dataChanged.connect(self.table_data_changed_slot)
+        self.table_model.modelReset.connect(self.table_changed_slot)
+        self.table_model.rowsInserted.connect(self.table_changed_slot)
+        self.table_model.rowsRemoved.connect(self.table_changed_slot)
+        self.table_model.rowsMoved.connect(self.table_changed_slot)
+        self.table_model.history_changed.connect(self.update_history_actions)
 
         # 水平布局0 -> 垂直布局0 -> 水平布局1（`+`、`-`、`↑`、`↓`）
         hbox1 = QHBoxLayout()
@@ -245,28 +677,36 @@ class MainWindow(QMainWindow):
         vbox1 = QVBoxLayout()
         hbox0.addLayout(vbox1)
 
-        # 水平布局0 -> 垂直布局1 -> plt绘图窗口
-        self.dynamic_canvas = FigureCanvas(Figure(figsize=(7, 7)))
-        vbox1.addWidget(self.dynamic_canvas)
-        self.axes = self.dynamic_canvas.figure.subplots()
-        self._timer = self.dynamic_canvas.new_timer(50, [(self.update_canvas, (), {})])
-        self._timer.start()
-
-        # 水平布局0 -> 垂直布局1 -> 弹性占位符
-        vbox1.addStretch(1)
-
-        # 水平布局0 -> 垂直布局1 -> 水平布局2（弹性占位符，复选框）
-        hbox2 = QHBoxLayout()
-        vbox1.addLayout(hbox2)
-        hbox2.addStretch(1)
-        self.check_show_blue_line = QCheckBox('显示跳转')
-        hbox2.addWidget(self.check_show_blue_line)
-        self.check_show_blue_line.setChecked(True)
-        self.check_show_blue_line.stateChanged.connect(self.set_canvas_update_needed)
+        # 水平布局0 -> 垂直布局1 -> 预览，加载完成前显示占位的按钮
+        self.vbox_preview = vbox1
+        self.button_preview = QPushButton('显示预览')
+        self.button_preview.setMinimumSize(400, 400)
+        self.button_preview.clicked.connect(self.start_preview_loader)
+        vbox1.addWidget(self.button_preview)
+        if not lazy_preview:
+            QTimer.singleShot(self.PREVIEW_DELAY, self.start_preview_loader)
 
         self.set_title()
         self.set_values()
         self.save_filepath = ''
+        self.write_worker = None
+        self.read_worker = None
+        self.cache = DbdCache()
+
+        # 耗时面板，开始记录耗时时显示
+        self.profile_dock = QDockWidget('耗时', self)
+        self.profile_table = QTableWidget(0, 3)
+        self.profile_table.setHorizontalHeaderLabels(['操作', '毫秒', '行数'])
+        self.profile_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.profile_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.profile_dock.setWidget(self.profile_table)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.profile_dock)
+        self.profile_dock.setVisible(profiler.enabled)
+        self.profile_latest = None
+        self.profile_timer = QTimer(self)
+        self.profile_timer.setInterval(self.PROFILE_INTERVAL)
+        self.profile_timer.timeout.connect(self.update_profile_panel)
+        self.profile_timer.start()
 
     def set_title(self, filename='Untitled.dbd'):
         self.setWindowTitle(f'{filename} - DBD Maker')
@@ -288,10 +728,51 @@ class MainWindow(QMainWindow):
         self.line_markDelay.setText(str(markDelay))
         self.line_stepPeriod.setText(str(stepPeriod))
 
+    def get_header(self) -> dict:
+        '''
+        返回表单中的文件头参数。
+        '''
+        return {
+            'File': self.line_file.text(),
+            'Unit': self.combo0.currentText(),
+            'LaserOnDelay': self.line_laserOnDelay.text(),
+            'LaserOffDelay': self.line_laserOffDelay.text(),
+            'JumpSpeed': self.line_jumpSpeed.text(),
+            'MarkSpeed': self.line_markSpeed.text(),
+            'JumpDelay': self.line_jumpDelay.text(),
+            'MarkDelay': self.line_markDelay.text(),
+            'StepPeriod': self.line_stepPeriod.text(),
+        }
+
+    @property
+    def unit_scale(self) -> float:
+        return UNIT_SCALE[self.combo0.currentText()]
+
+    def speed_changed(self, key: str, text: str):
+        if self.converting_units:
+            return
+        try:
+            self.speeds[key] = float(text) * self.unit_scale
+        except ValueError:
+            self.speeds[key] = None
+
+    def canonical_header(self) -> dict:
+        '''
+        以毫米为单位的文件头参数，与Toolpath中的坐标一致，用于估算时间等计算。
+        速度不是数字时抛出ValueError。
+        '''
+        header = self.get_header()
+        header['Unit'] = 'mm'
+        for key, value in self.speeds.items():
+            if value is None:
+                raise ValueError(f'{key}不是数字')
+            header[key] = repr(value)
+        return header
+
     def action_new_slot(self):
         self.set_values()
-        self.table.setRowCount(0)
-        self.set_canvas_update_needed()
+        self.set_movements(Toolpath())
+        self.table_model.clear_history()
         self.save_filepath = ''
 
     def action_open_slot(self):
@@ -300,36 +781,90 @@ class MainWindow(QMainWindow):
         )
         if not filepath:
             return
-        self.save_filepath = filepath
-        result = read_dbd(filepath)
-        
+        iterate = self.cache.iter_dbd if self.action_cache.isChecked() else iter_dbd
+        worker = ReadWorker(iterate, filepath, name='open.parse', parent=self)
+        self.start_reading(worker, '打开文件', '正在打开……', open_file=True)
+
+    def set_header(self, header: dict):
+        '''
+        按文件头设置表单，参数缺失时提示并恢复默认值。
+        '''
         try:
             self.set_values(
-                file=result['File'], unit=result['Unit'],
-                laserOnDelay=result['LaserOnDelay'], laserOffDelay=result['LaserOffDelay'],
-                jumpSpeed=result['JumpSpeed'], markSpeed=result['MarkSpeed'],
-                jumpDelay=result['JumpDelay'], markDelay=result['MarkDelay'],
-                stepPeriod=result['StepPeriod']
+                file=header['File'], unit=header['Unit'],
+                laserOnDelay=header['LaserOnDelay'], laserOffDelay=header['LaserOffDelay'],
+                jumpSpeed=header['JumpSpeed'], markSpeed=header['MarkSpeed'],
+                jumpDelay=header['JumpDelay'], markDelay=header['MarkDelay'],
+                stepPeriod=header['StepPeriod']
             )
         except KeyError:
             QMessageBox.critical(self, '错误', '文件信息缺失或有误。')
             self.set_values()
-        
-        try:
-            movements = result['Movements']
-        except KeyError:
-            movements = []
 
-        self.set_movements(movements)
+    def start_reading(self, worker: ReadWorker, title: str, label: str, open_file=False):
+        '''
+        在后台解析文件，解析出的文件头和部分坐标立即显示；取消或失败时恢复原来的内容。
+        open_file为True时设置文件头并记下文件路径，否则（导入）只替换坐标序列。
+        '''
+        if self.read_worker is not None or self.write_worker is not None:
+            return
+        previous = (self.toolpath, self.get_header(), dict(self.speeds))
+        dialog = QProgressDialog(label, '取消', 0, 100, self)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        dialog.setAutoClose(False)
+        dialog.canceled.connect(worker.requestInterruption)
+        worker.progress.connect(dialog.setValue)
+        if open_file:
+            worker.header_parsed.connect(self.set_header)
+        worker.partial.connect(self.set_movements)
+        worker.finished.connect(lambda: self.read_finished(worker, dialog, previous, open_file))
+        self.read_worker = worker
+        self.update_busy()
+        worker.start()
+
+    def read_finished(self, worker: ReadWorker, dialog: QProgressDialog, previous: tuple, open_file: bool):
+        self.read_worker = None
+        self.update_busy()
+        dialog.close()
+        worker.deleteLater()
+        # 没有得到结果时保留原来的内容
+        if worker.cancelled or worker.error or worker.toolpath is None:
+            toolpath, header, speeds = previous
+            if self.toolpath is not toolpath:
+                self.set_movements(toolpath)
+            if self.get_header() != header:
+                self.set_header(header)
+                # 表单中的速度只保留三位小数，恢复原来的值
+                self.speeds = speeds
+            if worker.error:
+                QMessageBox.critical(self, '错误', f'无法读取文件：{worker.error}')
+            return
+        if worker.report:
+            QMessageBox.warning(self, '警告', worker.report.summary())
+        if open_file:
+            self.save_filepath = worker.filepath
+            # 文件头完整时已经设置过了，不完整时在这里提示
+            if not DEFAULT_HEADER.keys() <= worker.toolpath.header.keys():
+                self.set_header(worker.toolpath.header)
+            self.set_movements(worker.toolpath)
+            self.table_model.clear_history()
+        else:
+            # 导入可以撤销，恢复导入前的坐标序列
+            self.table_model.execute(Replace(previous[0], worker.toolpath, '导入'))
+
+    @property
+    def toolpath(self) -> Toolpath:
+        return self.table_model.toolpath
 
-    def set_movements(self, movements: list):
-        self.table.setRowCount(0)
-        for movement in movements:
-            self.table_add_line(
-                self.table.rowCount(), movement[0], movement[1], movement[2]
-            )
+    @profiler.profiled('set_movements', describe=lambda window, toolpath: {'rows': len(toolpath)})
+    def set_movements(self, toolpath: Toolpath):
+        self.table_model.set_toolpath(toolpath)
 
     def action_save_slot(self):
+        if self.write_worker is not None or self.read_worker is not None:
+            return
         if not self.save_filepath.endswith(f'{self.line_file.text()}.dbd'):
             form_filename = self.line_file.text()
             form_filename = form_filename if form_filename else 'Untitled'
@@ -345,20 +880,40 @@ class MainWindow(QMainWindow):
         else:
             filepath = self.save_filepath
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(f'File: {os.path.basename(filepath)}\n')
-            f.write(f'Unit: {self.combo0.currentText()}\n')
-            f.write(f'Start_List\n')
-            f.write(f'LaserOnDelay {self.line_laserOnDelay.text()}\n')
-            f.write(f'LaserOffDelay {self.line_laserOffDelay.text()}\n')
-            f.write(f'JumpSpeed {self.line_jumpSpeed.text()}\n')
-            f.write(f'MarkSpeed {self.line_markSpeed.text()}\n')
-            f.write(f'JumpDelay {self.line_jumpDelay.text()}\n')
-            f.write(f'MarkDelay {self.line_markDelay.text()}\n')
-            f.write(f'StepPeriod {self.line_stepPeriod.text()}\n')
-            for x, y, action in self.get_table_data():
-                f.write(f'{action}_abs {x} {y}\n')
-            f.write(f'End_List\n')
+        outside = self.check_bounds()
+        if len(outside) and QMessageBox.question(
+            self, '警告', f'有{len(outside)}行超出工作区域，仍然保存吗？'
+        ) != QMessageBox.Yes:
+            return
+
+        self.toolpath.header = self.get_header()
+        # 保存的是当前的副本，换算为文件头中的单位
+        toolpath = self.toolpath.copy()
+        toolpath.header = dict(toolpath.header)
+        if self.unit_scale != 1.0:
+            toolpath.transform(scaling(1 / self.unit_scale))
+        worker = WriteWorker(write_dbd, filepath, toolpath, self)
+        dialog = QProgressDialog('正在保存……', '取消', 0, 100, self)
+        dialog.setWindowTitle('保存文件')
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(500)
+        dialog.setAutoClose(False)
+        dialog.canceled.connect(worker.requestInterruption)
+        worker.progress.connect(dialog.setValue)
+        worker.finished.connect(lambda: self.save_finished(worker, dialog))
+        self.write_worker = worker
+        self.update_busy()
+        worker.start()
+
+    def save_finished(self, worker: WriteWorker, dialog: QProgressDialog):
+        self.write_worker = None
+        self.update_busy()
+        dialog.close()
+        worker.deleteLater()
+        if worker.error:
+            QMessageBox.critical(self, '错误', f'保存失败：{worker.error}')
+        elif not worker.cancelled:
+            self.save_filepath = worker.filepath
 
     def action_csv_example_slot(self):
         filepath, _ = QFileDialog.getSaveFileName(
@@ -369,167 +924,435 @@ class MainWindow(QMainWindow):
 
     def action_import_slot(self):
         filepath, _ = QFileDialog.getOpenFileName(
-            self, '打开文件', '', 'CSV 文件 (*.csv)'
+            self, '打开文件', '', f'CSV 文件 (*.csv);;{file_filter()}'
         )
         if not filepath:
             return
-        self.set_movements(read_csv(filepath))
+        importer = find_importer(filepath)
+        if importer is None:
+            # .csv中的坐标按当前单位解释
+            worker = ReadWorker(iter_csv, filepath, self.unit_scale, name='import.parse', parent=self)
+        else:
+            # 其它格式的导入结果已经换算为毫米
+            worker = ReadWorker(importer.iterate, filepath, 1.0, name='import.parse', parent=self)
+        self.start_reading(worker, '导入文件', '正在导入……')
 
-    def action_about_slot(self):
-        QMessageBox.about(
-            self, '关于',
-            '本程序可以创建适用于华曙打印机手动出光的控制文件，创建好的文件需要加密方可使用。'
+    def action_optimize_slot(self):
+        if len(self.toolpath) == 0:
+            return
+        # 按表单中的JumpSpeed和JumpDelay估算跳转耗时
+        try:
+            self.toolpath.header = self.canonical_header()
+        except ValueError:
+            QMessageBox.warning(self, '优化标刻顺序', '速度参数有误。')
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            with profiler.span('optimize', rows=len(self.toolpath)):
+                toolpath, report = optimize(self.toolpath)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.table_model.execute(Replace(self.toolpath, toolpath, '优化标刻顺序'))
+        unit = self.combo0.currentText()
+        report.before, report.after = report.before.converted(unit), report.after.converted(unit)
+        QMessageBox.information(self, '优化标刻顺序', report.summary())
+
+    def action_simplify_slot(self):
+        if len(self.toolpath) == 0:
+            return
+        tolerance, ok = QInputDialog.getDouble(
+            self, '简化路径', f'允许的偏差（{self.combo0.currentText()}），为0时只去掉多余的命令：',
+            0.0, 0.0, 1e6, 6
         )
+        if not ok:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            with profiler.span('simplify', rows=len(self.toolpath)):
+                toolpath, report = simplify(self.toolpath, tolerance * self.unit_scale)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.table_model.execute(Replace(self.toolpath, toolpath, '简化路径'))
+        QMessageBox.information(self, '简化路径', report.summary())
+
+    def selected_range(self):
+        '''
+        返回表格中选中的(起始行, 结束行)，结束行不包含在内；没有选中时返回None。
+        '''
+        rows = [index.row() for index in self.table.selectionModel().selectedIndexes()]
+        if not rows:
+            return None
+        return min(rows), max(rows) + 1
 
-    def table_changed_slot(self, item):
-        self.canvas_update_needed = True
-        # 根据行数判断是否启用删除、上移、下移按钮
-        row_count = self.table.rowCount()
-        if row_count == 0:
-            self.button_table_del.setEnabled(False)
-            self.button_table_up.setEnabled(False)
-            self.button_table_down.setEnabled(False)
+    def ask_transform(self, title: str, fields, centered=False):
+        '''
+        弹出变换参数对话框，返回(参数, 起始行, 结束行)，取消时返回None。
+        centered为True时加入中心坐标，默认为要变换的行的包围盒中心。
+        '''
+        if len(self.toolpath) == 0:
+            return None
+        selection = self.selected_range()
+        if centered:
+            start, stop = selection if selection is not None and selection[1] - selection[0] > 1 else (0, None)
+            x, y = self.toolpath.x[start:stop], self.toolpath.y[start:stop]
+            fields = list(fields) + [
+                ('cx', '中心X', float((x.min() + x.max()) / 2) / self.unit_scale),
+                ('cy', '中心Y', float((y.min() + y.max()) / 2) / self.unit_scale),
+            ]
+        dialog = TransformDialog(title, fields, selection, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return None
+        # 对话框中的长度以当前单位输入
+        values = dialog.values()
+        for key in ('dx', 'dy', 'cx', 'cy'):
+            if key in values:
+                values[key] *= self.unit_scale
+        if dialog.check_selection.isChecked():
+            return (values, *selection)
+        return values, 0, len(self.toolpath)
+
+    def apply_transform(self, command):
+        '''
+        对表格中的坐标序列做一次可以撤销的整体修改，只重置一次模型，之后恢复选中的行。
+        '''
+        selected = self.selected_range()
+        self.table_model.execute(command)
+        if selected is not None:
+            start, stop = selected
+            selection = QItemSelection(self.table_model.index(start, 0), self.table_model.index(stop - 1, 2))
+            self.table.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+
+    def action_translate_slot(self):
+        result = self.ask_transform('平移', [('dx', 'X方向', 0.0), ('dy', 'Y方向', 0.0)])
+        if result is None:
             return
-        self.button_table_del.setEnabled(True)
-        self.button_table_up.setEnabled(True)
-        self.button_table_down.setEnabled(True)
-        # 遍历检查第0列、第1列是否为浮点数，若不是，则修改为0.000000
-        for row in range(row_count):
-            for col in range(2):
-                item = self.table.item(row, col)
-                try:
-                    float(item.text())
-                except (ValueError, TypeError, AttributeError):
-                    self.table.setItem(row, col, QTableWidgetItem('0.000000'))
-
-    def get_combo(self, current='jump'):
-        combo = QComboBox()
-        combo.addItems(('jump', 'mark'))
-        combo.setCurrentIndex(0)
-        combo.currentIndexChanged.connect(self.set_canvas_update_needed)
-        if current == 'mark':
-            combo.setCurrentText('mark')
-        return combo
+        values, start, stop = result
+        self.apply_transform(Transform(translation(values['dx'], values['dy']), start, stop, '平移'))
 
-    def get_table_line_data(self, row: int):
-        return (
-            self.table.item(row, 0).text(),
-            self.table.item(row, 1).text(),
-            self.table.cellWidget(row, 2).currentText()
-        )
+    def action_scale_slot(self):
+        result = self.ask_transform('缩放', [('sx', 'X方向倍数', 1.0), ('sy', 'Y方向倍数', 1.0)], centered=True)
+        if result is None:
+            return
+        values, start, stop = result
+        matrix = scaling(values['sx'], values['sy'], values['cx'], values['cy'])
+        self.apply_transform(Transform(matrix, start, stop, '缩放'))
 
-    def get_table_data(self):
-        row_count = self.table.rowCount()
-        rows = []
-        for row in range(row_count):
-            x, y, action = self.get_table_line_data(row)
-            rows.append((x, y, action))
+    def action_rotate_slot(self):
+        result = self.ask_transform('旋转', [('angle', '逆时针角度（°）', 0.0)], centered=True)
+        if result is None:
+            return
+        values, start, stop = result
+        matrix = rotation(values['angle'], values['cx'], values['cy'])
+        self.apply_transform(Transform(matrix, start, stop, '旋转'))
+
+    def action_mirror_slot(self):
+        result = self.ask_transform('镜像', [('axis', '方向', ('左右', '上下'))], centered=True)
+        if result is None:
+            return
+        values, start, stop = result
+        matrix = mirroring('x' if values['axis'] == '左右' else 'y', values['cx'], values['cy'])
+        self.apply_transform(Transform(matrix, start, stop, '镜像'))
+
+    def action_repeat_slot(self):
+        result = self.ask_transform('阵列复制', [
+            ('columns', '列数', 1), ('rows', '行数', 1), ('dx', '列间距', 0.0), ('dy', '行间距', 0.0)
+        ])
+        if result is None:
+            return
+        values, start, stop = result
+        self.apply_transform(Repeat(values['columns'], values['rows'], values['dx'], values['dy'], start, stop))
+
+    def work_area(self) -> tuple:
+        '''
+        返回工作区域的圆心x、圆心y和半径，单位为毫米。
+        '''
+        params = CanvasParams()
+        return params.x(), params.y(), params.r()
+
+    @profiler.profiled('check_bounds', describe=toolpath_rows)
+    def check_bounds(self) -> np.ndarray:
+        '''
+        检查超出工作区域的行，在预览中（已加载时）标出这些线段，返回它们的行号。
+        '''
+        rows = out_of_bounds(self.toolpath, *self.work_area())
+        if self.preview is not None:
+            self.preview.show_outside(rows)
         return rows
 
-    def get_all_lines(self):
-        if self.table.rowCount() == 0:
-            return []
-        
-        table_data = self.get_table_data()
-        points = [Point()]
-        for x, y, action in table_data:
-            points.append(Point(x, y, action))
-        lines = []
-        for i in range(len(points)-1):
-            lines.append(Line(points[i], points[i+1]))
-        return lines
-
-    def table_add_line(self, row, x='0.000000', y='0.000000', action='jump'):
-        self.table.insertRow(row)
-        self.table.setItem(row, 0, QTableWidgetItem(x))
-        self.table.setItem(row, 1, QTableWidgetItem(y))
-        self.table.setCellWidget(row, 2, self.get_combo(action))
+    def action_check_bounds_slot(self):
+        rows = self.check_bounds()
+        if not len(rows):
+            QMessageBox.information(self, '检查工作区域', '所有线段都在工作区域内。')
+            return
+        self.select_row(int(rows[0]))
+        listed = '、'.join(str(row + 1) for row in rows[:20])
+        more = f'等{len(rows)}行' if len(rows) > 20 else ''
+        QMessageBox.warning(self, '检查工作区域', f'第{listed}行{more}超出工作区域，已在预览中标出。')
+
+    def select_row(self, row: int):
+        index = self.table_model.index(row, 0)
+        self.table.setCurrentIndex(index)
+        self.table.scrollTo(index)
+
+    def action_profile_slot(self, checked: bool):
+        profiler.enabled = checked
+        self.profile_dock.setVisible(checked)
+        self.update_profile_panel()
+
+    def action_export_profile_slot(self):
+        filepath, _ = QFileDialog.getSaveFileName(self, '导出耗时记录', 'trace.json', 'JSON 文件 (*.json)')
+        if not filepath:
+            return
+        try:
+            profiler.export(filepath)
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'导出失败：{e}')
+
+    def update_profile_panel(self):
+        '''
+        在耗时面板中列出最近的操作，没有新的记录时不刷新。
+        '''
+        if not self.profile_dock.isVisible():
+            return
+        spans = profiler.recent(self.PROFILE_ROWS)
+        latest = spans[0] if spans else None
+        if latest is self.profile_latest:
+            return
+        self.profile_latest = latest
+        table = self.profile_table
+        table.setRowCount(len(spans))
+        for row, span in enumerate(spans):
+            table.setItem(row, 0, QTableWidgetItem('  ' * span.depth + span.name))
+            table.setItem(row, 1, QTableWidgetItem(f'{span.duration / 1e6:.1f}'))
+            table.setItem(row, 2, QTableWidgetItem(str(span.args.get('rows', ''))))
+
+    def action_cache_slot(self, checked: bool):
+        self.settings.setValue('cache/enabled', checked)
+
+    def action_clear_cache_slot(self):
+        self.cache.clear()
+
+    def action_about_slot(self):
+        QMessageBox.about(
+            self, '关于',
+            '本程序可以创建适用于华曙打印机手动出光的控制文件，创建好的文件需要加密方可使用。'
+        )
+
+    def table_changed_slot(self):
+        with profiler.span('table_changed', rows=len(self.toolpath)):
+            self.estimate_timer.start()
+            if self.preview is not None:
+                self.preview.toolpath_changed()
+        self.update_table_buttons()
+
+    def update_table_buttons(self):
+        # 根据行数判断是否启用删除、上移、下移按钮，后台读写文件时都不启用
+        editable = self.table_model.editable
+        has_rows = editable and self.table_model.rowCount() > 0
+        self.button_table_add.setEnabled(editable)
+        self.button_table_del.setEnabled(has_rows)
+        self.button_table_up.setEnabled(has_rows)
+        self.button_table_down.setEnabled(has_rows)
+
+    @property
+    def busy(self) -> bool:
+        return self.read_worker is not None or self.write_worker is not None
+
+    def update_busy(self):
+        '''
+        后台读写文件期间禁用文件操作和对坐标序列的编辑。进度对话框延迟出现，
+        在它出现之前窗口仍然可以操作，所以不能只依靠对话框的模态。
+        '''
+        idle = not self.busy
+        for action in (
+            self.action_new, self.action_open, self.action_save, self.action_import,
+            self.action_optimize, self.action_simplify
+        ):
+            action.setEnabled(idle)
+        self.menu_transform.setEnabled(idle)
+        self.table_model.editable = idle
+        self.update_table_buttons()
+        self.update_history_actions()
 
     def table_add_slot(self):
-        row_count = self.table.rowCount()
+        row_count = self.table_model.rowCount()
         if row_count == 0:
             new_row = 0
         else:
-            new_row = self.table.currentRow() + 1
-        self.table_add_line(new_row)
+            new_row = self.table.currentIndex().row() + 1
+        self.table_model.execute(InsertRows(new_row, Toolpath([0.0], [0.0], [JUMP])))
 
     def table_del_slot(self):
-        row = self.table.currentRow()
-        self.table.removeRow(row)
-    
+        row = self.table.currentIndex().row()
+        if row < 0:
+            return
+        self.table_model.execute(DeleteRows(row))
+
     def table_move(self, direction: str):
         '''
         上移和下移共同的逻辑。
         若上移，则新行号为当前的减1，若下移，则新行号为当前的加1。
         '''
-        row = self.table.currentRow()
+        row = self.table.currentIndex().row()
         new_row = row-1 if direction == 'up' else row+1
-        row_text = self.get_table_line_data(row)
-        self.table.removeRow(row)
-        self.table.insertRow(new_row)
-        self.table.setItem(new_row, 0, QTableWidgetItem(row_text[0]))
-        self.table.setItem(new_row, 1, QTableWidgetItem(row_text[1]))
-        self.table.setCellWidget(new_row, 2, self.get_combo(row_text[2]))
-        self.table.setCurrentCell(new_row, 0)
+        self.table_model.execute(MoveRow(row, new_row))
+        self.table.setCurrentIndex(self.table_model.index(new_row, 0))
 
     def table_up_slot(self):
-        row = self.table.currentRow()
-        if row == 0:
+        row = self.table.currentIndex().row()
+        if row <= 0:
             return
         self.table_move('up')
         
     def table_down_slot(self):
-        row = self.table.currentRow()
-        if row == self.table.rowCount()-1:
+        row = self.table.currentIndex().row()
+        if row < 0 or row == self.table_model.rowCount()-1:
             return
         self.table_move('down')
 
-    def set_canvas_update_needed(self):
-        self.canvas_update_needed = True
+    def action_undo_slot(self):
+        self.table_model.undo()
 
-    def update_canvas(self):
-        if not self.canvas_update_needed:
-            return
-        self.canvas_update_needed = False
+    def action_redo_slot(self):
+        self.table_model.redo()
 
-        self.axes.clear()
-        params = CanvasParams()
-        unit = self.combo0.currentText()
-        circle_center = (params.x(unit), params.y(unit))
-        circle_r = params.r(unit)
-        axes_xlim = params.xlim(unit)
-        axes_ylim = params.ylim(unit)
-        circle = patches.Circle(circle_center, circle_r, edgecolor='black', facecolor='none')
-        lines = self.get_all_lines()
-        show_blue_line = self.check_show_blue_line.isChecked()
-        if lines:
-            for line in lines:
-                if show_blue_line or line.color() == 'red':
-                    self.axes.plot(line.x1x2(), line.y1y2(), color=line.color())
-        
-        self.axes.add_patch(circle)
-        self.axes.set_xlim(*axes_xlim)
-        self.axes.set_ylim(*axes_ylim)
-        self.axes.set_aspect('equal')
+    def update_history_actions(self):
+        history = self.table_model.history
+        editable = self.table_model.editable
+        self.action_undo.setEnabled(editable and history.can_undo())
+        self.action_redo.setEnabled(editable and history.can_redo())
+        self.action_undo.setText(f'撤销{history.undo_label()}')
+        self.action_redo.setText(f'重做{history.redo_label()}')
+
+    def table_data_changed_slot(self, top_left, bottom_right, roles=()):
+        self.estimate_timer.start()
+        if self.preview is not None:
+            self.preview.rows_changed(top_left.row(), bottom_right.row(), bottom_right.column())
 
-        self.dynamic_canvas.draw()
+    @profiler.profiled('estimate', describe=toolpath_rows)
+    def update_estimate(self):
+        try:
+            estimate = estimate_time(self.toolpath, self.canonical_header())
+        except ValueError:
+            self.label_estimate.setText('参数有误，无法估算')
+            return
+        self.label_estimate.setText(estimate.converted(self.combo0.currentText()).summary())
+
+    def closeEvent(self, event):
+        # 导入无法中断，等待后台加载预览的线程结束，以免在线程运行时销毁它
+        if self.preview_loader is not None:
+            self.preview_loader.wait()
+        if self.read_worker is not None:
+            self.read_worker.requestInterruption()
+            self.read_worker.wait()
+        # 正在保存时等待保存完成，不中断写入
+        if self.write_worker is not None:
+            self.write_worker.wait()
+        super().closeEvent(event)
+
+    def update_heatmap_later(self):
+        if self.preview is not None:
+            self.preview.update_heatmap_later()
+
+    def timing_changed(self):
+        if self.preview is not None:
+            self.preview.timing_changed()
+
+    def start_preview_loader(self):
+        '''
+        在后台线程中导入预览模块，完成后在主线程中创建预览。
+        '''
+        if self.preview is not None or self.preview_loader is not None:
+            return
+        self.button_preview.setEnabled(False)
+        self.button_preview.setText('正在加载预览……')
+        self.preview_loader = PreviewLoader(self)
+        self.preview_loader.finished.connect(self.preview_loaded)
+        self.preview_loader.start()
+
+    def preview_loaded(self):
+        loader = self.preview_loader
+        loader.deleteLater()
+        if loader.error:
+            self.preview_loader = None
+            self.button_preview.setEnabled(True)
+            self.button_preview.setText(f'无法加载预览：{loader.error}')
+            return
+        self.load_preview()
+        self.preview_loader = None
+
+    def load_preview(self):
+        '''
+        创建预览并替换占位的按钮，按当前的坐标序列和单位绘制。模块尚未导入时在主线程中导入。
+        '''
+        if self.preview is not None:
+            return
+        with profiler.span('create preview', rows=len(self.toolpath)):
+            import preview
+            self.preview = preview.Preview(self)
+            self.preview.row_clicked.connect(self.select_row)
+            self.vbox_preview.replaceWidget(self.button_preview, self.preview)
+            self.button_preview.deleteLater()
+            self.preview.set_unit(self.combo0.currentText())
+            self.preview.toolpath_changed()
+        self.preview_ready.emit()
 
     def update_units(self):
+        '''
+        切换单位只改变显示：坐标和速度都以毫米保存，不做换算，因此反复切换不会损失精度。
+        '''
         unit = self.combo0.currentText()
         self.grid0.itemAtPosition(4, 2).widget().setText(f'{unit}/s')
         self.grid0.itemAtPosition(5, 2).widget().setText(f'{unit}/s')
-        convert_function = mm2inch if unit == 'inch' else inch2mm
-        self.line_jumpSpeed.setText(str(
-            convert_function(float(self.line_jumpSpeed.text()))
-        ))
-        self.line_markSpeed.setText(str(
-            convert_function(float(self.line_markSpeed.text()))
-        ))
-        self.table.setHorizontalHeaderLabels([f'X/{unit}', f'Y/{unit}', '动作'])
+        # 只改变显示的文字，不覆盖保存的速度
+        self.converting_units = True
+        try:
+            for key, line in (('JumpSpeed', self.line_jumpSpeed), ('MarkSpeed', self.line_markSpeed)):
+                if self.speeds.get(key) is not None:
+                    line.setText(f'{self.speeds[key] / self.unit_scale:.3f}')
+        finally:
+            self.converting_units = False
+        self.table_model.set_unit(unit)
+        if self.preview is not None:
+            self.preview.set_unit(unit)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='创建和编辑.dbd文件。')
+    parser.add_argument('--lazy-preview', action='store_true', help='不自动加载预览，点击“显示预览”后才加载')
+    parser.add_argument(
+        '--startup-report', action='store_true',
+        help='记录启动各阶段和各模块的导入耗时，预览加载后输出到标准错误'
+    )
+    # 其余参数留给Qt
+    return parser.parse_known_args(argv)
+
+
+def report_startup(window: MainWindow):
+    '''
+    输出启动各阶段的耗时，类似python -X importtime，时间从进程开始导入本模块时算起。
+    '''
+    print('启动耗时（毫秒）：', file=sys.stderr)
+    print(f'{(IMPORTED - STARTED) / 1e6:10.1f}  import PySide2, numpy等', file=sys.stderr)
+    for span in sorted(profiler.spans, key=lambda span: span.start):
+        if span.name.startswith(('startup', 'import', 'create preview')):
+            print(
+                f'{span.duration / 1e6:10.1f}  {span.name}（于{(span.start - STARTED) / 1e6:.1f}开始）',
+                file=sys.stderr
+            )
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    main_window = MainWindow()
-    main_window.show()
+    args, qt_args = parse_args()
+    if args.startup_report:
+        profiler.enabled = True
+    app = QApplication(sys.argv[:1] + qt_args)
+    with profiler.span('startup.window'):
+        main_window = MainWindow(lazy_preview=args.lazy_preview)
+        main_window.show()
+    if args.startup_report:
+        if args.lazy_preview:
+            QTimer.singleShot(0, lambda: report_startup(main_window))
+        else:
+            main_window.preview_ready.connect(lambda: report_startup(main_window))
     sys.exit(app.exec_())
@@ -0,0 +1,459 @@
+'''
+重新安排标刻线段的顺序以缩短跳转的总长度。
+连续的mark行组成一笔，每一笔作为整体调整顺序，也可以反向标刻；
+先用最近邻法得到初始顺序，再用2-opt和Or-opt逐步改进。
+'''
+from math import hypot
+
+import numpy as np
+
+from spatial import PointGrid, approximate_neighbours
+from tools import JUMP, MARK, TimeEstimate, Toolpath, estimate_time, format_duration
+
+
+# 为2-opt和Or-opt准备的每个端点的近邻数
+NEIGHBOURS = 8
+# 距离的改进小于这一值时不再调整，避免浮点误差导致来回调整
+EPSILON = 1e-9
+# 一次2-opt或Or-opt最多改动的槽位数，笔数很多时限制每次调整的耗时
+MAX_SHIFT = 50000
+
+
+class OptimizeReport:
+    '''
+    记录优化前后的预计加工时间，before和after都是TimeEstimate。
+    '''
+    def __init__(self, strokes: int, before: TimeEstimate, after: TimeEstimate):
+        self.strokes = strokes
+        self.before = before
+        self.after = after
+
+    def summary(self) -> str:
+        before, after = self.before, self.after
+        saved = (before.total - after.total) / before.total * 100 if before.total else 0.0
+        return '\n'.join([
+            f'共{self.strokes}笔标刻线段。',
+            f'优化前：跳转{before.jumps}次，总长度{before.jump_length:.3f}{before.unit}，'
+            f'预计耗时{format_duration(before.total)}。',
+            f'优化后：跳转{after.jumps}次，总长度{after.jump_length:.3f}{after.unit}，'
+            f'预计耗时{format_duration(after.total)}。',
+            f'加工时间减少{saved:.1f}%。',
+        ])
+
+
+def strokes(toolpath: Toolpath) -> tuple:
+    '''
+    找出连续的mark行，返回每一笔的第一行和最后一行的行号。
+    第first行从上一个点出发，因此一笔的起点是第first - 1行的点（first为0时是原点）。
+    '''
+    mark = toolpath.action == MARK
+    before = np.concatenate(([False], mark[:-1]))
+    after = np.concatenate((mark[1:], [False]))
+    return np.flatnonzero(mark & ~before), np.flatnonzero(mark & ~after)
+
+
+class _Tour:
+    '''
+    笔的访问顺序，保存为首尾相接的环，原点作为一笔也在环上。
+    从原点出发沿加工方向走一圈，最后一笔回到原点的跳转不计长度。
+    端点编号2k和2k + 1分别是第k笔原来的起点和终点，(px[i], py[i])是端点i的坐标。
+    数组中的位置称为槽位，left[a]是槽位a上的笔在数组方向上的第一个端点，另一个端点是left[a] ^ 1，
+    pos[k]是第k笔所在的槽位。加工顺序中的位置p（原点为0）在槽位base + step * p上，step为1或-1。
+    2-opt和Or-opt都只改动环上较短的一侧，这一侧包括原点时base和step随之改变，
+    因此每次调整最多改动一半的槽位；槽位用numpy数组整段改动，逐个读取时通过memoryview。
+    '''
+    def __init__(self, px: list, py: list, order: list, flip: list):
+        self.px = px
+        self.py = py
+        self.size = len(order)
+        self.last = self.size - 1
+        self.left = 2 * np.asarray(order, dtype=np.int64) + np.asarray(flip, dtype=np.int64)
+        self.slots = np.arange(self.size)
+        self.pos = np.empty(self.size, dtype=np.int64)
+        self.pos[self.left >> 1] = self.slots
+        self._left = memoryview(self.left)
+        self._pos = memoryview(self.pos)
+        # 位置0上的原点
+        self.origin = order[0]
+        self.base = 0
+        self.step = 1
+        # 加工方向与数组方向相反时为1，与left异或得到加工方向上的起点
+        self.back = 0
+
+    def entry(self, p: int) -> int:
+        return self._left[(self.base + self.step * p) % self.size] ^ self.back
+
+    def exit(self, p: int) -> int:
+        return self._left[(self.base + self.step * p) % self.size] ^ self.back ^ 1
+
+    def exit_position(self, i: int) -> int:
+        '''
+        端点i是所在的笔在加工方向上的终点时返回这一笔的位置，否则返回-1。
+        '''
+        a = self._pos[i >> 1]
+        if self._left[a] ^ self.back ^ 1 != i:
+            return -1
+        return (self.step * (a - self.base)) % self.size
+
+    def sequence(self) -> tuple:
+        '''
+        按加工顺序返回各笔（包括位置0上的原点）和它们是否反向标刻。
+        '''
+        entry = self.left[(self.base + self.step * self.slots) % self.size] ^ self.back
+        return entry >> 1, (entry & 1).astype(bool)
+
+    def length(self) -> float:
+        '''
+        跳转的总长度。
+        '''
+        order, flip = self.sequence()
+        entry = 2 * order + flip
+        exit = entry ^ 1
+        px, py = np.asarray(self.px), np.asarray(self.py)
+        return float(np.hypot(px[exit[:-1]] - px[entry[1:]], py[exit[:-1]] - py[entry[1:]]).sum())
+
+    def _window(self, start: int, count: int):
+        '''
+        从槽位start开始的count个槽位，可以越过数组的末尾。
+        '''
+        start %= self.size
+        if start + count <= self.size:
+            return slice(start, start + count)
+        return (start + self.slots[:count]) % self.size
+
+    def _update(self, window):
+        self.pos[self.left[window] >> 1] = self.slots[window]
+        self.base = self._pos[self.origin]
+
+    def reverse_size(self, lo: int, hi: int) -> int:
+        '''
+        reverse(lo, hi)改动的槽位数。
+        '''
+        count = hi - lo + 1
+        return min(count, self.size - count)
+
+    def reverse(self, lo: int, hi: int):
+        '''
+        将位置lo到hi的笔倒序排列，每一笔也都反向标刻。
+        另一侧（包括原点）较短时倒序另一侧，得到的环相同，只是加工方向与数组方向的关系反过来了。
+        '''
+        count = hi - lo + 1
+        if 2 * count <= self.size:
+            start = self.base + self.step * (lo if self.step > 0 else hi)
+        else:
+            start = self.base + self.step * (hi + 1 if self.step > 0 else lo - 1)
+            count = self.size - count
+            self.step = -self.step
+            self.back ^= 1
+        window = self._window(start, count)
+        self.left[window] = self.left[window][::-1] ^ 1
+        self._update(window)
+
+    def move_size(self, p: int, q: int) -> int:
+        '''
+        move(p, q)越过的笔数，取两侧中较少的一侧。
+        '''
+        inner = q - p if q > p else p - q - 1
+        return min(inner, self.size - 1 - inner)
+
+    def move(self, p: int, q: int, flipped: bool):
+        '''
+        将位置p上的笔移到位置q上的笔之后，flipped为真时同时改变它的方向。
+        可以越过两侧中较短的一侧：越过的各笔向p的槽位平移一格，这一笔放到空出来的槽位上。
+        '''
+        inner, direction = (q - p, self.step) if q > p else (p - q - 1, -self.step)
+        if 2 * inner + 1 > self.size:
+            inner, direction = self.size - 1 - inner, -direction
+        a = self.base + self.step * p
+        window = self._window(a if direction > 0 else a - inner, inner + 1)
+        values = np.roll(self.left[window], -direction)
+        values[-1 if direction > 0 else 0] ^= int(flipped)
+        self.left[window] = values
+        self._update(window)
+
+    def two_opt_gain(self, lo: int, hi: int) -> float:
+        '''
+        倒序位置lo到hi的笔后跳转距离的减少量。
+        '''
+        px, py = self.px, self.py
+        a, b, c = self.exit(lo - 1), self.entry(lo), self.exit(hi)
+        gain = hypot(px[a] - px[b], py[a] - py[b]) - hypot(px[a] - px[c], py[a] - py[c])
+        if hi < self.last:
+            d = self.entry(hi + 1)
+            gain += hypot(px[c] - px[d], py[c] - py[d]) - hypot(px[b] - px[d], py[b] - py[d])
+        return gain
+
+    def or_opt_gain(self, p: int, q: int, flipped: bool) -> float:
+        '''
+        将位置p上的笔移到位置q上的笔之后，跳转距离的减少量。
+        '''
+        px, py = self.px, self.py
+        a, s = self.exit(p - 1), self.entry(p)
+        t = s ^ 1
+        # 取出这一笔减少的距离
+        gain = hypot(px[a] - px[s], py[a] - py[s])
+        if p < self.last:
+            c = self.entry(p + 1)
+            gain += hypot(px[t] - px[c], py[t] - py[c]) - hypot(px[a] - px[c], py[a] - py[c])
+        if flipped:
+            s, t = t, s
+        # 插入到位置q之后增加的距离
+        d = self.exit(q)
+        gain -= hypot(px[d] - px[s], py[d] - py[s])
+        if q < self.last:
+            e = self.entry(q + 1)
+            gain -= hypot(px[t] - px[e], py[t] - py[e]) - hypot(px[d] - px[e], py[d] - py[e])
+        return gain
+
+
+def _nearest_neighbour(px: list, py: list, n: int, reverse: bool) -> tuple:
+    '''
+    从原点出发，每次选取离当前位置最近的一笔，返回各笔的顺序和方向。
+    '''
+    if reverse:
+        grid = PointGrid(px[:2 * n], py[:2 * n])
+    else:
+        grid = PointGrid(px[0:2 * n:2], py[0:2 * n:2])
+    x, y = 0.0, 0.0
+    order, flip = [], []
+    for _ in range(n):
+        i = grid.nearest(x, y)[0]
+        if reverse:
+            k, f = divmod(i, 2)
+            grid.remove(2 * k)
+            grid.remove(2 * k + 1)
+        else:
+            k, f = i, 0
+            grid.remove(k)
+        order.append(k)
+        flip.append(f)
+        end = 2 * k + 1 - f
+        x, y = px[end], py[end]
+    return order, flip
+
+
+def _improve(tour: _Tour, neighbours: list, reverse: bool) -> bool:
+    '''
+    对每个位置尝试2-opt（需要允许反向）和Or-opt，返回是否有改进。
+    neighbours[i]是端点i的近邻端点。
+    '''
+    improved = False
+    p = 0
+    while p <= tour.last:
+        # 2-opt：位置p的终点与位置q的终点相近时，倒序两者之间的笔
+        if reverse:
+            for c in neighbours[tour.exit(p)]:
+                q = tour.exit_position(c)
+                if q < 0 or q == p:
+                    continue
+                lo, hi = min(p, q) + 1, max(p, q)
+                if tour.reverse_size(lo, hi) > MAX_SHIFT:
+                    continue
+                if tour.two_opt_gain(lo, hi) > EPSILON:
+                    tour.reverse(lo, hi)
+                    improved = True
+                    break
+        # Or-opt：把位置p上的笔移到终点离它的起点（允许反向时也可以是终点）较近的笔之后
+        if p > 0:
+            candidates = [(c, False) for c in neighbours[tour.entry(p)]]
+            if reverse:
+                candidates += [(c, True) for c in neighbours[tour.exit(p)]]
+            for c, flipped in candidates:
+                q = tour.exit_position(c)
+                if q < 0 or q == p or q == p - 1:
+                    continue
+                if tour.move_size(p, q) > MAX_SHIFT:
+                    continue
+                if tour.or_opt_gain(p, q, flipped) > EPSILON:
+                    tour.move(p, q, flipped)
+                    improved = True
+                    break
+        p += 1
+    return improved
+
+
+def optimize(toolpath: Toolpath, reverse=True, passes=3) -> tuple:
+    '''
+    重新安排各笔的顺序，返回(新的Toolpath, OptimizeReport)。
+    reverse为真时允许反向标刻，passes是2-opt和Or-opt的最多轮数。
+    最后一笔之后的跳转保持不变，其余的跳转按新的顺序重新生成。
+    '''
+    first, last = strokes(toolpath)
+    n = len(first)
+    before = estimate_time(toolpath)
+    if n == 0:
+        result = toolpath.copy()
+        return result, OptimizeReport(0, before, before)
+
+    # 在坐标前补上原点，第r行的点是points[r + 1]，第k笔的起点和终点是points[first[k]]和points[last[k] + 1]
+    xs = np.concatenate(([0.0], toolpath.x))
+    ys = np.concatenate(([0.0], toolpath.y))
+    ends = np.stack((first, last + 1), axis=1).ravel()
+    # 最后两个端点是原点，作为位置0上的笔
+    px = np.concatenate((xs[ends], [0.0, 0.0])).tolist()
+    py = np.concatenate((ys[ends], [0.0, 0.0])).tolist()
+
+    order, flip = _nearest_neighbour(px, py, n, reverse)
+    tour = _Tour(px, py, [n] + order, [0] + flip)
+    # 原来的顺序已经比最近邻法更好时，从原来的顺序开始改进
+    original = _Tour(px, py, [n] + list(range(n)), [0] * (n + 1))
+    if original.length() < tour.length():
+        tour = original
+    if passes > 0:
+        # 同一笔的两个端点互不作为近邻
+        groups = np.arange(len(px)) >> 1
+        neighbours = [
+            [c for c in row if c >= 0]
+            for row in approximate_neighbours(px, py, NEIGHBOURS, groups).tolist()
+        ]
+        for _ in range(passes):
+            if not _improve(tour, neighbours, reverse):
+                break
+
+    # 按新的顺序生成各笔的点：正向是first到last + 1，反向是last + 1到first
+    order, flip = tour.sequence()
+    order, flip = order[1:], flip[1:]
+    lengths = last[order] - first[order] + 2
+    start = np.where(flip, last[order] + 1, first[order])
+    step = np.where(flip, -1, 1)
+    offsets = np.cumsum(lengths) - lengths
+    local = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+    index = np.repeat(start, lengths) + np.repeat(step, lengths) * local
+    action = np.full(len(index), MARK, dtype=np.uint8)
+    action[offsets] = JUMP
+
+    # 最后一笔之后的跳转保持原样
+    tail = np.arange(last[-1] + 1, len(toolpath))
+    index = np.concatenate((index, tail + 1))
+    action = np.concatenate((action, toolpath.action[tail]))
+
+    # 去掉终点与当前位置相同的跳转
+    x, y = xs[index], ys[index]
+    prev_x = np.concatenate(([0.0], x[:-1]))
+    prev_y = np.concatenate(([0.0], y[:-1]))
+    keep = (action != JUMP) | (x != prev_x) | (y != prev_y)
+    result = Toolpath(x[keep], y[keep], action[keep], toolpath.header)
+    return result, OptimizeReport(n, before, estimate_time(result))
+
+
+class SimplifyReport:
+    '''
+    记录简化时去掉的各类命令的数量。
+    '''
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.zero_length = 0
+        self.jumps = 0
+        self.collinear = 0
+        self.tolerance = 0
+
+    @property
+    def removed(self) -> int:
+        return self.zero_length + self.jumps + self.collinear + self.tolerance
+
+    def summary(self) -> str:
+        return '\n'.join([
+            f'共{self.rows}行，去掉{self.removed}行，剩余{self.rows - self.removed}行。',
+            f'长度为0的线段：{self.zero_length}行',
+            f'连续跳转中多余的跳转：{self.jumps}行',
+            f'共线的标刻点：{self.collinear}行',
+            f'按容差合并的标刻点：{self.tolerance}行',
+        ])
+
+
+def _subset(toolpath: Toolpath, keep) -> Toolpath:
+    return Toolpath(toolpath.x[keep], toolpath.y[keep], toolpath.action[keep], toolpath.header)
+
+
+def _zero_length(toolpath: Toolpath) -> np.ndarray:
+    '''
+    返回终点与起点相同的行。去掉这些行不会改变其余各行的起点。
+    '''
+    x0, y0, x1, y1, _ = toolpath.segments()
+    return (x0 == x1) & (y0 == y1)
+
+
+def _rdp(x, y, starts, ends, tolerance: float) -> np.ndarray:
+    '''
+    对以starts[i]到ends[i]为下标的多条折线同时做Ramer-Douglas-Peucker简化，
+    返回每个点是否保留。每一轮对所有待处理的区间一起计算各内部点到弦的距离，
+    最远的点超出容差时在这一点分成两个区间，否则去掉区间内的全部内部点。
+    '''
+    keep = np.ones(len(x), dtype=bool)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    while True:
+        active = ends - starts >= 2
+        starts, ends = starts[active], ends[active]
+        if len(starts) == 0:
+            return keep
+        counts = ends - starts - 1
+        offsets = np.cumsum(counts) - counts
+        group = np.repeat(np.arange(len(starts)), counts)
+        index = np.repeat(starts + 1, counts) + np.arange(counts.sum()) - np.repeat(offsets, counts)
+
+        # 点到弦（线段）的距离，弦的两端重合时即为到端点的距离
+        ax, ay = x[starts][group], y[starts][group]
+        dx, dy = x[ends][group] - ax, y[ends][group] - ay
+        px, py = x[index] - ax, y[index] - ay
+        norm = dx * dx + dy * dy
+        t = np.clip(np.divide(px * dx + py * dy, norm, out=np.zeros_like(norm), where=norm > 0), 0.0, 1.0)
+        dist = np.hypot(px - t * dx, py - t * dy)
+
+        farthest = np.maximum.reduceat(dist, offsets)
+        split = farthest > tolerance
+        keep[index[~split[group]]] = False
+        # 每个需要拆分的区间取第一个距离最大的点
+        candidates = np.flatnonzero(split[group] & (dist == farthest[group]))
+        first = np.ones(len(candidates), dtype=bool)
+        first[1:] = group[candidates[1:]] != group[candidates[:-1]]
+        middle = index[candidates[first]]
+        starts, ends = np.concatenate((starts[split], middle)), np.concatenate((middle, ends[split]))
+
+
+def _merge_marks(toolpath: Toolpath, tolerance: float) -> np.ndarray:
+    '''
+    返回每段连续标刻中可以在tolerance内省略的标刻行。
+    '''
+    first, last = strokes(toolpath)
+    # 在坐标前补上原点，第r行的点是第r + 1个点，一笔从第first个点到第last + 1个点
+    xs = np.concatenate(([0.0], toolpath.x))
+    ys = np.concatenate(([0.0], toolpath.y))
+    keep = _rdp(xs, ys, first, last + 1, tolerance)
+    return ~keep[1:]
+
+
+def simplify(toolpath: Toolpath, tolerance=0.0) -> tuple:
+    '''
+    去掉多余的命令，返回(新的Toolpath, SimplifyReport)。
+    依次去掉长度为0的线段、连续跳转中除最后一次以外的跳转、共线的标刻点，
+    tolerance大于0时再用Ramer-Douglas-Peucker算法合并偏差不超过tolerance的标刻点。
+    '''
+    report = SimplifyReport(len(toolpath))
+
+    removed = _zero_length(toolpath)
+    report.zero_length += int(removed.sum())
+    toolpath = _subset(toolpath, ~removed)
+
+    # 连续的跳转只有最后一次决定位置
+    jump = toolpath.action == JUMP
+    removed = jump & np.concatenate((jump[1:], [False]))
+    report.jumps += int(removed.sum())
+    toolpath = _subset(toolpath, ~removed)
+
+    # 合并跳转后可能又跳回了原处
+    removed = _zero_length(toolpath)
+    report.zero_length += int(removed.sum())
+    toolpath = _subset(toolpath, ~removed)
+
+    # 共线的判断允许与坐标大小相称的舍入误差
+    scale = max(1.0, float(np.abs(toolpath.x).max(initial=0.0)), float(np.abs(toolpath.y).max(initial=0.0)))
+    removed = _merge_marks(toolpath, scale * 1e-9)
+    report.collinear += int(removed.sum())
+    toolpath = _subset(toolpath, ~removed)
+
+    if tolerance > 0:
+        removed = _merge_marks(toolpath, tolerance)
+        report.tolerance += int(removed.sum())
+        toolpath = _subset(toolpath, ~removed)
+    return toolpath, report
@@ -0,0 +1,555 @@
+'''
+坐标序列的预览：matplotlib绘图区、工具栏、曝光热图和加工过程的回放。
+导入matplotlib需要较长时间，主窗口在显示之后才在后台导入本模块，
+只打开、修改参数、保存文件时不需要加载它。
+'''
+import time
+
+import matplotlib
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+import matplotlib.patches as patches
+from matplotlib import ticker
+from PySide2.QtCore import Signal, Qt, QTimer
+from PySide2.QtWidgets import (
+    QCheckBox, QComboBox, QHBoxLayout, QLabel, QPushButton, QSlider, QSpinBox, QVBoxLayout, QWidget
+)
+
+import numpy as np
+
+from analysis import exposure_map
+from lod import LodIndex
+from profiling import profiler
+from spatial import SegmentGrid
+from tools import DELAY_SCALE, JUMP, MARK, UNIT_SCALE, format_duration, movement_times
+
+
+# 折线的顶点很多时，Agg需要分块绘制
+matplotlib.rcParams['agg.path.chunksize'] = 10000
+
+
+def toolpath_rows(preview, *args, **kwargs) -> dict:
+    # 耗时记录中附加的行数
+    return {'rows': len(preview.window.toolpath)}
+
+
+class PreviewCanvas(FigureCanvas):
+    '''
+    记录每次绘制耗时的画布。
+    '''
+    def draw(self):
+        with profiler.span('draw'):
+            super().draw()
+
+
+class UnitLocator(ticker.MaxNLocator):
+    '''
+    预览的坐标始终以毫米为单位，刻度按显示单位取整数值。scale是每个显示单位相当于多少毫米。
+    '''
+    def __init__(self, scale=1.0):
+        super().__init__(nbins='auto', steps=[1, 2, 2.5, 5, 10])
+        self.scale = scale
+
+    def tick_values(self, vmin, vmax):
+        return super().tick_values(vmin / self.scale, vmax / self.scale) * self.scale
+
+
+class Preview(QWidget):
+    '''
+    主窗口右侧的预览。坐标序列、文件头参数和工作区域都从window（主窗口）读取，
+    单击预览中的线段时发出row_clicked信号。
+    '''
+    row_clicked = Signal(int)
+
+    # 线段数超过这一数量时，预览改用多分辨率索引按视野和像素精度绘制
+    LOD_THRESHOLD = 200000
+    # 缩放预览时每格滚轮的缩放比例
+    ZOOM_STEP = 1.25
+    # 修改后等待多久再重绘预览（毫秒），重建多分辨率索引较慢，等待更久以合并连续的修改
+    CANVAS_DELAY = 30
+    LOD_CANVAS_DELAY = 300
+    # 单击预览时，离鼠标不超过这一距离（像素）的线段才会被选中
+    CLICK_TOLERANCE = 5
+    # 修改后等待多久再重新计算曝光热图（毫秒）
+    HEATMAP_DELAY = 300
+    # 回放的帧间隔（毫秒）
+    PLAYBACK_INTERVAL = 16
+    # 回放进度条的刻度数
+    PLAYBACK_STEPS = 10000
+    # 回放时光点后面拖尾的行数
+    TRAIL_ROWS = 50
+    # 回放速度（相对于实际加工时间的倍数）
+    PLAYBACK_SPEEDS = ('0.01', '0.1', '1', '10', '100', '1000')
+
+    def __init__(self, window, parent=None):
+        super().__init__(parent)
+        self.window = window
+
+        # 需要整体重绘预览，或只需更新某些行的坐标
+        self.canvas_rebuild_needed = True
+        self.canvas_dirty_rows = set()
+        self.polylines = {}
+
+        vbox = QVBoxLayout(self)
+        vbox.setContentsMargins(0, 0, 0, 0)
+
+        # plt绘图窗口
+        self.dynamic_canvas = PreviewCanvas(Figure(figsize=(7, 7)))
+        vbox.addWidget(self.dynamic_canvas)
+        self.axes = self.dynamic_canvas.figure.subplots()
+        self.axes.set_aspect('equal')
+        # 工作区域的圆和两条折线只创建一次，之后只更新它们的数据
+        self.circle = patches.Circle((0, 0), 1, edgecolor='black', facecolor='none')
+        self.axes.add_patch(self.circle)
+        self.jump_line, = self.axes.plot([], [], color='blue')
+        self.mark_line, = self.axes.plot([], [], color='red')
+        # 超出工作区域的线段，检查后显示，表格修改后清除
+        self.outside_line, = self.axes.plot([], [], color='orange', linewidth=3, zorder=3)
+        # 曝光热图，第一次显示时创建
+        self.heatmap_image = None
+        # 点击预览时查找最近的线段，表格修改后重新建立
+        self.segment_grid = None
+        # 回放的光点和拖尾不参与整体重绘，而是在缓存的背景上单独绘制（blit）
+        self.spot, = self.axes.plot(
+            [], [], 'o', color='green', markersize=8, zorder=5, animated=True
+        )
+        self.trail_line, = self.axes.plot([], [], color='green', linewidth=2, zorder=4, animated=True)
+        self.playback_background = None
+        self.lod_indexes = []
+        # 缩放、平移结束后再按新的视野重新查询
+        self.lod_timer = QTimer(self)
+        self.lod_timer.setSingleShot(True)
+        self.lod_timer.setInterval(30)
+        self.lod_timer.timeout.connect(self.update_lod)
+        self.axes.callbacks.connect('xlim_changed', self.canvas_view_changed)
+        self.axes.callbacks.connect('ylim_changed', self.canvas_view_changed)
+        self.dynamic_canvas.mpl_connect('resize_event', self.canvas_view_changed)
+        self.dynamic_canvas.mpl_connect('scroll_event', self.canvas_scroll_slot)
+        self.dynamic_canvas.mpl_connect('button_press_event', self.canvas_click_slot)
+        self.dynamic_canvas.mpl_connect('draw_event', self.canvas_drawn)
+        self.canvas_toolbar = NavigationToolbar(self.dynamic_canvas, self)
+        vbox.addWidget(self.canvas_toolbar)
+        self.reset_canvas_view()
+        # 短时间内的多次修改合并为一次重绘
+        self.canvas_timer = QTimer(self)
+        self.canvas_timer.setSingleShot(True)
+        self.canvas_timer.setInterval(self.CANVAS_DELAY)
+        self.canvas_timer.timeout.connect(self.update_canvas)
+
+        # 弹性占位符
+        vbox.addStretch(1)
+
+        # 水平布局（弹性占位符，热图设置，复选框）
+        hbox = QHBoxLayout()
+        vbox.addLayout(hbox)
+        hbox.addStretch(1)
+        self.check_heatmap = QCheckBox('曝光热图')
+        hbox.addWidget(self.check_heatmap)
+        self.check_heatmap.stateChanged.connect(self.update_heatmap)
+        self.spin_heatmap_cells = QSpinBox()
+        self.spin_heatmap_cells.setRange(32, 2048)
+        self.spin_heatmap_cells.setValue(256)
+        self.spin_heatmap_cells.setSuffix(' 格')
+        self.spin_heatmap_cells.setToolTip('热图每边的格子数')
+        hbox.addWidget(self.spin_heatmap_cells)
+        self.spin_heatmap_cells.valueChanged.connect(self.update_heatmap_later)
+        self.check_show_blue_line = QCheckBox('显示跳转')
+        hbox.addWidget(self.check_show_blue_line)
+        self.check_show_blue_line.setChecked(True)
+        self.check_show_blue_line.stateChanged.connect(self.show_blue_line_slot)
+
+        # 水平布局（回放按钮，进度条，速度，时间）
+        hbox = QHBoxLayout()
+        vbox.addLayout(hbox)
+        self.button_play = QPushButton('播放')
+        self.button_play.setCheckable(True)
+        self.button_play.toggled.connect(self.play_slot)
+        hbox.addWidget(self.button_play)
+        self.slider_playback = QSlider(Qt.Horizontal)
+        self.slider_playback.setRange(0, self.PLAYBACK_STEPS)
+        self.slider_playback.valueChanged.connect(self.scrub_slot)
+        hbox.addWidget(self.slider_playback, 1)
+        self.combo_playback_speed = QComboBox()
+        self.combo_playback_speed.addItems([f'{speed}×' for speed in self.PLAYBACK_SPEEDS])
+        self.combo_playback_speed.setCurrentText('1×')
+        self.combo_playback_speed.setToolTip('回放速度，1×为实际的加工速度')
+        hbox.addWidget(self.combo_playback_speed)
+        self.label_playback = QLabel()
+        hbox.addWidget(self.label_playback)
+        # 按文件头中的速度和延迟算出的每一行的开始、结束时刻，坐标序列或参数修改后重新计算
+        self.playback = None
+        self.playback_time = 0.0
+        self.playback_clock = 0.0
+        self.playback_timer = QTimer(self)
+        self.playback_timer.setInterval(self.PLAYBACK_INTERVAL)
+        self.playback_timer.timeout.connect(self.playback_tick)
+
+        # 热图统计
+        self.label_heatmap = QLabel()
+        self.label_heatmap.setWordWrap(True)
+        self.label_heatmap.setVisible(False)
+        vbox.addWidget(self.label_heatmap)
+        # 连续的修改只重新计算一次热图
+        self.heatmap_timer = QTimer(self)
+        self.heatmap_timer.setSingleShot(True)
+        self.heatmap_timer.setInterval(self.HEATMAP_DELAY)
+        self.heatmap_timer.timeout.connect(self.update_heatmap)
+
+    @property
+    def toolpath(self):
+        return self.window.toolpath
+
+    def toolpath_changed(self):
+        '''
+        坐标序列整体改变（重置、插入、删除、移动行）后调用。
+        '''
+        self.set_canvas_update_needed()
+        self.clear_spatial_state()
+        self.update_heatmap_later()
+        self.reset_playback()
+
+    def rows_changed(self, first: int, last: int, column: int):
+        '''
+        第first到last行被修改后调用。只修改了坐标时记下修改的行，重绘时就地更新折线；修改了动作时需要整体重绘。
+        '''
+        self.update_heatmap_later()
+        self.clear_spatial_state()
+        self.playback = None
+        if column >= 2:
+            self.set_canvas_update_needed()
+            return
+        self.canvas_dirty_rows.update(range(first, last + 1))
+        self.canvas_timer.start()
+
+    def clear_spatial_state(self):
+        '''
+        坐标序列修改后，点击查找用的索引和超出工作区域的标记都已过时。
+        '''
+        self.segment_grid = None
+        if len(self.outside_line.get_xdata()):
+            self.outside_line.set_data([], [])
+
+    def show_outside(self, rows: np.ndarray):
+        '''
+        在预览中标出第rows行的线段。
+        '''
+        x0, y0, x1, y1, _ = self.toolpath.segments()
+        nan = np.full(len(rows), np.nan)
+        self.outside_line.set_data(
+            np.stack((x0[rows], x1[rows], nan), axis=1).ravel(),
+            np.stack((y0[rows], y1[rows], nan), axis=1).ravel()
+        )
+        self.dynamic_canvas.draw_idle()
+
+    def canvas_click_slot(self, event):
+        '''
+        在预览中单击时选中离鼠标最近的线段所在的行。
+        '''
+        # 缩放、平移模式下的单击由工具栏处理
+        if event.button != 1 or event.inaxes is not self.axes or self.canvas_toolbar.mode:
+            return
+        if not len(self.toolpath):
+            return
+        if self.segment_grid is None:
+            self.segment_grid = SegmentGrid(*self.toolpath.segments()[:4])
+        xlim = self.axes.get_xlim()
+        pixel_size = (xlim[1] - xlim[0]) / max(self.axes.bbox.width, 1)
+        row, _ = self.segment_grid.nearest(event.xdata, event.ydata, self.CLICK_TOLERANCE * pixel_size)
+        if row >= 0:
+            self.row_clicked.emit(row)
+
+    def set_canvas_update_needed(self):
+        self.canvas_rebuild_needed = True
+        self.canvas_timer.start()
+
+    def update_heatmap_later(self):
+        if self.check_heatmap.isChecked():
+            self.heatmap_timer.start()
+
+    def update_heatmap(self):
+        '''
+        在工作区域上叠加标刻线段的曝光热图，并显示热点统计。
+        '''
+        self.heatmap_timer.stop()
+        if not self.check_heatmap.isChecked():
+            if self.heatmap_image is not None:
+                self.heatmap_image.set_visible(False)
+            self.label_heatmap.setVisible(False)
+            self.dynamic_canvas.draw_idle()
+            return
+        cx, cy, r = self.window.work_area()
+        try:
+            with profiler.span('heatmap', rows=len(self.toolpath)):
+                result = exposure_map(
+                    self.toolpath, bounds=(cx - r, cy - r, 2 * r),
+                    cells=self.spin_heatmap_cells.value(), header=self.window.canonical_header()
+                )
+        except ValueError:
+            self.label_heatmap.setText('参数有误，无法计算曝光热图')
+            self.label_heatmap.setVisible(True)
+            return
+        # 没有曝光的格子透明
+        density = np.ma.masked_equal(result.density, 0)
+        if self.heatmap_image is None:
+            # imshow会重设坐标轴范围，保留当前的视野
+            xlim, ylim = self.axes.get_xlim(), self.axes.get_ylim()
+            self.heatmap_image = self.axes.imshow(
+                density, extent=result.extent, origin='lower', cmap='inferno',
+                alpha=0.6, interpolation='nearest', zorder=0
+            )
+            self.axes.set_xlim(*xlim)
+            self.axes.set_ylim(*ylim)
+        else:
+            self.heatmap_image.set_data(density)
+            self.heatmap_image.set_extent(result.extent)
+        if density.count():
+            self.heatmap_image.set_clim(density.min(), density.max())
+        self.heatmap_image.set_visible(True)
+        self.label_heatmap.setText(result.converted(self.window.combo0.currentText()).summary())
+        self.label_heatmap.setVisible(True)
+        self.dynamic_canvas.draw_idle()
+
+    @profiler.profiled('update_canvas', describe=toolpath_rows)
+    def update_canvas(self):
+        rows = self.canvas_dirty_rows
+        self.canvas_dirty_rows = set()
+        if not self.canvas_rebuild_needed:
+            if not rows:
+                return
+            if not self.lod_indexes:
+                self.update_polyline_rows(rows)
+                return
+        self.canvas_rebuild_needed = False
+
+        self.lod_indexes = []
+        self.polylines = {}
+        if len(self.toolpath) > self.LOD_THRESHOLD:
+            x0, y0, x1, y1, action = self.toolpath.segments()
+            for line, code in ((self.jump_line, JUMP), (self.mark_line, MARK)):
+                selected = action == code
+                self.lod_indexes.append(
+                    (line, LodIndex(x0[selected], y0[selected], x1[selected], y1[selected]))
+                )
+            self.canvas_timer.setInterval(self.LOD_CANVAS_DELAY)
+            self.update_lod()
+            return
+
+        self.canvas_timer.setInterval(self.CANVAS_DELAY)
+        for line, code in ((self.jump_line, JUMP), (self.mark_line, MARK)):
+            x, y, point_index = self.toolpath.polyline(code, with_index=True)
+            self.polylines[code] = (line, x, y, point_index)
+            line.set_data(x, y)
+        self.dynamic_canvas.draw_idle()
+
+    def update_polyline_rows(self, rows):
+        '''
+        把修改过坐标的行就地写入折线数组，不重新生成折线。
+        '''
+        rows = np.fromiter(rows, dtype=np.int64)
+        for line, x, y, point_index in self.polylines.values():
+            # 第row行的坐标是第row+1个点
+            index = point_index[rows + 1]
+            changed = index >= 0
+            x[index[changed]] = self.toolpath.x[rows[changed]]
+            y[index[changed]] = self.toolpath.y[rows[changed]]
+            line.set_data(x, y)
+        self.dynamic_canvas.draw_idle()
+
+    @profiler.profiled('update_lod')
+    def update_lod(self):
+        '''
+        按当前的视野和像素大小从多分辨率索引中取出需要绘制的线段。
+        '''
+        if not self.lod_indexes:
+            return
+        xlim = sorted(self.axes.get_xlim())
+        ylim = sorted(self.axes.get_ylim())
+        pixel_size = (xlim[1] - xlim[0]) / max(self.axes.bbox.width, 1)
+        for line, index in self.lod_indexes:
+            line.set_data(*index.query(xlim, ylim, pixel_size))
+        self.dynamic_canvas.draw_idle()
+
+    def canvas_view_changed(self, *args):
+        if self.lod_indexes:
+            self.lod_timer.start()
+
+    def canvas_scroll_slot(self, event):
+        '''
+        滚动滚轮时以鼠标位置为中心缩放预览。
+        '''
+        if event.inaxes is not self.axes:
+            return
+        scale = 1 / self.ZOOM_STEP if event.button == 'up' else self.ZOOM_STEP
+        x, y = event.xdata, event.ydata
+        x0, x1 = self.axes.get_xlim()
+        y0, y1 = self.axes.get_ylim()
+        self.axes.set_xlim(x - (x - x0) * scale, x + (x1 - x) * scale)
+        self.axes.set_ylim(y - (y - y0) * scale, y + (y1 - y) * scale)
+        self.dynamic_canvas.draw_idle()
+
+    def reset_canvas_view(self):
+        '''
+        重新设置工作区域的圆和坐标轴范围。预览始终以毫米为单位，刻度按当前单位标注。
+        '''
+        cx, cy, r = self.window.work_area()
+        self.circle.set_center((cx, cy))
+        self.circle.set_radius(r)
+        self.axes.set_xlim(cx - 1.125 * r, cx + 1.125 * r)
+        self.axes.set_ylim(cy - 1.125 * r, cy + 1.125 * r)
+        # 清空工具栏记录的视野，使“复位”回到新的范围
+        self.canvas_toolbar.update()
+        self.dynamic_canvas.draw_idle()
+
+    def show_blue_line_slot(self):
+        self.jump_line.set_visible(self.check_show_blue_line.isChecked())
+        self.dynamic_canvas.draw_idle()
+
+    def timing_changed(self):
+        '''
+        文件头中的速度、延迟修改后调用，回放时按新的参数重新计时。
+        '''
+        self.playback = None
+
+    def prepare_playback(self) -> bool:
+        '''
+        计算回放所需的每一行的时刻，参数有误时在进度条旁提示并返回False。
+        '''
+        if self.playback is not None:
+            return True
+        with profiler.span('prepare_playback', rows=len(self.toolpath)):
+            try:
+                header = self.window.canonical_header()
+                start, end, total = movement_times(self.toolpath, header)
+                step = float(header['StepPeriod']) * DELAY_SCALE
+            except ValueError:
+                self.label_playback.setText('参数有误，无法回放')
+                return False
+            x0, y0, x1, y1, action = self.toolpath.segments()
+            self.playback = {
+                'start': start, 'end': end, 'total': total, 'step': max(step, 0.0),
+                'segments': (x0, y0, x1, y1), 'mark': action == MARK,
+            }
+        self.playback_time = min(self.playback_time, total)
+        return True
+
+    def reset_playback(self):
+        '''
+        坐标序列整体改变后停止回放，回到开头并清除光点。
+        '''
+        self.playback = None
+        self.button_play.setChecked(False)
+        self.playback_time = 0.0
+        self.spot.set_data([], [])
+        self.trail_line.set_data([], [])
+        self.slider_playback.blockSignals(True)
+        self.slider_playback.setValue(0)
+        self.slider_playback.blockSignals(False)
+        self.label_playback.clear()
+
+    def play_slot(self, checked: bool):
+        if not checked:
+            self.playback_timer.stop()
+            self.button_play.setText('播放')
+            return
+        if not self.prepare_playback() or not len(self.toolpath):
+            self.button_play.setChecked(False)
+            return
+        if self.playback_time >= self.playback['total']:
+            self.playback_time = 0.0
+        self.playback_clock = time.perf_counter()
+        self.button_play.setText('暂停')
+        self.playback_timer.start()
+
+    def playback_tick(self):
+        '''
+        按经过的时间和回放速度前进，到达结尾时停止。
+        '''
+        now = time.perf_counter()
+        speed = float(self.combo_playback_speed.currentText().rstrip('×'))
+        self.playback_time += (now - self.playback_clock) * speed
+        self.playback_clock = now
+        if not self.prepare_playback():
+            self.button_play.setChecked(False)
+            return
+        if self.playback_time >= self.playback['total']:
+            self.playback_time = self.playback['total']
+            self.button_play.setChecked(False)
+        self.update_playback()
+
+    def scrub_slot(self, value: int):
+        if not self.prepare_playback():
+            return
+        self.playback_time = value / self.PLAYBACK_STEPS * self.playback['total']
+        self.playback_clock = time.perf_counter()
+        self.update_playback()
+
+    def update_playback(self):
+        '''
+        把光点放到playback_time时刻的位置，拖尾显示之前的TRAIL_ROWS行，然后只重绘这两者。
+        振镜每隔StepPeriod才更新一次位置，因此光点在每一行中按StepPeriod跳跃前进。
+        '''
+        playback = self.playback
+        t = self.playback_time
+        start, end = playback['start'], playback['end']
+        if not len(end):
+            return
+        x0, y0, x1, y1 = playback['segments']
+        # 正在运动或等待开始运动的行
+        row = int(np.searchsorted(end, t))
+        if row >= len(end):
+            row = len(end) - 1
+            fraction = 1.0
+        else:
+            duration = end[row] - start[row]
+            elapsed = max(t - start[row], 0.0)
+            if playback['step'] > 0:
+                elapsed = np.floor(elapsed / playback['step']) * playback['step']
+            fraction = min(elapsed / duration, 1.0) if duration > 0 else float(t >= start[row])
+        x = x0[row] + (x1[row] - x0[row]) * fraction
+        y = y0[row] + (y1[row] - y0[row]) * fraction
+        first = max(row - self.TRAIL_ROWS, 0)
+        nan = np.full(row - first + 1, np.nan)
+        self.trail_line.set_data(
+            np.stack((x0[first:row+1], np.append(x1[first:row], x), nan), axis=1).ravel(),
+            np.stack((y0[first:row+1], np.append(y1[first:row], y), nan), axis=1).ravel()
+        )
+        self.spot.set_data([x], [y])
+        # 标刻时光点实心，跳转或等待延迟时空心
+        laser_on = playback['mark'][row] and start[row] <= t <= end[row]
+        self.spot.set_markerfacecolor('green' if laser_on else 'none')
+
+        self.slider_playback.blockSignals(True)
+        self.slider_playback.setValue(
+            round(t / playback['total'] * self.PLAYBACK_STEPS) if playback['total'] else 0
+        )
+        self.slider_playback.blockSignals(False)
+        # 与表格一样从1开始编号
+        self.label_playback.setText(
+            f'{format_duration(t)} / {format_duration(playback["total"])}，第{row + 1}行'
+        )
+        self.blit_playback()
+
+    def canvas_drawn(self, event):
+        '''
+        整体重绘（包括缩放、平移、改变大小）之后缓存不含光点的背景，再画上光点。
+        '''
+        self.playback_background = self.dynamic_canvas.copy_from_bbox(self.axes.bbox)
+        self.blit_playback()
+
+    def blit_playback(self):
+        if self.playback_background is None:
+            return
+        self.dynamic_canvas.restore_region(self.playback_background)
+        self.axes.draw_artist(self.trail_line)
+        self.axes.draw_artist(self.spot)
+        self.dynamic_canvas.blit(self.axes.bbox)
+
+    def set_unit(self, unit: str):
+        scale = UNIT_SCALE[unit]
+        for axis in (self.axes.xaxis, self.axes.yaxis):
+            axis.set_major_locator(UnitLocator(scale))
+            axis.set_major_formatter(ticker.FuncFormatter(lambda value, pos: f'{value / scale:g}'))
+        self.axes.format_coord = lambda x, y: f'x={x / scale:.4f} y={y / scale:.4f} {unit}'
+        self.dynamic_canvas.draw_idle()
+        self.update_heatmap_later()
@@ -0,0 +1,142 @@
+'''
+轻量的耗时记录。用profiler.span()包住需要计时的操作，记录最近的若干次操作，
+可以导出为Chrome trace event格式的JSON，在chrome://tracing或Perfetto中查看。
+设置环境变量DBD_MAKER_PROFILE=1时启动即开始记录；未启用时span()只返回一个共享的空对象。
+'''
+import json
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+
+class Span:
+    '''
+    一次操作的记录。start和duration的单位为纳秒，args是附加的信息（如行数）。
+    '''
+    __slots__ = ('profiler', 'name', 'args', 'start', 'duration', 'thread', 'depth')
+
+    def __init__(self, profiler, name: str, args: dict):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = 0
+        self.duration = 0
+        self.thread = threading.get_ident()
+        self.depth = 0
+
+    def set(self, **args):
+        '''
+        补充附加信息，如操作完成后才知道的行数。
+        '''
+        self.args.update(args)
+
+    def __enter__(self):
+        self.depth = self.profiler._enter()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.profiler._exit(self)
+        return False
+
+
+class _NullSpan:
+    '''
+    未启用时使用的空记录，什么也不做。
+    '''
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    '''
+    保存最近capacity次操作的记录，多个线程可以同时使用。
+    '''
+    CAPACITY = 10000
+
+    def __init__(self, enabled=False, capacity=CAPACITY):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity)
+        self.origin = time.perf_counter_ns()
+        self._local = threading.local()
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def profiled(self, name: str = None, describe=None):
+        '''
+        装饰器，每次调用被装饰的函数时记录一次。
+        describe以被装饰函数的参数调用，返回的字典作为附加信息。
+        '''
+        def decorator(function):
+            label = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, label, describe(*args, **kwargs) if describe else {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _enter(self) -> int:
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        return depth
+
+    def _exit(self, span: Span):
+        self._local.depth = span.depth
+        self.spans.append(span)
+
+    def clear(self):
+        self.spans.clear()
+
+    def recent(self, count: int) -> list:
+        '''
+        返回最近完成的count次操作，从新到旧排列。
+        '''
+        spans = list(self.spans)
+        return spans[::-1][:count]
+
+    def chrome_trace(self) -> dict:
+        '''
+        返回Chrome trace event格式的数据，每次操作是一个完整事件（ph为X），时间单位为微秒。
+        '''
+        pid = os.getpid()
+        events = [
+            {
+                'name': span.name, 'ph': 'X', 'pid': pid, 'tid': span.thread,
+                'ts': (span.start - self.origin) / 1000, 'dur': span.duration / 1000,
+                'args': {key: value if isinstance(value, (int, float, str, bool)) else str(value)
+                         for key, value in span.args.items()},
+            }
+            for span in list(self.spans)
+        ]
+        events.sort(key=lambda event: event['ts'])
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, filepath: str):
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+profiler = Profiler(enabled=os.environ.get('DBD_MAKER_PROFILE', '') not in ('', '0'))
@@ -0,0 +1,291 @@
+import heapq
+import math
+
+import numpy as np
+
+
+def _ring(qx: int, qy: int, r: int, cols: int, rows: int):
+    '''
+    返回cols * rows的网格中与(qx, qy)格的切比雪夫距离为r的格子编号。
+    '''
+    if r == 0:
+        if 0 <= qx < cols and 0 <= qy < rows:
+            yield qy * cols + qx
+        return
+    lo, hi = max(qx - r, 0), min(qx + r, cols - 1)
+    for cy in (qy - r, qy + r):
+        if 0 <= cy < rows:
+            yield from range(cy * cols + lo, cy * cols + hi + 1)
+    lo, hi = max(qy - r + 1, 0), min(qy + r - 1, rows - 1)
+    for cx in (qx - r, qx + r):
+        if 0 <= cx < cols:
+            yield from range(lo * cols + cx, hi * cols + cx + 1, cols)
+
+
+def _ring_range(qx: int, qy: int, cols: int, rows: int) -> tuple:
+    '''
+    返回需要查找的第一圈和最后一圈：从网格中离(qx, qy)格最近的一圈到最远的一圈。
+    '''
+    first = max(qx - cols + 1, -qx, qy - rows + 1, -qy, 0)
+    last = max(qx, cols - 1 - qx, qy, rows - 1 - qy)
+    return first, last
+
+
+class PointGrid:
+    '''
+    平面上点的均匀网格索引，支持删除点和查询最近的点。
+    网格按点数划分，每格平均POINTS_PER_CELL个点；删除的点过多时按剩余的点重建网格，
+    因此逐个取出最近点的贪心算法在点变稀疏以后仍然很快。
+    '''
+    POINTS_PER_CELL = 2
+    # 剩余的点少于建网格时的这一比例时重建网格
+    REBUILD_RATIO = 0.25
+
+    def __init__(self, x, y):
+        self.x = np.asarray(x, dtype=np.float64).tolist()
+        self.y = np.asarray(y, dtype=np.float64).tolist()
+        self.alive = [True] * len(self.x)
+        self.count = len(self.x)
+        self._build()
+
+    def __len__(self):
+        return self.count
+
+    def _build(self):
+        ids = np.flatnonzero(self.alive)
+        self.built_count = len(ids)
+        self.cells = {}
+        self.cell_of = {}
+        if len(ids) == 0:
+            return
+        x = np.asarray(self.x)[ids]
+        y = np.asarray(self.y)[ids]
+        self.x0, self.y0 = x.min(), y.min()
+        width, height = x.max() - self.x0, y.max() - self.y0
+        area = width * height
+        if area > 0:
+            size = math.sqrt(area * self.POINTS_PER_CELL / len(ids))
+        else:
+            size = max(width, height) * self.POINTS_PER_CELL / len(ids)
+        self.cell_size = size or 1.0
+        self.cols = int(width / self.cell_size) + 1
+        self.rows = int(height / self.cell_size) + 1
+
+        cx = ((x - self.x0) / self.cell_size).astype(np.int64)
+        cy = ((y - self.y0) / self.cell_size).astype(np.int64)
+        key = cy * self.cols + cx
+        order = np.argsort(key, kind='stable')
+        key, ids = key[order], ids[order]
+        bounds = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1], [True])))
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            self.cells[int(key[start])] = ids[start:end].tolist()
+        self.cell_of = dict(zip(ids.tolist(), key.tolist()))
+
+    def remove(self, i: int):
+        if not self.alive[i]:
+            return
+        self.alive[i] = False
+        self.count -= 1
+        key = self.cell_of.pop(i)
+        cell = self.cells[key]
+        cell.remove(i)
+        if not cell:
+            del self.cells[key]
+        if self.count and self.count < self.REBUILD_RATIO * self.built_count:
+            self._build()
+
+    def nearest(self, px: float, py: float, k=1) -> list:
+        '''
+        返回距离(px, py)最近的k个点的编号，按距离从近到远排列。
+        '''
+        if not self.count:
+            return []
+        size = self.cell_size
+        qx = math.floor((px - self.x0) / size)
+        qy = math.floor((py - self.y0) / size)
+        r, r_max = _ring_range(qx, qy, self.cols, self.rows)
+        cells, xs, ys = self.cells, self.x, self.y
+        # 大根堆，保存目前最近的k个点的(-距离平方, 编号)
+        best = []
+        # 已找到的第k近的点的距离平方
+        bound = math.inf
+        while r <= r_max:
+            # 第r圈的格子与查询点至少相距(r - 1)格
+            if r > 1 and bound <= ((r - 1) * size) ** 2:
+                break
+            for key in _ring(qx, qy, r, self.cols, self.rows):
+                cell = cells.get(key)
+                if cell is None:
+                    continue
+                for i in cell:
+                    d = (xs[i] - px) ** 2 + (ys[i] - py) ** 2
+                    if d < bound:
+                        if len(best) == k:
+                            heapq.heapreplace(best, (-d, i))
+                        else:
+                            heapq.heappush(best, (-d, i))
+                        if len(best) == k:
+                            bound = -best[0][0]
+            r += 1
+        return [i for _, i in sorted(best, reverse=True)]
+
+
+class SegmentGrid:
+    '''
+    线段的均匀网格索引，用于查找离某一点最近的线段。
+    每条线段登记在其包围盒覆盖的所有格子中；覆盖超过LONG_CELLS格的长线段单独保存，每次查询都检查。
+    '''
+    SEGMENTS_PER_CELL = 4
+    # 每边最多的格子数
+    MAX_CELLS = 1024
+    LONG_CELLS = 16
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0, self.y0, self.x1, self.y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+        n = len(self.x0)
+        self.cols = self.rows = 0
+        if n == 0:
+            return
+        xmin = min(self.x0.min(), self.x1.min())
+        ymin = min(self.y0.min(), self.y1.min())
+        width = max(self.x0.max(), self.x1.max()) - xmin
+        height = max(self.y0.max(), self.y1.max()) - ymin
+        if width * height > 0:
+            size = math.sqrt(width * height * self.SEGMENTS_PER_CELL / n)
+        else:
+            size = max(width, height) * self.SEGMENTS_PER_CELL / n
+        size = max(size, max(width, height) / self.MAX_CELLS)
+        self.origin = (xmin, ymin)
+        self.cell_size = size or 1.0
+        self.cols = int(width / self.cell_size) + 1
+        self.rows = int(height / self.cell_size) + 1
+
+        cx0, cx1 = (self._cell(v, xmin, self.cols) for v in (np.minimum(self.x0, self.x1), np.maximum(self.x0, self.x1)))
+        cy0, cy1 = (self._cell(v, ymin, self.rows) for v in (np.minimum(self.y0, self.y1), np.maximum(self.y0, self.y1)))
+        spans = cx1 - cx0 + 1
+        counts = spans * (cy1 - cy0 + 1)
+        long = counts > self.LONG_CELLS
+        self.long = np.flatnonzero(long)
+
+        # 把每条短线段展开为它覆盖的各个格子，再按格子排序
+        short = np.flatnonzero(~long)
+        counts, spans = counts[short], spans[short]
+        offsets = np.cumsum(counts) - counts
+        ids = np.repeat(short, counts)
+        local = np.arange(counts.sum()) - np.repeat(offsets, counts)
+        spans = np.repeat(spans, counts)
+        key = (cy0[ids] + local // spans) * self.cols + cx0[ids] + local % spans
+        order = np.argsort(key, kind='stable')
+        self.ids = ids[order]
+        # offsets[k]是第k格中第一条线段在ids中的位置
+        self.offsets = np.searchsorted(key[order], np.arange(self.cols * self.rows + 1))
+
+    def __len__(self):
+        return len(self.x0)
+
+    def _cell(self, values, origin, count):
+        return np.clip(((values - origin) / self.cell_size).astype(np.int64), 0, count - 1)
+
+    def distance(self, ids, px: float, py: float) -> np.ndarray:
+        '''
+        返回点(px, py)到编号为ids的各条线段的距离。
+        '''
+        ax, ay = self.x0[ids], self.y0[ids]
+        dx, dy = self.x1[ids] - ax, self.y1[ids] - ay
+        qx, qy = px - ax, py - ay
+        norm = dx * dx + dy * dy
+        t = np.clip(np.divide(qx * dx + qy * dy, norm, out=np.zeros_like(norm), where=norm > 0), 0.0, 1.0)
+        return np.hypot(qx - t * dx, qy - t * dy)
+
+    def nearest(self, px: float, py: float, max_distance=math.inf) -> tuple:
+        '''
+        返回(离点(px, py)最近的线段的编号, 距离)，距离超过max_distance时返回(-1, inf)。
+        距离相同时返回编号最小的线段。
+        '''
+        best, best_distance = -1, math.inf
+        if not len(self):
+            return best, best_distance
+
+        def update(ids):
+            nonlocal best, best_distance
+            if len(ids) == 0:
+                return
+            distance = self.distance(ids, px, py)
+            nearest = distance.min()
+            i = ids[distance == nearest].min()
+            if (nearest, i) < (best_distance, best):
+                best, best_distance = int(i), float(nearest)
+
+        update(self.long)
+        size = self.cell_size
+        qx = math.floor((px - self.origin[0]) / size)
+        qy = math.floor((py - self.origin[1]) / size)
+        r, r_max = _ring_range(qx, qy, self.cols, self.rows)
+        offsets = self.offsets
+        while r <= r_max:
+            # 第r圈的格子与查询点至少相距(r - 1)格
+            bound = max(r - 1, 0) * size
+            if bound > max_distance or (best >= 0 and best_distance < bound):
+                break
+            update(np.concatenate([self.ids[offsets[k]:offsets[k + 1]] for k in _ring(qx, qy, r, self.cols, self.rows)] or [self.ids[:0]]))
+            r += 1
+        if best_distance > max_distance:
+            return -1, math.inf
+        return best, best_distance
+
+
+def _morton(ix, iy):
+    '''
+    交错两个16位整数的各位，得到Z序曲线上的编号。
+    '''
+    def spread(v):
+        v = v.astype(np.uint64) & 0xFFFF
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+    return spread(ix) | (spread(iy) << np.uint64(1))
+
+
+def approximate_neighbours(x, y, k: int, groups=None, window=8) -> np.ndarray:
+    '''
+    近似地求每个点的k个近邻，返回形状为(点数, k)的编号数组，不足k个时用-1补齐。
+    把点分别按两条错开的Z序曲线排序，在每个点前后window个点中选取最近的k个，
+    groups相同的点互不作为近邻。用于只需要一些较近的候选点、不要求精确的场合。
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    result = np.full((n, k), -1, dtype=np.int64)
+    if n < 2:
+        return result
+    xmin, ymin = x.min(), y.min()
+    extent = max(x.max() - xmin, y.max() - ymin) or 1.0
+    candidates = []
+    # 第二条曲线平移约三分之一的范围，弥补Z序曲线在大格子边界处的跳跃
+    for shift in (0.0, extent / 3):
+        scale = 0xFFFF / (extent + shift)
+        code = _morton(((x - xmin + shift) * scale).astype(np.int64), ((y - ymin + shift) * scale).astype(np.int64))
+        order = np.argsort(code, kind='stable')
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        for offset in range(1, window + 1):
+            for sign in (-1, 1):
+                candidates.append(order[np.clip(rank + sign * offset, 0, n - 1)])
+    candidates = np.sort(np.stack(candidates, axis=1), axis=1)
+    index = np.arange(n)[:, None]
+    dist = (x[candidates] - x[index]) ** 2 + (y[candidates] - y[index]) ** 2
+    # 去掉重复的候选点、自身以及同组的点
+    invalid = candidates == index
+    invalid[:, 1:] |= candidates[:, 1:] == candidates[:, :-1]
+    if groups is not None:
+        groups = np.asarray(groups)
+        invalid |= groups[candidates] == groups[index]
+    dist[invalid] = np.inf
+    k_found = min(k, candidates.shape[1])
+    best = np.argsort(dist, axis=1, kind='stable')[:, :k_found]
+    chosen = np.take_along_axis(candidates, best, axis=1)
+    chosen[np.isinf(np.take_along_axis(dist, best, axis=1))] = -1
+    result[:, :k_found] = chosen
+    return result
@@ -0,0 +1,64 @@
+import numpy as np
+
+import analysis
+from analysis import exposure_map, rasterize
+from tools import JUMP, MARK, Toolpath
+
+
+def random_toolpath(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return Toolpath(rng.random(n) * 10, rng.random(n) * 10, rng.choice([JUMP, MARK], n).astype(np.uint8))
+
+
+def test_dwell_sums_to_mark_length_over_speed():
+    toolpath = random_toolpath(500)
+    toolpath.header = {'MarkSpeed': '250'}
+    result = exposure_map(toolpath, cells=64, workers=1)
+    x0, y0, x1, y1, action = toolpath.segments()
+    mark = action == MARK
+    assert np.isclose(result.dwell.sum(), np.hypot(x1 - x0, y1 - y0)[mark].sum() / 250)
+    assert np.allclose(result.density, result.dwell / result.cell_size ** 2)
+
+
+def test_rasterize_puts_length_in_crossed_cells():
+    # 水平线段从第0列中点到第2列中点，第0、2列各0.5格，第1列1格
+    grid = rasterize([0.5], [1.5], [2.5], [1.5], (0.0, 0.0, 4.0), 4)
+    expected = np.zeros((4, 4))
+    expected[1, :3] = [0.5, 1.0, 0.5]
+    assert np.allclose(grid, expected)
+    # 网格之外的部分不计入
+    assert np.isclose(rasterize([-2.0], [0.5], [2.0], [0.5], (0.0, 0.0, 4.0), 4).sum(), 2.0)
+
+
+def test_chunks_and_workers_give_same_result(monkeypatch):
+    toolpath = random_toolpath(400, seed=1)
+    expected = exposure_map(toolpath, cells=32, workers=1).dwell
+    assert np.allclose(exposure_map(toolpath, cells=32, workers=3).dwell, expected)
+    monkeypatch.setattr(analysis, 'CHUNK_SAMPLES', 7)
+    assert np.allclose(exposure_map(toolpath, cells=32, workers=1).dwell, expected)
+
+
+def test_repeated_segment_is_a_hotspot():
+    # y=0的线段标刻3次，其它只标刻1次
+    x = [0.0, 10.0, 0.0, 10.0, 0.0, 10.0, 0.0, 10.0, 0.0, 10.0]
+    y = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 5.0, 5.0, 10.0, 10.0]
+    action = [JUMP, MARK] * 5
+    result = exposure_map(Toolpath(x, y, action), cells=10, workers=1)
+    hot = np.flatnonzero(result.hotspots().any(axis=1))
+    assert hot.tolist() == [0]
+    assert '热点10个' in result.summary()
+
+
+def test_no_marks():
+    result = exposure_map(Toolpath([1.0, 2.0], [1.0, 2.0], [JUMP, JUMP]), cells=8)
+    assert result.dwell.shape == (8, 8) and not result.dwell.any()
+    assert not result.hotspots().any()
+    assert result.summary() == '没有标刻线段。'
+
+
+def test_converted_keeps_dwell_and_scales_bounds():
+    result = exposure_map(random_toolpath(50, seed=2), cells=16, workers=1)
+    inch = result.converted('inch')
+    assert inch.dwell is result.dwell
+    assert np.allclose(inch.bounds, np.array(result.bounds) / 25.4)
+    assert np.allclose(inch.density, result.density * 25.4 ** 2)
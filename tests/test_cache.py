@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+from cache import DbdCache
+from tools import DEFAULT_HEADER, MARK, ParseReport, Toolpath, read_dbd, write_dbd
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # 测试用的文件都很小，也要缓存
+    monkeypatch.setattr(DbdCache, 'MIN_SIZE', 0)
+    return DbdCache(str(tmp_path / 'cache'))
+
+
+def write_part(path, n, offset=0.0):
+    x = np.arange(n, dtype=np.float64) + offset
+    write_dbd(str(path), Toolpath(x, -x, np.full(n, MARK), dict(DEFAULT_HEADER)))
+
+
+def test_second_read_maps_the_cached_arrays(tmp_path, cache):
+    path = tmp_path / 'part.dbd'
+    write_part(path, 100)
+    with open(path, 'a') as f:
+        f.write('bogus line\n')
+    report = ParseReport()
+    first = cache.read_dbd(str(path), report)
+    assert report.count == 1
+    assert cache.load(str(path)) is not None
+
+    report = ParseReport()
+    second = cache.read_dbd(str(path), report)
+    # 数组映射自缓存文件，没有重新解析
+    assert isinstance(second.x.base, np.memmap)
+    assert np.array_equal(second.x, first.x) and np.array_equal(second.action, first.action)
+    assert second.header == first.header
+    # 缓存中也保存了未能解析的行
+    assert report.count == 1 and report.rejected[0][2] == 'bogus line'
+    # 修改映射的数组不影响缓存
+    second.x[0] = 1e9
+    assert cache.load(str(path)).x[0] == 0.0
+
+
+def test_changed_file_invalidates_the_entry(tmp_path, cache):
+    path = tmp_path / 'part.dbd'
+    write_part(path, 100)
+    cache.read_dbd(str(path))
+    stat = os.stat(path)
+
+    # 只有修改时间变化、内容相同时核对哈希值后继续使用
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(str(path)) is not None
+
+    # 大小相同而内容不同
+    write_part(path, 100, offset=0.5)
+    assert os.stat(path).st_size == stat.st_size
+    assert cache.load(str(path)) is None
+    assert cache.read_dbd(str(path)).x[0] == 0.5
+
+    # 大小变化
+    write_part(path, 50)
+    assert cache.load(str(path)) is None
+    assert len(cache.read_dbd(str(path))) == 50
+
+
+def test_evicts_the_least_recently_used_entries(tmp_path, cache):
+    paths = [tmp_path / f'part{i}.dbd' for i in range(3)]
+    for i, path in enumerate(paths):
+        write_part(path, 1000)
+        cache.read_dbd(str(path))
+        # 依次使用，最近使用时间记录在元数据的修改时间中
+        meta = cache._paths(cache._key(str(path)))['meta']
+        os.utime(meta, (1000 + i, 1000 + i))
+    entry_size = cache.entries()[0][1]
+    assert len(cache.entries()) == 3
+
+    # 使用第一个文件，再缩小上限到两个条目
+    cache.load(str(paths[0]))
+    cache.max_bytes = 2 * entry_size
+    cache.evict()
+    assert cache.load(str(paths[1])) is None
+    assert cache.load(str(paths[0])) is not None
+    assert cache.load(str(paths[2])) is not None
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_small_files_are_not_cached(tmp_path):
+    cache = DbdCache(str(tmp_path / 'cache'))
+    path = tmp_path / 'small.dbd'
+    write_part(path, 10)
+    assert len(cache.read_dbd(str(path))) == 10
+    assert cache.entries() == []
+    assert np.array_equal(read_dbd(str(path)).x, np.arange(10))
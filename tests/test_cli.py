@@ -0,0 +1,89 @@
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import cli
+from tools import DEFAULT_HEADER, JUMP, MARK, Toolpath, read_csv, read_dbd, write_dbd
+
+
+def write_csv_text(path, rows):
+    path.write_text(''.join(f'{x},{y},{action}\n' for x, y, action in rows))
+
+
+def test_one_failing_file_does_not_stop_the_batch(tmp_path, monkeypatch, capsys):
+    # 在线程中转换，使替换的read_input同样生效
+    monkeypatch.setattr(cli, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    read_input = cli.read_input
+
+    def broken_read_input(src, *args):
+        if src.endswith('b.csv'):
+            raise KeyError('MarkSpeed')
+        return read_input(src, *args)
+
+    monkeypatch.setattr(cli, 'read_input', broken_read_input)
+    for name in ('a.csv', 'b.csv', 'c.csv'):
+        write_csv_text(tmp_path / name, [(0, 0, 'jump'), (1, 1, 'mark')])
+    out = tmp_path / 'out'
+    assert cli.main([str(tmp_path), '-o', str(out), '-j', '2']) == 1
+    assert (out / 'a.dbd').exists() and (out / 'c.dbd').exists()
+    assert not (out / 'b.dbd').exists()
+    assert "b.csv：转换失败，KeyError: 'MarkSpeed'" in capsys.readouterr().err
+
+    assert cli.main([str(tmp_path), '--estimate', '-j', '2']) == 1
+    captured = capsys.readouterr()
+    assert "b.csv：估算失败，KeyError" in captured.err
+    assert '合计：2个文件' in captured.out
+
+
+def test_convert_csv_to_dbd_and_back(tmp_path):
+    src = tmp_path / 'part.csv'
+    write_csv_text(src, [(0, 0, 'jump'), (1.5, 2, 'mark'), (3, -4, 'mark')])
+    assert cli.main([str(src), '--mark-speed', '800', '-j', '1']) == 0
+    toolpath = read_dbd(str(tmp_path / 'part.dbd'))
+    assert list(toolpath.x) == [0.0, 1.5, 3.0]
+    assert list(toolpath.y) == [0.0, 2.0, -4.0]
+    assert list(toolpath.action) == [JUMP, MARK, MARK]
+    assert toolpath.header['MarkSpeed'] == '800'
+    assert toolpath.header['JumpSpeed'] == DEFAULT_HEADER['JumpSpeed']
+
+    out = tmp_path / 'back.csv'
+    assert cli.main([str(tmp_path / 'part.dbd'), '-o', str(out), '-j', '1']) == 0
+    assert read_csv(str(out)).y.tolist() == [0.0, 2.0, -4.0]
+
+
+def test_dbd_keeps_its_header_and_converts_units(tmp_path):
+    src = tmp_path / 'inch.dbd'
+    write_dbd(str(src), Toolpath([1.0], [2.0], [MARK], {**DEFAULT_HEADER, 'Unit': 'inch', 'MarkSpeed': '10'}))
+    dst = tmp_path / 'mm.dbd'
+    assert cli.main([str(src), '--to', 'dbd', '-o', str(dst), '--unit', 'mm', '--jump-delay', '7', '-j', '1']) == 0
+    toolpath = read_dbd(str(dst))
+    assert toolpath.header['Unit'] == 'mm'
+    assert math.isclose(float(toolpath.header['MarkSpeed']), 254.0)
+    assert toolpath.header['JumpDelay'] == '7'
+    assert toolpath.header['MarkDelay'] == DEFAULT_HEADER['MarkDelay']
+    assert math.isclose(toolpath.x[0], 25.4) and math.isclose(toolpath.y[0], 50.8)
+
+
+def test_refuses_to_overwrite_the_input(tmp_path, capsys):
+    src = tmp_path / 'part.dbd'
+    write_dbd(str(src), Toolpath([1.0], [2.0], [MARK], dict(DEFAULT_HEADER)))
+    text = src.read_text()
+    assert cli.main([str(src), '--to', 'dbd', '--mark-speed', '1', '-j', '1']) == 1
+    assert src.read_text() == text
+    assert '--overwrite' in capsys.readouterr().err
+    assert cli.main([str(src), '--to', 'dbd', '--mark-speed', '1', '--overwrite', '-j', '1']) == 0
+    assert read_dbd(str(src)).header['MarkSpeed'] == '1'
+
+
+def test_estimate_prints_each_file_and_the_total(tmp_path, capsys):
+    for name, length in (('a.csv', 3), ('b.csv', 4)):
+        write_csv_text(tmp_path / name, [(0, 0, 'jump'), (length, 0, 'mark')])
+    args = [str(tmp_path), '--estimate', '--mark-speed', '1', '--jump-speed', '1000', '-j', '1']
+    for key in ('--laser-on-delay', '--laser-off-delay', '--jump-delay', '--mark-delay', '--step-period'):
+        args += [key, '0']
+    assert cli.main(args) == 0
+    out = capsys.readouterr().out
+    assert 'a.csv：2行，预计耗时0:00:03.000' in out
+    assert 'b.csv：2行，预计耗时0:00:04.000' in out
+    assert '合计：2个文件，预计耗时0:00:07.000' in out
+    # 没有写出任何文件
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a.csv', 'b.csv']
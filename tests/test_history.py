@@ -0,0 +1,87 @@
+import numpy as np
+
+import history
+from history import History, Repeat, Transform
+from tools import JUMP, MARK, Toolpath, rotation, scaling
+
+
+class Model:
+    '''
+    只有toolpath的最简单的表格模型，变换命令只需要reset。
+    '''
+    def __init__(self, toolpath):
+        self.toolpath = toolpath
+
+    def reset(self):
+        pass
+
+
+def make_toolpath(n):
+    rng = np.random.default_rng(0)
+    x = np.round(rng.random(n) * 100, 6)
+    y = np.round(rng.random(n) * 100, 6)
+    # 包括0，逆变换的误差会让它变成很小的非0值
+    x[0] = y[0] = 0.0
+    return Toolpath(x, y, np.zeros(n, dtype=np.uint8))
+
+
+def test_transform_undo_restores_coordinates_exactly():
+    toolpath = make_toolpath(100000)
+    x, y = toolpath.x.copy(), toolpath.y.copy()
+    model, h = Model(toolpath), History()
+    command = Transform(rotation(33, 5, 7))
+    command.redo(model)
+    h.push(command)
+    h.undo(model)
+    assert np.array_equal(toolpath.x, x)
+    assert np.array_equal(toolpath.y, y)
+    h.redo(model)
+    h.undo(model)
+    assert np.array_equal(toolpath.x, x)
+
+
+def test_transform_undo_of_large_range_is_within_tolerance(monkeypatch):
+    monkeypatch.setattr(history, 'EXACT_ROWS', 10)
+    toolpath = make_toolpath(1000)
+    x, y = toolpath.x.copy(), toolpath.y.copy()
+    model, h = Model(toolpath), History()
+    command = Transform(scaling(3.7, 0.3, 1, 2) @ rotation(33, 5, 7))
+    command.redo(model)
+    h.push(command)
+    # 大范围的变换只保存参数
+    assert command.nbytes == 0
+    h.undo(model)
+    assert np.allclose(toolpath.x, x, rtol=0, atol=1e-9)
+    assert np.allclose(toolpath.y, y, rtol=0, atol=1e-9)
+    assert toolpath.x[0] == 0.0 and not np.signbit(toolpath.x[0])
+    assert toolpath.y[0] == 0.0 and not np.signbit(toolpath.y[0])
+
+
+def test_singular_transform_undo_restores_coordinates(monkeypatch):
+    monkeypatch.setattr(history, 'EXACT_ROWS', 10)
+    toolpath = make_toolpath(1000)
+    x = toolpath.x.copy()
+    model, h = Model(toolpath), History()
+    command = Transform(scaling(0, 1), 100, 200)
+    command.redo(model)
+    h.push(command)
+    h.undo(model)
+    assert np.array_equal(toolpath.x, x)
+
+
+def test_repeat_to_end_undo_deletes_added_rows():
+    toolpath = Toolpath([0.0, 1.0, 1.0], [0.0, 0.0, 1.0], [JUMP, MARK, MARK])
+    x, y, action = toolpath.x.copy(), toolpath.y.copy(), toolpath.action.copy()
+    model, h = Model(toolpath), History()
+    command = Repeat(2, 2, 5.0, 5.0, 0, None)
+    command.redo(model)
+    h.push(command)
+    assert len(toolpath) == 4 * 3 + 3
+    h.undo(model)
+    assert np.array_equal(toolpath.x, x) and np.array_equal(toolpath.y, y)
+    assert np.array_equal(toolpath.action, action)
+    # 重做时复制的仍是原来的行
+    h.redo(model)
+    assert len(toolpath) == 15
+    h.undo(model)
+    assert len(toolpath) == 3
@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+import pytest
+
+from importers import read_file
+from tools import JUMP, MARK, ParseReport
+
+
+def test_gcode_full_circle_from_i_j_only(tmp_path):
+    path = tmp_path / 'circle.gcode'
+    path.write_text('G21 G90\nG0 X10 Y0\nG2 I-10 J0\nG1 X20 Y0\n')
+    report = ParseReport()
+    toolpath = read_file(str(path), report, tolerance=0.01)
+    assert report.count == 0
+    assert toolpath.action[0] == JUMP
+    assert (toolpath.x[0], toolpath.y[0]) == (10.0, 0.0)
+    # 圆心在原点，半径10，展开的点都在圆上，回到起点后再直线标刻到(20, 0)
+    circle = slice(1, len(toolpath) - 1)
+    assert len(toolpath) > 10
+    assert np.all(toolpath.action[1:] == MARK)
+    assert np.allclose(np.hypot(toolpath.x[circle], toolpath.y[circle]), 10.0)
+    assert (toolpath.x[-2], toolpath.y[-2]) == (10.0, 0.0)
+    assert (toolpath.x[-1], toolpath.y[-1]) == (20.0, 0.0)
+    # 顺时针：从(10, 0)出发先经过y < 0的一侧
+    assert toolpath.y[1] < 0
+    # 绕了整整一圈
+    angles = np.unwrap(np.arctan2(toolpath.y[:-1], toolpath.x[:-1]))
+    assert math.isclose(angles[-1] - angles[0], -2 * math.pi)
+
+
+@pytest.mark.parametrize('tolerance', [0.0, -0.1])
+def test_non_positive_tolerance_is_rejected(tmp_path, tolerance):
+    path = tmp_path / 'arc.gcode'
+    path.write_text('G0 X10 Y0\nG2 I-10 J0\n')
+    with pytest.raises(ValueError):
+        read_file(str(path), tolerance=tolerance)
+
+
+def test_dxf_extrusion_mirrors_only_ocs_entities(tmp_path):
+    path = tmp_path / 'mirror.dxf'
+    pairs = [
+        (0, 'SECTION'), (2, 'ENTITIES'),
+        (0, 'LINE'), (10, 1), (20, 2), (11, 3), (21, 4), (230, -1),
+        (0, 'ARC'), (10, 0), (20, 0), (40, 10), (50, 0), (51, 90), (230, -1),
+        (0, 'ENDSEC'), (0, 'EOF'),
+    ]
+    path.write_text(''.join(f'{code}\n{value}\n' for code, value in pairs))
+    report = ParseReport()
+    toolpath = read_file(str(path), report, tolerance=0.01)
+    assert report.count == 0
+    # LINE的端点是世界坐标，不翻转
+    assert (toolpath.x[0], toolpath.y[0], toolpath.action[0]) == (1.0, 2.0, JUMP)
+    assert (toolpath.x[1], toolpath.y[1], toolpath.action[1]) == (3.0, 4.0, MARK)
+    # ARC在图元坐标系中从0°逆时针到90°，翻转后从(-10, 0)到(0, 10)
+    assert toolpath.action[2] == JUMP
+    assert (toolpath.x[2], toolpath.y[2]) == (-10.0, 0.0)
+    arc = slice(2, None)
+    assert np.all(toolpath.action[3:] == MARK)
+    assert np.allclose(np.hypot(toolpath.x[arc], toolpath.y[arc]), 10.0)
+    assert np.all(toolpath.x[arc] <= 1e-9)
+    assert math.isclose(toolpath.x[-1], 0.0, abs_tol=1e-9) and math.isclose(toolpath.y[-1], 10.0)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from lod import LodIndex
+
+
+def random_segments(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x0, y0 = rng.random(n) * 100, rng.random(n) * 100
+    # 大部分是短线段，也有跨越多个分块的长线段
+    length = np.where(rng.random(n) < 0.05, 50.0, 0.5)
+    angle = rng.random(n) * 2 * np.pi
+    return x0, y0, x0 + length * np.cos(angle), y0 + length * np.sin(angle)
+
+
+def segment_set(x, y):
+    '''
+    把以NaN分隔的曲线还原为线段的集合。
+    '''
+    return set(zip(x[0::3].tolist(), y[0::3].tolist(), x[1::3].tolist(), y[1::3].tolist()))
+
+
+def test_fine_query_returns_every_visible_segment():
+    x0, y0, x1, y1 = random_segments(20000)
+    index = LodIndex(x0, y0, x1, y1)
+    assert len(index) == 20000
+    xlim, ylim = (20.0, 35.0), (60.0, 70.0)
+    x, y = index.query(xlim, ylim, 1e-6)
+    assert np.isnan(x[2::3]).all()
+    visible = (
+        (np.maximum(x0, x1) >= xlim[0]) & (np.minimum(x0, x1) <= xlim[1])
+        & (np.maximum(y0, y1) >= ylim[0]) & (np.minimum(y0, y1) <= ylim[1])
+    )
+    expected = {
+        tuple(np.float32(v).item() for v in segment)
+        for segment in zip(x0[visible], y0[visible], x1[visible], y1[visible])
+    }
+    assert segment_set(x, y) == expected
+
+
+def test_coarse_query_snaps_to_a_grid_no_finer_than_a_pixel():
+    x0, y0, x1, y1 = random_segments(20000)
+    index = LodIndex(x0, y0, x1, y1)
+    pixel = 1.0
+    x, y = index.query((0.0, 100.0), (0.0, 100.0), pixel)
+    fine, _ = index.query((0.0, 100.0), (0.0, 100.0), 1e-6)
+    assert 0 < len(x) < len(fine)
+    cell_size = next(size for size, _ in index.levels if size <= pixel)
+    assert cell_size > pixel / 2
+    # 端点都在格子中心，去掉了缩成一点的和重复的线段
+    segments = segment_set(x, y)
+    assert len(segments) == len(x) // 3
+    assert all((a, b) != (c, d) for a, b, c, d in segments)
+    xmin = min(x0.min(), x1.min())
+    offset = (x[0::3] - xmin) / cell_size - 0.5
+    assert np.allclose(offset, np.round(offset), atol=1e-3)
+
+
+def test_empty_index():
+    index = LodIndex([], [], [], [])
+    assert len(index) == 0
+    x, y = index.query((0, 1), (0, 1), 0.1)
+    assert len(x) == len(y) == 0
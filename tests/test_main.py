@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+pytest.importorskip('PySide2.QtWidgets')
+
+from main import MovementTableModel  # noqa: E402
+from tools import JUMP, MARK, Toolpath  # noqa: E402
+
+
+def test_unit_switch_changes_display_only():
+    x = [1.0 / 3, 25.4, -7.123456789]
+    model = MovementTableModel(Toolpath(x, [0.1, 0.2, 0.3], [JUMP, MARK, MARK]))
+    for unit in ('inch', 'mm', 'inch', 'mm') * 5:
+        model.set_unit(unit)
+    assert model.toolpath.x.tolist() == x
+    model.set_unit('inch')
+    assert model.data(model.index(1, 0)) == '1.000000'
+    assert model.headerData(0, 1) == 'X/inch'
+    # 编辑时按当前单位换算回毫米
+    assert model.setData(model.index(0, 1), '2')
+    assert model.toolpath.y[0] == 2 * 25.4
+    model.history.undo(model)
+    assert model.toolpath.y[0] == 0.1
@@ -0,0 +1,102 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import optimize
+from optimize import optimize as optimize_toolpath, simplify
+from tools import JUMP, MARK, Toolpath
+
+
+def random_toolpath(n, seed):
+    rng = np.random.default_rng(seed)
+    x = np.round(rng.random(n) * 100, 3)
+    y = np.round(rng.random(n) * 100, 3)
+    action = np.where(rng.random(n) < 0.6, MARK, JUMP).astype(np.uint8)
+    return Toolpath(x, y, action)
+
+
+def mark_segments(toolpath, directed):
+    x0, y0, x1, y1, action = toolpath.segments()
+    mark = action == MARK
+    segments = zip(x0[mark].tolist(), y0[mark].tolist(), x1[mark].tolist(), y1[mark].tolist())
+    if directed:
+        return Counter(segments)
+    return Counter(tuple(sorted(((a, b), (c, d)))) for a, b, c, d in segments)
+
+
+@pytest.mark.parametrize('reverse', [True, False])
+@pytest.mark.parametrize('max_shift', [optimize.MAX_SHIFT, 3])
+def test_optimize_keeps_marks_and_never_lengthens_jumps(monkeypatch, reverse, max_shift):
+    # max_shift很小时很多调整会越过原点，或者被跳过
+    monkeypatch.setattr(optimize, 'MAX_SHIFT', max_shift)
+    for seed in range(30):
+        toolpath = random_toolpath(200, seed)
+        result, report = optimize_toolpath(toolpath, reverse=reverse)
+        assert mark_segments(result, directed=not reverse) == mark_segments(toolpath, directed=not reverse)
+        assert report.after.jump_length <= report.before.jump_length + 1e-9
+        assert report.after.mark_length == pytest.approx(report.before.mark_length)
+        # 最后一笔之后的跳转保持原样
+        tail = len(toolpath) - 1 - np.flatnonzero(toolpath.action == MARK)[-1]
+        assert np.array_equal(result.x[len(result) - tail:], toolpath.x[len(toolpath) - tail:])
+
+
+def test_optimize_orders_hatch_lines():
+    # 十条平行线按打乱的顺序交替方向标刻
+    order = [3, 7, 0, 9, 5, 1, 8, 2, 6, 4]
+    x = np.array([[0.0, 10.0] if i % 2 else [10.0, 0.0] for i in range(10)]).ravel()
+    y = np.repeat(np.array(order, dtype=np.float64), 2)
+    toolpath = Toolpath(x, y, np.tile([JUMP, MARK], 10))
+    result, report = optimize_toolpath(toolpath)
+    assert report.strokes == 10
+    # 从原点所在的线开始逐条标刻，每次只跳到相邻的线，跳到原点的那一次被省略
+    assert report.after.jump_length == pytest.approx(9.0)
+    assert report.after.jumps == 9
+
+
+def test_optimize_without_marks_returns_a_copy():
+    toolpath = Toolpath([1.0, 2.0], [3.0, 4.0], [JUMP, JUMP])
+    result, report = optimize_toolpath(toolpath)
+    assert result is not toolpath
+    assert np.array_equal(result.x, toolpath.x)
+    assert report.strokes == 0
+
+
+def test_simplify_removes_redundant_commands():
+    toolpath = Toolpath(
+        [5.0, 0.0, 0.0, 1.0, 2.0, 2.0, 3.0, 3.0],
+        [5.0, 0.0, 0.0, 1.0, 2.0, 2.0, 2.0, 2.0],
+        [JUMP, JUMP, MARK, MARK, MARK, MARK, MARK, JUMP],
+    )
+    result, report = simplify(toolpath)
+    # 跳到(5, 5)被后一次跳转覆盖，跳回原点和重复的点长度为0，(1, 1)在(0, 0)到(2, 2)的直线上
+    assert list(zip(result.x, result.y, result.action)) == [(2.0, 2.0, MARK), (3.0, 2.0, MARK)]
+    assert report.jumps == 1
+    assert report.zero_length == 4
+    assert report.collinear == 1
+    assert report.tolerance == 0
+    assert report.removed == len(toolpath) - len(result)
+
+
+def point_to_polyline(px, py, x, y):
+    '''
+    点(px, py)到折线(x, y)的最短距离。
+    '''
+    ax, ay, dx, dy = x[:-1], y[:-1], np.diff(x), np.diff(y)
+    t = np.clip(((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy), 0.0, 1.0)
+    return np.hypot(ax + t * dx - px, ay + t * dy - py).min()
+
+
+def test_simplify_with_tolerance_stays_within_tolerance():
+    t = np.linspace(0, 2 * np.pi, 2001)
+    x, y = 10 * np.cos(t), 10 * np.sin(t)
+    action = np.full(len(t), MARK, dtype=np.uint8)
+    action[0] = JUMP
+    toolpath = Toolpath(x, y, action)
+    tolerance = 0.01
+    result, report = simplify(toolpath, tolerance)
+    assert len(result) < len(toolpath) // 10
+    assert report.tolerance == len(toolpath) - len(result)
+    # 起点和终点保留，去掉的每个点离简化后的折线都不超过tolerance
+    assert (result.x[0], result.y[0], result.x[-1], result.y[-1]) == (x[0], y[0], x[-1], y[-1])
+    assert max(point_to_polyline(px, py, result.x, result.y) for px, py in zip(x, y)) <= tolerance
@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+
+from spatial import PointGrid, SegmentGrid, approximate_neighbours
+
+
+def brute_nearest_segment(x0, y0, x1, y1, px, py):
+    dx, dy = x1 - x0, y1 - y0
+    norm = dx * dx + dy * dy
+    t = np.clip(np.divide((px - x0) * dx + (py - y0) * dy, norm, out=np.zeros_like(norm), where=norm > 0), 0, 1)
+    distance = np.hypot(x0 + t * dx - px, y0 + t * dy - py)
+    return int(np.argmin(distance)), float(distance.min())
+
+
+def test_segment_grid_matches_brute_force():
+    rng = np.random.default_rng(0)
+    n = 3000
+    x0, y0 = rng.random(n) * 100, rng.random(n) * 100
+    # 少量很长的线段单独保存，也有长度为0的线段
+    length = np.where(rng.random(n) < 0.02, 80.0, rng.random(n) * 2)
+    angle = rng.random(n) * 2 * np.pi
+    x1, y1 = x0 + length * np.cos(angle), y0 + length * np.sin(angle)
+    x1[:10], y1[:10] = x0[:10], y0[:10]
+    grid = SegmentGrid(x0, y0, x1, y1)
+    assert len(grid.long) > 0
+    for px, py in rng.random((200, 2)) * 140 - 20:
+        i, distance = grid.nearest(px, py)
+        j, expected = brute_nearest_segment(x0, y0, x1, y1, px, py)
+        assert math.isclose(distance, expected, rel_tol=1e-12, abs_tol=1e-12)
+        assert i == j
+        # 超出max_distance时找不到
+        assert grid.nearest(px, py, expected * 0.99) == (-1, math.inf)
+
+
+def test_empty_segment_grid():
+    grid = SegmentGrid([], [], [], [])
+    assert grid.nearest(0.0, 0.0) == (-1, math.inf)
+
+
+def test_point_grid_nearest_after_removals():
+    rng = np.random.default_rng(1)
+    x, y = rng.random(2000) * 50, rng.random(2000) * 50
+    grid = PointGrid(x, y)
+    alive = np.ones(len(x), dtype=bool)
+    # 删除大部分点，中途会重建网格
+    for i in rng.permutation(len(x))[:1800]:
+        grid.remove(int(i))
+        alive[i] = False
+    assert len(grid) == 200
+    ids = np.flatnonzero(alive)
+    for px, py in rng.random((100, 2)) * 60 - 5:
+        d = np.hypot(x[ids] - px, y[ids] - py)
+        expected = ids[np.argsort(d, kind='stable')[:3]]
+        assert np.allclose(np.hypot(x[grid.nearest(px, py, 3)] - px, y[grid.nearest(px, py, 3)] - py),
+                           np.hypot(x[expected] - px, y[expected] - py))
+
+
+def test_approximate_neighbours_skip_self_and_group():
+    rng = np.random.default_rng(2)
+    x, y = rng.random(500), rng.random(500)
+    groups = np.arange(500) >> 1
+    neighbours = approximate_neighbours(x, y, 4, groups)
+    assert neighbours.shape == (500, 4)
+    for i, row in enumerate(neighbours):
+        found = row[row >= 0]
+        assert len(found) > 0
+        assert i not in found and (i ^ 1) not in found
+        assert len(set(found.tolist())) == len(found)
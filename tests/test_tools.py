@@ -0,0 +1,129 @@
+import math
+
+import numpy as np
+
+from tools import (
+    ACTIONS, BLOCK_SIZE, DEFAULT_HEADER, HEADER_KEYS, JUMP, MARK, ParseReport, Toolpath, _DbdState, _bulk_moves,
+    _parse_dbd_lines, estimate_time, iter_dbd, movement_times, out_of_bounds, read_csv, read_dbd, sniff_delimiter,
+    write_dbd
+)
+
+
+def test_sniff_delimiter_ignores_malformed_first_row():
+    lines = ['1\t2', '1\t2\tjump', '3\t4\tmark', '5\t6\tmark']
+    assert sniff_delimiter(lines) == '\t'
+
+
+def test_read_csv_with_malformed_first_row(tmp_path):
+    path = tmp_path / 'bad_first.csv'
+    path.write_text('1\t2\t3\tjump\n1\t2\tjump\n3\t4\tmark\n5\t6\tmark\n')
+    report = ParseReport()
+    toolpath = read_csv(str(path), report)
+    assert len(toolpath) == 3
+    assert list(toolpath.x) == [1.0, 3.0, 5.0]
+    assert report.count == 1
+    assert report.rejected[0][0] == 1
+
+
+def test_estimate_rounds_moves_up_to_step_period():
+    toolpath = Toolpath([3.0, 3.0, 3.25], [4.0, 5.0, 5.0], [JUMP, MARK, MARK])
+    header = {
+        'JumpSpeed': '1000', 'MarkSpeed': '100', 'StepPeriod': '1',
+        'LaserOnDelay': '0', 'LaserOffDelay': '0', 'JumpDelay': '0', 'MarkDelay': '0',
+    }
+    estimate = estimate_time(toolpath, header)
+    # 跳转5毫米用5毫秒，标刻1毫米用10毫秒，0.25毫米的2.5毫秒取整为3毫秒
+    assert math.isclose(estimate.jump_time, 0.005)
+    assert math.isclose(estimate.mark_time, 0.013)
+    start, end, total = movement_times(toolpath, header)
+    assert math.isclose(total, estimate.total)
+    assert np.allclose(end - start, [0.005, 0.010, 0.003])
+    # StepPeriod为0时不取整
+    estimate = estimate_time(toolpath, {**header, 'StepPeriod': '0'})
+    assert math.isclose(estimate.mark_time, 0.0125)
+
+
+def write_dbd_text(path, moves, before='', after=''):
+    lines = ['File: part.dbd', 'Unit: mm', 'Start_List']
+    lines += [f'{key} {DEFAULT_HEADER[key]}' for key in HEADER_KEYS]
+    lines += [before] if before else []
+    lines += [f'{ACTIONS[action]}_abs {x} {y}' for x, y, action in moves]
+    lines += [after] if after else []
+    lines.append('End_List')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def test_dbd_round_trip_with_small_blocks(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 500
+    toolpath = Toolpath(
+        np.round(rng.random(n) * 100, 6), np.round(rng.random(n) * 100, 6),
+        rng.integers(0, 2, n).astype(np.uint8), dict(DEFAULT_HEADER)
+    )
+    path = tmp_path / 'round.dbd'
+    write_dbd(str(path), toolpath)
+    for block_size in (BLOCK_SIZE, 97):
+        report = ParseReport()
+        chunks = [chunk for chunk, _ in iter_dbd(str(path), report, block_size)]
+        result = Toolpath.concatenate(chunks, chunks[-1].header)
+        assert report.count == 0
+        assert np.array_equal(result.x, toolpath.x)
+        assert np.array_equal(result.y, toolpath.y)
+        assert np.array_equal(result.action, toolpath.action)
+        assert result.header['MarkSpeed'] == DEFAULT_HEADER['MarkSpeed']
+        assert result.header['File'] == 'round'
+
+
+def test_bulk_moves_match_line_parser():
+    text = 'jump_abs 1 2\nmark_abs 3.5 -4\nmark_abs\t5  6e-1\njump_abs 0 0'
+    state = _DbdState()
+    state.section = state.IN_LIST
+    lines = _parse_dbd_lines(1, text, state, ParseReport())
+    bulk = _bulk_moves(text)
+    assert bulk is not None
+    for a, b in zip(bulk, lines):
+        assert np.array_equal(a, b)
+    assert list(bulk[2]) == [JUMP, MARK, MARK, JUMP]
+    # 有一行格式不对时整块退回逐行解析
+    assert _bulk_moves(text + '\nmark_abs 1') is None
+    assert _bulk_moves(text + '\nmark_abs 1 x') is None
+
+
+def test_dbd_reports_bad_lines_and_keeps_the_rest(tmp_path):
+    path = tmp_path / 'bad.dbd'
+    moves = [(1.0, 2.0, JUMP), (3.0, 4.0, MARK), (5.0, 6.0, MARK)]
+    write_dbd_text(path, moves, after='mark_abs 7 oops')
+    path.write_text('jump_abs 9 9\n' + path.read_text())
+    report = ParseReport()
+    toolpath = read_dbd(str(path), report)
+    assert list(toolpath.x) == [1.0, 3.0, 5.0]
+    assert list(toolpath.action) == [JUMP, MARK, MARK]
+    assert report.count == 2
+    # 第1行在Start_List之前，坐标有误的行在第1 + 3 + 7 + 3 + 1行
+    assert [lineno for lineno, _, _ in report.rejected] == [1, 15]
+
+
+def test_dbd_missing_end_list_is_reported(tmp_path):
+    path = tmp_path / 'open.dbd'
+    path.write_text('Start_List\njump_abs 1 2\nmark_abs 3 4\n')
+    report = ParseReport()
+    toolpath = read_dbd(str(path), report)
+    assert len(toolpath) == 2
+    assert report.count == 1
+    assert report.rejected[0][1] == '缺少End_List'
+
+
+def test_out_of_bounds_checks_both_ends_of_each_row():
+    # 第0行从原点出发，圆心在(10, 0)、半径为10时原点正好在圆周上
+    toolpath = Toolpath([20.0, 25.0, 15.0, 10.0], [0.0, 0.0, 0.0, 5.0], [MARK, JUMP, MARK, MARK])
+    assert out_of_bounds(toolpath, 10.0, 0.0, 10.0).tolist() == [1, 2]
+    assert out_of_bounds(toolpath, 10.0, 0.0, 100.0).tolist() == []
+
+
+def test_time_estimate_converts_lengths_only():
+    toolpath = Toolpath([1.0, 2.0, 2.0], [0.0, 0.0, 3.0], [JUMP, MARK, MARK])
+    estimate = estimate_time(toolpath)
+    inch = estimate.converted('inch')
+    assert inch.unit == 'inch' and inch.total == estimate.total
+    assert math.isclose(inch.mark_length, 4.0 / 25.4) and math.isclose(inch.jump_length, 1.0 / 25.4)
+    assert math.isclose(inch.converted('mm').mark_length, estimate.mark_length)
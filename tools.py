@@ -1,44 +1,724 @@
-from os.path import splitext
+import os
+import tempfile
+from os.path import basename, splitext
 
+import numpy as np
 
-def read_dbd(filepath: str) -> dict:
+
+# 动作编码，Toolpath.action中保存的是ACTIONS的下标
+ACTIONS = ('jump', 'mark')
+JUMP = 0
+MARK = 1
+
+# 文件头中的参数，按写入.dbd文件时的顺序排列
+HEADER_KEYS = (
+    'LaserOnDelay', 'LaserOffDelay', 'JumpSpeed', 'MarkSpeed',
+    'JumpDelay', 'MarkDelay', 'StepPeriod'
+)
+
+# 新建文件时使用的文件头参数
+DEFAULT_HEADER = {
+    'File': 'Untitled', 'Unit': 'mm',
+    'LaserOnDelay': '15', 'LaserOffDelay': '190', 'JumpSpeed': '7379.995', 'MarkSpeed': '500.000',
+    'JumpDelay': '500', 'MarkDelay': '500', 'StepPeriod': '100'
+}
+
+# 每个长度单位相当于多少毫米
+UNIT_SCALE = {'mm': 1.0, 'inch': 25.4}
+
+
+def action_code(action) -> int:
+    '''
+    将动作转换为编码，动作可以是'jump'、'mark'或编码本身。
+    '''
+    if isinstance(action, str):
+        return ACTIONS.index(action)
+    return int(action)
+
+
+class Toolpath:
+    '''
+    坐标序列的列式存储。
+    x、y为float64数组，action为uint8数组（JUMP或MARK），header保存文件头中的参数（字符串形式）。
+    第i行表示从第i-1行的坐标（第0行则从原点出发）以action[i]移动到第i行的坐标。
+    '''
+    def __init__(self, x=(), y=(), action=(), header=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.action = np.asarray(action, dtype=np.uint8)
+        self.header = dict(header) if header else {}
+
+    @classmethod
+    def from_movements(cls, movements, header=None):
+        '''
+        由(x, y, action)元组组成的列表创建，元组中的元素可以是字符串。
+        '''
+        x = [float(movement[0]) for movement in movements]
+        y = [float(movement[1]) for movement in movements]
+        action = [action_code(movement[2]) for movement in movements]
+        return cls(x, y, action, header)
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def nbytes(self) -> int:
+        return self.x.nbytes + self.y.nbytes + self.action.nbytes
+
+    @classmethod
+    def concatenate(cls, toolpaths, header=None):
+        '''
+        将多个Toolpath按顺序拼接为一个。
+        '''
+        toolpath = cls(header=header)
+        if toolpaths:
+            toolpath.x = np.concatenate([t.x for t in toolpaths])
+            toolpath.y = np.concatenate([t.y for t in toolpaths])
+            toolpath.action = np.concatenate([t.action for t in toolpaths])
+        return toolpath
+
+    def copy(self):
+        return Toolpath(self.x.copy(), self.y.copy(), self.action.copy(), self.header)
+
+    def row(self, row: int) -> tuple:
+        return float(self.x[row]), float(self.y[row]), ACTIONS[self.action[row]]
+
+    def set_row(self, row: int, x=None, y=None, action=None):
+        if x is not None:
+            self.x[row] = x
+        if y is not None:
+            self.y[row] = y
+        if action is not None:
+            self.action[row] = action_code(action)
+
+    def insert(self, row: int, x=0.0, y=0.0, action=JUMP):
+        self.x = np.insert(self.x, row, x)
+        self.y = np.insert(self.y, row, y)
+        self.action = np.insert(self.action, row, action_code(action))
+
+    def insert_rows(self, row: int, rows):
+        '''
+        在第row行之前插入另一个Toolpath中的所有行。
+        '''
+        self.x = np.concatenate((self.x[:row], rows.x, self.x[row:]))
+        self.y = np.concatenate((self.y[:row], rows.y, self.y[row:]))
+        self.action = np.concatenate((self.action[:row], rows.action, self.action[row:]))
+
+    def rows(self, start: int, stop: int):
+        '''
+        返回第start行到第stop-1行的副本。
+        '''
+        return Toolpath(self.x[start:stop].copy(), self.y[start:stop].copy(), self.action[start:stop].copy())
+
+    def delete(self, row: int, count=1):
+        '''
+        删除从第row行开始的count行。
+        '''
+        part = slice(row, row + count)
+        self.x = np.delete(self.x, part)
+        self.y = np.delete(self.y, part)
+        self.action = np.delete(self.action, part)
+
+    def move(self, row: int, new_row: int):
+        '''
+        将第row行移动到第new_row行，两者之间的行依次顺移。
+        '''
+        x, y, action = self.x[row], self.y[row], self.action[row]
+        self.delete(row)
+        self.insert(new_row, x, y, action)
+
+    def start_point(self, row: int) -> tuple:
+        '''
+        第row行的起点，即上一行的坐标，第0行为原点。
+        '''
+        if row == 0:
+            return 0.0, 0.0
+        return float(self.x[row - 1]), float(self.y[row - 1])
+
+    def transform(self, matrix, start=0, stop=None):
+        '''
+        对第start行到第stop-1行（默认到最后一行）的坐标做仿射变换，matrix是3×3的齐次变换矩阵。
+        '''
+        matrix = np.asarray(matrix, dtype=np.float64)
+        part = slice(start, stop)
+        x, y = self.x[part], self.y[part]
+        self.x[part], self.y[part] = (
+            matrix[0, 0] * x + matrix[0, 1] * y + matrix[0, 2],
+            matrix[1, 0] * x + matrix[1, 1] * y + matrix[1, 2],
+        )
+
+    def repeat(self, columns: int, rows: int, dx: float, dy: float, start=0, stop=None):
+        '''
+        阵列复制：把第start行到第stop-1行复制为columns列、rows行，相邻两份在x、y方向上相距dx、dy。
+        原来的行位于左下角，复制出的各份依次插在其后，每份之前加一行跳转到该份的起点。
+        '''
+        stop = len(self) if stop is None else stop
+        if columns < 1 or rows < 1:
+            raise ValueError('阵列的行数和列数必须至少为1')
+        if stop <= start or columns * rows == 1:
+            return
+        x0, y0 = self.start_point(start)
+        # 除原来的一份以外各份的偏移，先沿x方向排列
+        j, i = np.divmod(np.arange(1, columns * rows), columns)
+        offset_x, offset_y = i * dx, j * dy
+        block = stop - start
+        # 每份是一行跳转加上block行
+        x = np.concatenate((np.full((len(offset_x), 1), x0), np.tile(self.x[start:stop], (len(offset_x), 1))), axis=1)
+        y = np.concatenate((np.full((len(offset_y), 1), y0), np.tile(self.y[start:stop], (len(offset_y), 1))), axis=1)
+        x += offset_x[:, None]
+        y += offset_y[:, None]
+        action = np.empty((len(offset_x), block + 1), dtype=np.uint8)
+        action[:, 0] = JUMP
+        action[:, 1:] = self.action[start:stop]
+        self.x = np.concatenate((self.x[:stop], x.ravel(), self.x[stop:]))
+        self.y = np.concatenate((self.y[:stop], y.ravel(), self.y[stop:]))
+        self.action = np.concatenate((self.action[:stop], action.ravel(), self.action[stop:]))
+
+    def segments(self) -> tuple:
+        '''
+        返回所有线段的起点x、起点y、终点x、终点y和动作，均为数组。
+        第0条线段从原点出发。
+        '''
+        x0 = np.empty_like(self.x)
+        y0 = np.empty_like(self.y)
+        x0[:1] = 0.0
+        y0[:1] = 0.0
+        x0[1:] = self.x[:-1]
+        y0[1:] = self.y[:-1]
+        return x0, y0, self.x, self.y, self.action
+
+    def polyline(self, action, with_index=False) -> tuple:
+        '''
+        返回动作为action的所有线段连成的折线的x、y数组，不相连的折线之间以NaN分隔。
+        连续的同一动作只产生一段折线，结果可以直接作为一条曲线绘制。
+        with_index为True时还返回每个点（第0个点是原点，第i个点是第i-1行的坐标）
+        在折线数组中的位置，不在折线上的点为-1，用于修改坐标后就地更新折线。
+        '''
+        rows = np.flatnonzero(self.action == action_code(action))
+        point_index = np.full(len(self) + 1, -1, dtype=np.int64)
+        if len(rows) == 0:
+            return (np.empty(0), np.empty(0), point_index) if with_index else (np.empty(0), np.empty(0))
+        # 每段折线的第一行需要额外加入起点，并在起点之前加入NaN
+        starts = np.ones(len(rows), dtype=bool)
+        starts[1:] = rows[1:] != rows[:-1] + 1
+        start_count = np.cumsum(starts)
+        end_index = np.arange(len(rows)) + 2 * start_count - 1
+        start_index = end_index[starts] - 1
+        nan_index = start_index[1:] - 1
+        result = []
+        for values in (self.x, self.y):
+            points = np.concatenate(([0.0], values))
+            line = np.empty(len(rows) + 2 * start_count[-1] - 1)
+            line[end_index] = points[rows + 1]
+            line[start_index] = points[rows[starts]]
+            line[nan_index] = np.nan
+            result.append(line)
+        if with_index:
+            point_index[rows + 1] = end_index
+            point_index[rows[starts]] = start_index
+            result.append(point_index)
+        return tuple(result)
+
+
+def translation(dx: float, dy: float) -> np.ndarray:
+    '''
+    平移的齐次变换矩阵，用于Toolpath.transform。
+    '''
+    return np.array([[1.0, 0.0, dx], [0.0, 1.0, dy], [0.0, 0.0, 1.0]])
+
+
+def _about(matrix: np.ndarray, cx: float, cy: float) -> np.ndarray:
+    # 以(cx, cy)而不是原点为中心做变换
+    return translation(cx, cy) @ matrix @ translation(-cx, -cy)
+
+
+def scaling(sx: float, sy: float = None, cx=0.0, cy=0.0) -> np.ndarray:
+    '''
+    以(cx, cy)为中心缩放的矩阵，sy默认与sx相同。
+    '''
+    sy = sx if sy is None else sy
+    return _about(np.diag([sx, sy, 1.0]), cx, cy)
+
+
+def rotation(angle: float, cx=0.0, cy=0.0) -> np.ndarray:
+    '''
+    绕(cx, cy)逆时针旋转angle度的矩阵。
+    '''
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    return _about(np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]]), cx, cy)
+
+
+def mirroring(axis: str, cx=0.0, cy=0.0) -> np.ndarray:
+    '''
+    镜像的矩阵。axis为'x'时左右翻转（关于直线x=cx对称），为'y'时上下翻转（关于直线y=cy对称）。
+    '''
+    if axis not in ('x', 'y'):
+        raise ValueError(f'无效的镜像方向{axis}')
+    return scaling(-1.0, 1.0, cx, cy) if axis == 'x' else scaling(1.0, -1.0, cx, cy)
+
+
+def out_of_bounds(toolpath: Toolpath, cx: float, cy: float, r: float) -> np.ndarray:
+    '''
+    返回离开以(cx, cy)为圆心、r为半径的工作区域的行号。
+    圆是凸的，线段的两端都在圆内时整条线段都在圆内，
+    因此只要起点或终点在圆外，这一行就离开了工作区域。第0行的起点是原点。
+    '''
+    x = np.concatenate(([0.0], toolpath.x))
+    y = np.concatenate(([0.0], toolpath.y))
+    # 允许与半径大小相称的舍入误差，落在圆周上的点不算超出
+    outside = np.hypot(x - cx, y - cy) > r * (1 + 1e-12)
+    return np.flatnonzero(outside[:-1] | outside[1:])
+
+
+class ParseReport:
+    '''
+    记录解析文件时被拒绝的行。
+    count是被拒绝的总行数，rejected中保存前MAX_DETAILS行的(行号, 原因, 原文)。
+    '''
+    MAX_DETAILS = 10000
+
+    def __init__(self):
+        self.count = 0
+        self.rejected = []
+
+    def reject(self, lineno: int, reason: str, text: str = ''):
+        self.count += 1
+        if len(self.rejected) < self.MAX_DETAILS:
+            self.rejected.append((lineno, reason, text.strip()))
+
+    def __len__(self):
+        return self.count
+
+    def summary(self, limit=10) -> str:
+        lines = [f'共有{self.count}行未能解析：']
+        for lineno, reason, text in self.rejected[:limit]:
+            # 行号为0表示无法确定所在的行（如流式解析的XML元素）
+            where = f'第{lineno}行：' if lineno else ''
+            lines.append(f'{where}{reason}（{text}）' if text else f'{where}{reason}')
+        if self.count > limit:
+            lines.append(f'……其余{self.count - limit}行未列出。')
+        return '\n'.join(lines)
+
+
+# 文件头中的延迟和StepPeriod以ms为单位（与界面中的单位一致），换算为秒的系数
+DELAY_SCALE = 1e-3
+
+
+def format_duration(seconds: float) -> str:
+    '''
+    将秒数格式化为时:分:秒。
+    '''
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f'{hours}:{minutes:02d}:{seconds:06.3f}'
+
+
+class TimeEstimate:
+    '''
+    预计的加工时间，单位为秒。
+    mark_time和jump_time是标刻和跳转的运动时间，delay_time是各种延迟之和；
+    mark_length和jump_length是标刻和跳转的总长度，单位与文件头中的Unit相同。
+    '''
+    def __init__(self, mark_time=0.0, jump_time=0.0, delay_time=0.0,
+        mark_length=0.0, jump_length=0.0, marks=0, jumps=0, unit='mm'
+    ):
+        self.mark_time = mark_time
+        self.jump_time = jump_time
+        self.delay_time = delay_time
+        self.mark_length = mark_length
+        self.jump_length = jump_length
+        self.marks = marks
+        self.jumps = jumps
+        self.unit = unit
+
+    @property
+    def total(self) -> float:
+        return self.mark_time + self.jump_time + self.delay_time
+
+    def converted(self, unit: str):
+        '''
+        返回长度换算为unit的副本，时间不变。
+        '''
+        factor = UNIT_SCALE[self.unit] / UNIT_SCALE[unit]
+        return TimeEstimate(
+            self.mark_time, self.jump_time, self.delay_time,
+            self.mark_length * factor, self.jump_length * factor, self.marks, self.jumps, unit
+        )
+
+    def summary(self) -> str:
+        return '\n'.join([
+            f'预计耗时{format_duration(self.total)}',
+            f'标刻：{self.marks}段，{self.mark_length:.3f}{self.unit}，{self.mark_time:.3f}秒',
+            f'跳转：{self.jumps}段，{self.jump_length:.3f}{self.unit}，{self.jump_time:.3f}秒',
+            f'延迟：{self.delay_time:.3f}秒',
+        ])
+
+
+def _move_times(length: np.ndarray, mark: np.ndarray, header: dict) -> np.ndarray:
+    '''
+    每一行运动所需的时间（秒）。速度的单位是Unit/s，与坐标的长度单位一致。
+    振镜每隔StepPeriod才更新一次位置，因此运动时间向上取整为StepPeriod的整数倍；StepPeriod不大于0时不取整。
+    '''
+    jump_speed = float(header['JumpSpeed'])
+    mark_speed = float(header['MarkSpeed'])
+    if jump_speed <= 0 or mark_speed <= 0:
+        raise ValueError('速度必须大于0')
+    move = length / np.where(mark, mark_speed, jump_speed)
+    step = float(header['StepPeriod']) * DELAY_SCALE
+    if step > 0:
+        # 去掉除法的舍入误差，恰好是整数个周期的运动不会多算一个周期
+        move = np.ceil(np.round(move / step, 9)) * step
+    return move
+
+
+def estimate_time(toolpath: Toolpath, header: dict = None) -> TimeEstimate:
+    '''
+    按文件头中的速度、延迟和StepPeriod估算加工时间，与回放使用同样的计时（见movement_times）。
+    header默认为toolpath.header，缺少的参数取DEFAULT_HEADER中的值；
+    速度的单位是Unit/s，与坐标的长度单位一致，因此毫米和英寸都可以直接计算。
+    每一行的运动时间向上取整为StepPeriod的整数倍。每次跳转后等待JumpDelay；
+    每段连续标刻开始时等待LaserOnDelay，结束时等待MarkDelay和LaserOffDelay。
+    '''
+    header = {**DEFAULT_HEADER, **(toolpath.header if header is None else header)}
+    x0, y0, x1, y1, action = toolpath.segments()
+    length = np.hypot(x1 - x0, y1 - y0)
+    mark = action == MARK
+    move = _move_times(length, mark, header)
+    mark_length = float(length[mark].sum())
+    jump_length = float(length.sum()) - mark_length
+    marks = int(mark.sum())
+    jumps = len(toolpath) - marks
+    # 开始时激光是关闭的，每段连续标刻的开头和结尾各是一次开关光
+    runs = int(np.count_nonzero(mark[1:] & ~mark[:-1])) + int(mark[:1].sum())
+    delay = (
+        jumps * float(header['JumpDelay'])
+        + runs * (float(header['LaserOnDelay']) + float(header['MarkDelay']) + float(header['LaserOffDelay']))
+    ) * DELAY_SCALE
+    return TimeEstimate(
+        float(move[mark].sum()), float(move[~mark].sum()), delay,
+        mark_length, jump_length, marks, jumps, header.get('Unit', 'mm')
+    )
+
+
+def movement_times(toolpath: Toolpath, header: dict = None) -> tuple:
+    '''
+    按与estimate_time相同的速度、延迟和StepPeriod计算每一行运动的开始和结束时刻（秒），返回(start, end, total)。
+    延迟位于上一行的end与这一行的start之间；total是包括最后的延迟在内的总时间，与估算的总耗时相同。
+    '''
+    header = {**DEFAULT_HEADER, **(toolpath.header if header is None else header)}
+    x0, y0, x1, y1, action = toolpath.segments()
+    mark = action == MARK
+    move = _move_times(np.hypot(x1 - x0, y1 - y0), mark, header)
+    # 每段连续标刻的第一行之前开光，最后一行之后等待MarkDelay并关光；每次跳转之后等待JumpDelay
+    previous = np.concatenate(([False], mark[:-1]))
+    following = np.concatenate((mark[1:], [False]))
+    before = np.where(mark & ~previous, float(header['LaserOnDelay']) * DELAY_SCALE, 0.0)
+    after = np.where(
+        mark,
+        np.where(following, 0.0, (float(header['MarkDelay']) + float(header['LaserOffDelay'])) * DELAY_SCALE),
+        float(header['JumpDelay']) * DELAY_SCALE
+    )
+    elapsed = np.cumsum(before + move + after)
+    end = elapsed - after
+    return end - move, end, float(elapsed[-1]) if len(elapsed) else 0.0
+
+
+# 每次从文件中读取的字节数
+BLOCK_SIZE = 1 << 22
+
+
+def iter_blocks(filepath: str, block_size=BLOCK_SIZE):
+    '''
+    分块读取文本文件，每次产生(首行行号, 文本块, 已读取字节数)。
+    文本块总是由完整的行组成，且不包含最后一行的换行符。
+    '''
+    lineno = 1
+    bytes_read = 0
+    rest = b''
+    with open(filepath, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            if bytes_read == 0 and block.startswith(b'\xef\xbb\xbf'):
+                block = block[3:]
+            bytes_read += len(block)
+            block = rest + block
+            cut = block.rfind(b'\n')
+            if cut < 0:
+                rest = block
+                continue
+            rest = block[cut+1:]
+            text = block[:cut].decode('utf-8', errors='replace')
+            yield lineno, text, bytes_read
+            lineno += text.count('\n') + 1
+    if rest:
+        yield lineno, rest.decode('utf-8', errors='replace'), bytes_read
+
+
+# 运动指令及其对应的动作编码
+MOVE_COMMANDS = {'jump_abs': JUMP, 'mark_abs': MARK}
+
+
+def _bulk_moves(text: str):
+    '''
+    尝试将一整块文本作为纯运动指令批量解析。
+    只有每一行都是格式正确的运动指令时才返回(x, y, action)数组，否则返回None。
+    '''
+    tokens = text.split()
+    line_count = text.count('\n') + 1
+    if len(tokens) != 3 * line_count:
+        return None
+    # 每一行都必须以运动指令开头，否则各行的列数可能互相抵消
+    line_starts = text.startswith(tuple(MOVE_COMMANDS))
+    line_starts += sum(text.count('\n' + command) for command in MOVE_COMMANDS)
+    if line_starts != line_count:
+        return None
+    commands = tokens[0::3]
+    if not set(commands) <= MOVE_COMMANDS.keys():
+        return None
+    try:
+        x = np.array(tokens[1::3], dtype=np.float64)
+        y = np.array(tokens[2::3], dtype=np.float64)
+    except ValueError:
+        return None
+    # 两种运动指令都是8个字符，拼接后每隔8个字符取首字母即可区分
+    initials = np.frombuffer(''.join(commands).encode('ascii'), dtype=np.uint8)[::8]
+    action = (initials == ord('m')).astype(np.uint8)
+    return x, y, action
+
+
+class _DbdState:
+    '''
+    .dbd文件解析过程中的状态：所处的段落和已解析的文件头。
+    '''
+    BEFORE_LIST, IN_LIST, AFTER_LIST = range(3)
+
+    def __init__(self):
+        self.section = self.BEFORE_LIST
+        self.header = {}
+
+
+def _parse_dbd_lines(lineno: int, text: str, state: _DbdState, report: ParseReport):
+    '''
+    逐行解析一块文本，返回其中运动指令的(x, y, action)数组。
+    '''
+    xs, ys, actions = [], [], []
+    for lineno, line in enumerate(text.split('\n'), lineno):
+        parts = line.split()
+        if not parts:
+            continue
+        key = parts[0]
+        if key in MOVE_COMMANDS:
+            if state.section == state.BEFORE_LIST:
+                report.reject(lineno, '运动指令位于Start_List之前', line)
+                continue
+            if state.section == state.AFTER_LIST:
+                report.reject(lineno, '运动指令位于End_List之后', line)
+                continue
+            if len(parts) != 3:
+                report.reject(lineno, '运动指令应包含x、y两个坐标', line)
+                continue
+            try:
+                x, y = float(parts[1]), float(parts[2])
+            except ValueError:
+                report.reject(lineno, '坐标不是数字', line)
+                continue
+            xs.append(x)
+            ys.append(y)
+            actions.append(MOVE_COMMANDS[key])
+        elif key == 'Start_List':
+            if state.section != state.BEFORE_LIST:
+                report.reject(lineno, '重复的Start_List', line)
+            else:
+                state.section = state.IN_LIST
+        elif key == 'End_List':
+            if state.section != state.IN_LIST:
+                report.reject(lineno, '多余的End_List', line)
+            else:
+                state.section = state.AFTER_LIST
+        elif key.startswith('File:'):
+            state.header['File'] = splitext(line.strip()[5:].strip())[0]
+        elif key.startswith('Unit:'):
+            state.header['Unit'] = line.strip()[5:].strip()
+        elif key in HEADER_KEYS:
+            if len(parts) != 2 or not str_is_float(parts[1]):
+                report.reject(lineno, f'{key}的参数有误', line)
+            else:
+                state.header[key] = parts[1]
+        else:
+            report.reject(lineno, '无法识别的指令', line)
+    return (
+        np.array(xs, dtype=np.float64),
+        np.array(ys, dtype=np.float64),
+        np.array(actions, dtype=np.uint8)
+    )
+
+
+def _find_line(text: str, keyword: str) -> int:
+    '''
+    返回text中第一个以keyword开头的行的起始位置，找不到时返回-1。
+    '''
+    pos = text.find(keyword)
+    while pos > 0 and text[pos-1] != '\n':
+        pos = text.find(keyword, pos + 1)
+    return pos
+
+
+def _parse_dbd_block(lineno: int, text: str, state: _DbdState, report: ParseReport):
+    '''
+    解析一块文本，返回其中运动指令的(x, y, action)数组。
+    Start_List与End_List之间的部分尽量批量解析，其余部分逐行解析。
+    '''
+    parts = []
+    if state.section == state.BEFORE_LIST:
+        pos = _find_line(text, 'Start_List')
+        end = text.find('\n', pos) if pos >= 0 else -1
+        if end < 0:
+            return _parse_dbd_lines(lineno, text, state, report)
+        parts.append(_parse_dbd_lines(lineno, text[:end], state, report))
+        lineno += text.count('\n', 0, end) + 1
+        text = text[end+1:]
+    if state.section == state.IN_LIST:
+        pos = _find_line(text, 'End_List')
+        body = text if pos < 0 else text[:max(pos-1, 0)]
+        # 列表开头的参数行逐行解析
+        starts = [_find_line(body, command) for command in MOVE_COMMANDS]
+        first = min((start for start in starts if start >= 0), default=0)
+        if first > 0:
+            parts.append(_parse_dbd_lines(lineno, body[:first-1], state, report))
+            lineno += body.count('\n', 0, first)
+            pos -= first
+            text = text[first:]
+            body = body[first:]
+        moves = _bulk_moves(body)
+        if moves is None:
+            moves = _parse_dbd_lines(lineno, body, state, report)
+        parts.append(moves)
+        if pos < 0:
+            text = ''
+        else:
+            lineno += text.count('\n', 0, pos)
+            text = text[pos:]
+    if text:
+        parts.append(_parse_dbd_lines(lineno, text, state, report))
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def iter_dbd(filepath: str, report: ParseReport = None, block_size=BLOCK_SIZE):
+    '''
+    分块解析.dbd文件，每解析完一块产生(Toolpath, 已读取字节数)。
+    各块的header是同一个字典，随着解析的进行逐步补全。
+    不能解析的行记录在report中。
+    '''
+    if report is None:
+        report = ParseReport()
+    state = _DbdState()
+    lineno = 1
+    for lineno, text, bytes_read in iter_blocks(filepath, block_size):
+        chunk = Toolpath(*_parse_dbd_block(lineno, text, state, report))
+        chunk.header = state.header
+        yield chunk, bytes_read
+        lineno += text.count('\n') + 1
+    if state.section == state.BEFORE_LIST:
+        report.reject(lineno, '缺少Start_List')
+    elif state.section == state.IN_LIST:
+        report.reject(lineno, '缺少End_List')
+
+
+def read_dbd(filepath: str, report: ParseReport = None) -> Toolpath:
     """
-    读取.dbd文件，返回一个字典。
-    字典中的数据都是用字符串形式存储的。
+    读取.dbd文件，返回一个Toolpath。
+    文件头中的参数以字符串形式保存在Toolpath.header中，不能解析的行记录在report中。
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        lines = []
-        for line in f:
-            if line.strip():
-                lines.append(line.strip())
-    result = {}
-    movements = []
-    for line in lines:
-        if line.startswith('File:'):
-            result['File'] = splitext(line[5:].strip())[0]
-        elif line.startswith('Unit:'):
-            result['Unit'] = line[5:].strip()
-        elif line.startswith('LaserOnDelay'):
-            result['LaserOnDelay'] = line[12:].strip()
-        elif line.startswith('LaserOffDelay'):
-            result['LaserOffDelay'] = line[13:].strip()
-        elif line.startswith('JumpSpeed'):
-            result['JumpSpeed'] = line[10:].strip()
-        elif line.startswith('MarkSpeed'):
-            result['MarkSpeed'] = line[10:].strip()
-        elif line.startswith('JumpDelay'):
-            result['JumpDelay'] = line[10:].strip()
-        elif line.startswith('MarkDelay'):
-            result['MarkDelay'] = line[10:].strip()
-        elif line.startswith('StepPeriod'):
-            result['StepPeriod'] = line[11:].strip()
-        elif line.startswith('jump_abs') or line.startswith('mark_abs'):
-            action, x, y = line.split(' ')
-            action = action[:4]
-            movements.append((x.strip(), y.strip(), action.strip()))
-            
-    result['Movements'] = movements
-    return result
+    chunks = []
+    header = {}
+    for chunk, _ in iter_dbd(filepath, report):
+        chunks.append(chunk)
+        header = chunk.header
+    return Toolpath.concatenate(chunks, header)
+
+
+class Cancelled(Exception):
+    '''
+    由进度回调抛出，表示用户取消了操作。
+    '''
+
+
+# 写文件时每次格式化的行数
+WRITE_ROWS = 1 << 16
+# 坐标默认保留的小数位数
+PRECISION = 6
+
+
+def _format_rows(toolpath: Toolpath, template: str, columns, progress=None):
+    '''
+    按WRITE_ROWS行一块格式化坐标序列，逐块返回文本。
+    template是一行的%格式，columns是按顺序填入的'x'、'y'、'action'。
+    progress(已写行数, 总行数)在每块之后调用，可以抛出Cancelled以中止写入。
+    '''
+    total = len(toolpath)
+    names = np.array(ACTIONS, dtype=object)
+    for start in range(0, total, WRITE_ROWS):
+        end = min(start + WRITE_ROWS, total)
+        values = {
+            'x': toolpath.x[start:end],
+            'y': toolpath.y[start:end],
+            'action': names[toolpath.action[start:end]],
+        }
+        # 整块交错成一个元组，由%一次格式化完成
+        table = np.empty((end - start, len(columns)), dtype=object)
+        for i, column in enumerate(columns):
+            table[:, i] = values[column]
+        yield (template * (end - start)) % tuple(table.ravel())
+        if progress is not None:
+            progress(end, total)
+
+
+def _atomic_write(filepath: str, chunks):
+    '''
+    将文本块写入同一目录下的临时文件，全部写完后再替换filepath，
+    中途出错或被取消时删除临时文件，原有的文件保持不变。
+    '''
+    filepath = os.path.abspath(filepath)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(filepath), prefix=f'.{basename(filepath)}.', suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n', buffering=1 << 20) as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp创建的文件只有所有者可读写，沿用原文件的权限
+        mode = os.stat(filepath).st_mode if os.path.exists(filepath) else 0o644
+        os.chmod(tmp_path, mode & 0o7777)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_dbd(filepath: str, toolpath: Toolpath, precision=PRECISION, progress=None):
+    '''
+    将Toolpath写入.dbd文件，文件头中的参数取自toolpath.header。
+    坐标保留precision位小数，progress的用法见_format_rows。
+    '''
+    header = toolpath.header
+
+    def chunks():
+        yield f'File: {basename(filepath)}\n'
+        yield f'Unit: {header.get("Unit", "mm")}\n'
+        yield 'Start_List\n'
+        for key in HEADER_KEYS:
+            yield f'{key} {header[key]}\n'
+        yield from _format_rows(
+            toolpath, f'%s_abs %.{precision}f %.{precision}f\n', ('action', 'x', 'y'), progress
+        )
+        yield 'End_List\n'
+
+    _atomic_write(filepath, chunks())
 
 
 def str_is_float(s: str) -> bool:
@@ -49,30 +729,146 @@ def str_is_float(s: str) -> bool:
         return False
 
 
-def is_valid_csv_line(line: str) -> bool:
-    """
-    检查一行数据是否有效。
-    有效的行应该包含三个部分：x坐标、y坐标和动作，它们用逗号分隔。
-    """
-    parts = line.strip().split(',')
-    if len(parts) != 3:
-        return False
-    x, y, action = parts
-    return str_is_float(x.strip()) and str_is_float(y.strip()) and action.strip() in ('mark', 'jump')
+# 导入.csv文件时可以自动识别的分隔符，' '表示任意空白
+CSV_DELIMITERS = (',', ';', '\t', ' ')
+
+
+def _split_csv_line(line: str, delimiter: str) -> list:
+    return line.split(None if delimiter == ' ' else delimiter)
+
 
+# 识别分隔符时最多查看的非空行数
+SNIFF_LINES = 20
 
-def read_csv(filepath: str) -> list:
+
+def sniff_delimiter(lines: list) -> str:
+    '''
+    根据开头的若干个非空行猜测分隔符，返回能把最多的行恰好分成3列的分隔符，
+    个别行格式有误时也能识别。所有分隔符都不能分出3列时返回','。
+    '''
+    lines = [line for line in lines if line.strip()][:SNIFF_LINES]
+    best, best_count = ',', 0
+    for delimiter in CSV_DELIMITERS:
+        count = sum(len(_split_csv_line(line, delimiter)) == 3 for line in lines)
+        if count > best_count:
+            best, best_count = delimiter, count
+    return best
+
+
+def _bulk_csv(text: str, delimiter: str):
+    '''
+    尝试将一整块文本批量解析为.csv数据，整块只分割一次。
+    只有每一行都有效时才返回(x, y, action)数组，否则返回None。
+    '''
+    if delimiter == ' ':
+        return None
+    # 在每个换行符之后插入分隔符，使换行符只能出现在每行最后一列的末尾
+    tokens = text.replace('\n', '\n' + delimiter).split(delimiter)
+    line_count = text.count('\n') + 1
+    if len(tokens) != 3 * line_count:
+        return None
+    actions = tokens[2::3]
+    if not all('\n' in action for action in actions[:-1]):
+        return None
+    if not set(actions[:-1]) <= {'jump\n', 'mark\n'} or actions[-1] not in ACTIONS:
+        actions = [action.strip() for action in actions]
+        if not set(actions) <= set(ACTIONS):
+            return None
+    try:
+        x = np.array(tokens[0::3], dtype=np.float64)
+        y = np.array(tokens[1::3], dtype=np.float64)
+    except ValueError:
+        return None
+    # 两种动作都是4个字符，去掉换行符后拼接，每隔4个字符取首字母即可区分
+    initials = np.frombuffer(''.join(actions).replace('\n', '').encode('ascii'), dtype=np.uint8)[::4]
+    action = (initials == ord('m')).astype(np.uint8)
+    return x, y, action
+
+
+def _parse_csv_lines(lineno: int, lines: list, delimiter: str, report: ParseReport):
+    '''
+    逐行解析一组.csv行，返回有效行的(x, y, action)数组，无效行记录在report中。
+    '''
+    xs, ys, actions = [], [], []
+    for lineno, line in enumerate(lines, lineno):
+        if not line.strip():
+            continue
+        row = _split_csv_line(line, delimiter)
+        if len(row) != 3:
+            report.reject(lineno, f'应有3列，实际有{len(row)}列', line)
+            continue
+        x, y, action = row
+        try:
+            x, y = float(x), float(y)
+        except ValueError:
+            report.reject(lineno, '坐标不是数字', line)
+            continue
+        action = action.strip()
+        if action not in ACTIONS:
+            report.reject(lineno, '动作不是jump或mark', line)
+            continue
+        xs.append(x)
+        ys.append(y)
+        actions.append(ACTIONS.index(action))
+    return (
+        np.array(xs, dtype=np.float64),
+        np.array(ys, dtype=np.float64),
+        np.array(actions, dtype=np.uint8)
+    )
+
+
+def iter_csv(filepath: str, report: ParseReport = None, delimiter: str = None,
+    header: bool = None, block_size=BLOCK_SIZE
+):
+    '''
+    分块解析.csv文件，每解析完一块产生(Toolpath, 已读取字节数)。
+    delimiter为None时根据开头的若干个非空行自动识别分隔符。
+    header为None时，若第一个非空行的第一列不是数字，则视为表头跳过。
+    不能解析的行记录在report中。
+    '''
+    if report is None:
+        report = ParseReport()
+    first_line_found = False
+    for lineno, text, bytes_read in iter_blocks(filepath, block_size):
+        if not first_line_found:
+            lines = text.split('\n')
+            first = next((i for i, line in enumerate(lines) if line.strip()), None)
+            if first is not None:
+                first_line_found = True
+                if delimiter is None:
+                    delimiter = sniff_delimiter(lines[first:first + SNIFF_LINES])
+                if header is None:
+                    header = not str_is_float(_split_csv_line(lines[first], delimiter)[0])
+                if header:
+                    lineno += first + 1
+                    text = '\n'.join(lines[first+1:])
+        moves = _bulk_csv(text, delimiter) if first_line_found and text else None
+        if moves is None:
+            moves = _parse_csv_lines(lineno, text.split('\n'), delimiter or ',', report)
+        yield Toolpath(*moves), bytes_read
+
+
+def read_csv(filepath: str, report: ParseReport = None, delimiter: str = None,
+    header: bool = None
+) -> Toolpath:
     """
-    读取.csv文件，返回一个列表。
-    列表的元素是元组，每个元组包含x、y坐标和动作。
+    读取.csv文件，返回一个Toolpath。
+    每一行包含x、y坐标和动作，文件头参数为空。不能解析的行记录在report中。
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        lines = []
-        for line in f:
-            if is_valid_csv_line(line):
-                x, y, action = line.strip().split(',')
-                lines.append((x.strip(), y.strip(), action.strip()))
-    return lines
+    return Toolpath.concatenate([chunk for chunk, _ in iter_csv(filepath, report, delimiter, header)])
+
+
+def write_csv(filepath: str, toolpath: Toolpath, precision=PRECISION, progress=None):
+    '''
+    将Toolpath中的坐标序列写入.csv文件，第一行是表头。
+    '''
+    def chunks():
+        yield 'x,y,action\n'
+        yield from _format_rows(
+            toolpath, f'%.{precision}f,%.{precision}f,%s\n', ('x', 'y', 'action'), progress
+        )
+
+    _atomic_write(filepath, chunks())
 
 
 def write_csv_example(filepath: str):